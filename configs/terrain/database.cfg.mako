@@ -17,11 +17,34 @@ shapefiles: 256/,128/,64/,32/,128/,64/,32/,16/,8/,4/,2/,1/,0.5/
 tablenames: dhm25_256m,dhm25_128m,dhm25_64m,dhm25_32m,bl_128m,bl_64m,bl_32m,bl_16m,bl_8m,bl_4m,bl_2m,bl_1m,bl_0_5m
 modelnames: dhm25_256m,dhm25_128m,dhm25_64m,dhm25_32m,bl_128m,bl_64m,bl_32m,bl_16m,bl_8m,bl_4m,bl_2m,bl_1m,bl_0_5m
 lakes: /home/geodata/lakes/lakes.shp
+# loader of the shapefiles: copy (COPY of hex EWKB, fastest)
+# or orm (bulk inserts of WKT through sqlalchemy)
+loader: copy
+# drop the indexes of the tables before populating them and build them
+# afterwards, one table per process (1: yes, 0: no)
+deferindexes: 1
+# memory of each index build
+maintenanceworkmem: 1GB
+# reorder the tables along their geometry index after the load (1: yes, 0: no)
+cluster: 0
+# split the shapefiles in work units of about this number of features,
+# the largest units are loaded first (0: one unit per shapefile)
+unitfeatures: 1000000
+# write the keys of the tiles intersected by the features of each table
+# after the load and query the tiles by key instead of bbox (1: yes, 0: no)
+tilekeys: 0
 
 # Paths must be absolute!
 [Reprojection]
 # Determine if you want to reproject the input file (1: yes, 0: no)
 reproject: 1
+# reprojection engine: inprocess (pyproj, streamed to the loader) or
+# geosuite (mono subprocess per shapefile, also the fallback of inprocess
+# for the frames it doesn't support)
+engine: inprocess
+# vertical grids of the altimetric frames, only used by the inprocess engine
+# when the altimetric frames differ, e.g. ln02=/geodata/grids/ln02.gtx
+heightgrids:
 # Determine if you want to keep the reprojected input file
 keepfiles: 0
 geosuiteCmd: /home/${username}/GeoSuiteCmdx64/GeoSuiteCmd.exe
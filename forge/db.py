@@ -9,8 +9,9 @@ import sys
 import ConfigParser
 import sqlalchemy
 import multiprocessing
+from osgeo import ogr
 from geoalchemy2 import WKTElement
-from sqlalchemy.sql import exists, select, text
+from sqlalchemy.sql import exists, select, text, func
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.pool import NullPool
@@ -18,14 +19,19 @@ from contextlib import contextmanager
 
 from forge.configs import tmsConfig
 import forge.lib.cartesian2d as c2d
-from forge.models import create_simplified_geom_table
+from forge.models import update_lakes_21781, update_simplified_geom_table, \
+    tileKeysLiteral
 from forge.lib.tiles import TerrainTiles
 from forge.lib.global_geodetic import GlobalGeodetic
 from forge.models.tables import modelsPyramid, Lakes
 from forge.lib.logs import getLogger
-from forge.lib.shapefile_utils import ShpToGDALFeatures
-from forge.lib.helpers import BulkInsert, timestamp, cleanup, transformCoordinate
+from forge.lib.shapefile_utils import ShpToGDALFeatures, trianglesToWKBs
+from forge.lib.helpers import BulkInsert, timestamp, cleanup, transformCoordinates
+from forge.lib.bulk_copy import CopyLoader, hexEWKB, tableIndexes, dropIndexes, \
+    createIndexes
 from forge.lib.poolmanager import PoolManager
+from forge.lib.scheduling import fidRanges, UnitTiming, WorkersReport
+from forge.lib.reprojection import Reprojector, reprojectTriangles, parseHeightGrids
 
 
 loggingConfig = ConfigParser.RawConfigParser()
@@ -40,6 +46,127 @@ class PopulateFeaturesArguments(object):
         self.__dict__.update(kwargs)
 
 
+class TableIndexesArguments(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def geometryIndexes(schema, table, indexes):
+    # The gist index of the geometry column is always expected
+    for name, definition in indexes:
+        if 'gist' in definition.lower() and 'the_geom' in definition:
+            return indexes
+    name = 'idx_%s_the_geom' % table
+    return indexes + [(name, 'CREATE INDEX %s ON %s.%s USING gist (the_geom)' % (
+        name, schema, table))]
+
+
+def buildTableIndexes(args):
+    """
+    Builds the (dropped) indexes of a table once loaded, then optionally clusters
+    the table on its geometry index and refreshes its statistics.
+    """
+    pid = os.getpid()
+    t0 = time.time()
+    engine = sqlalchemy.create_engine(args.engineURL)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SET maintenance_work_mem TO %s', (args.maintenanceWorkMem,))
+        cursor.close()
+        if args.build:
+            createIndexes(connection, args.indexes)
+            logger.info('[%s]: Indexes of %s.%s built in %.1fs' % (
+                pid, args.schema, args.table, time.time() - t0))
+        cursor = connection.cursor()
+        if args.cluster:
+            for name, definition in args.indexes:
+                if 'gist' in definition.lower():
+                    cursor.execute('CLUSTER %s.%s USING %s' % (
+                        args.schema, args.table, name))
+                    logger.info('[%s]: %s.%s clustered on %s' % (
+                        pid, args.schema, args.table, name))
+                    break
+        cursor.execute('ANALYZE %s.%s' % (args.schema, args.table))
+        connection.commit()
+        cursor.close()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise Exception(e)
+    finally:
+        connection.close()
+        engine.dispose()
+    logger.info('[%s]: Table %s.%s ready in %.1fs' % (
+        pid, args.schema, args.table, time.time() - t0))
+    return 0
+
+
+class SimplifyLakesArguments(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def simplifyLakes(args):
+    """
+    Updates the simplified lakes of a zoom level (only the changed lakes).
+    """
+    pid = os.getpid()
+    t0 = time.time()
+    engine = sqlalchemy.create_engine(args.engineURL)
+    session = scoped_session(sessionmaker(bind=engine))
+    try:
+        count = session.execute(
+            update_simplified_geom_table(args.tablename, args.tolerance)
+        ).scalar()
+        session.commit()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise Exception(e)
+    finally:
+        session.close_all()
+        engine.dispose()
+    duration = time.time() - t0
+    logger.info('[%s]: Commit table public.%s with %s meters tolerance '
+        '(%s lakes simplified in %.1fs)' % (
+            pid, args.tablename, args.tolerance, count, duration))
+    return (args.zoom, args.tablename, args.tolerance, count, duration)
+
+
+class TileKeysArguments(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def populateTileKeys(args):
+    """
+    Writes the tile keys of a zoom level for a range of ids of a table.
+    """
+    pid = os.getpid()
+    t0 = time.time()
+    engine = sqlalchemy.create_engine(args.engineURL)
+    session = scoped_session(sessionmaker(bind=engine))
+    try:
+        count = session.execute(tileKeysLiteral(args.schema, args.table), dict(
+            zoom=args.zoom, tileSize=180.0 / 2 ** args.zoom,
+            minId=args.idRange[0], maxId=args.idRange[1] - 1)).rowcount
+        session.commit()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise Exception(e)
+    finally:
+        session.close_all()
+        engine.dispose()
+    logger.info('[%s]: %s tile keys of zoom %s for the ids %s to %s of %s.%s' % (
+        pid, count, args.zoom, args.idRange[0], args.idRange[1] - 1,
+        args.schema, args.table))
+    name = '%s[%s:%s]@%s' % (
+        args.table, args.idRange[0], args.idRange[1], args.zoom)
+    return UnitTiming(pid, name, count, t0, time.time())
+
+
 def reprojectShp(shpFilePath, args):
     logger.info('Action reprojectShapefile(%s)' % shpFilePath)
     outDirectory = args.outDirectory
@@ -89,18 +216,58 @@ def reprojectShp(shpFilePath, args):
     return outFile
 
 
+def copyLoader(connection, model, columns):
+    # Bulk loader (COPY) of a model, ids are taken from its sequence
+    table = model.__table__
+    sequence = table.c.id.default
+    return CopyLoader(
+        connection, '%s.%s' % (table.schema, table.name), columns,
+        sequenceName='%s.%s' % (sequence.schema, sequence.name)
+    )
+
+
+def shpReprojector(args):
+    """
+    In process reprojection of the features, None if the geosuite
+    subprocess has to be used (engine or frames not supported).
+    """
+    if args.reprojectEngine != 'inprocess':
+        return None
+    try:
+        return Reprojector(args.fromPFrames, args.toPFrames,
+            args.fromAFrames, args.toAFrames, heightGrids=args.heightGrids)
+    except ValueError as e:
+        logger.warning('In process reprojection not possible (%s), '
+            'falling back to geosuite' % e)
+        return None
+
+
+def featuresCount(shpFile):
+    # Number of features of a shapefile (0 if it can't be read)
+    try:
+        return ShpToGDALFeatures(shpFile).getFeatureCount()
+    except (IOError, TypeError) as e:
+        logger.warning('Cannot count the features of %s: %s' % (shpFile, e))
+        return 0
+
+
 def populateFeatures(args):
     pid = os.getpid()
+    tstart = time.time()
     session = None
     shpFile = args.shpFile
+    fidRange = args.fidRange
     reproject = args.reproject
     keepfiles = args.keepfiles
 
+    reprojector = None
     if reproject:
-        try:
-            shpFile = reprojectShp(shpFile, args)
-        except Exception as e:
-            raise Exception(e)
+        reprojector = shpReprojector(args)
+        if reprojector is None:
+            try:
+                shpFile = reprojectShp(shpFile, args)
+            except Exception as e:
+                raise Exception(e)
 
     try:
         models = modelsPyramid.models
@@ -112,21 +279,47 @@ def populateFeatures(args):
             logger.error('[%s]: Shapefile %s does not exists' % (pid, shpFile))
             sys.exit(1)
 
-        count = 1
+        count = 0
+        t0 = time.time()
         shp = ShpToGDALFeatures(shpFile)
-        logger.info('[%s]: Processing %s' % (pid, shpFile))
-        bulk = BulkInsert(model, session, withAutoCommit=1000)
-        for feature in shp.getFeatures():
-            polygon = feature.GetGeometryRef()
-            # add shapefile path to dict
-            # self.shpFilePath
-            bulk.add(dict(
-                the_geom = WKTElement(polygon.ExportToWkt(), 4326),
-                shapefilepath=shpFile
-            ))
-            count += 1
-        bulk.commit()
-        logger.info('[%s]: Commit %s features for %s.' % (pid, count, shpFile))
+        logger.info('[%s]: Processing %s %s(%s loader)' % (pid, shpFile,
+            'features %s to %s ' % fidRange if fidRange else '', args.loader))
+        # The triangles are streamed by chunks of arrays
+        chunks = shp.getTriangles(fidRange=fidRange)
+        if reprojector is not None:
+            # Reprojected on the fly, one transformation per chunk
+            chunks = (reprojectTriangles(triangles, reprojector)
+                for triangles in chunks)
+        geometries = (wkb for triangles in chunks
+            for wkb in trianglesToWKBs(triangles))
+        if args.loader == 'copy':
+            connection = engine.raw_connection()
+            try:
+                bulk = copyLoader(connection, model, ['shapefilepath', 'the_geom'])
+                for wkb in geometries:
+                    bulk.add(dict(
+                        the_geom = hexEWKB(wkb, 4326),
+                        shapefilepath=shpFile
+                    ))
+                    count += 1
+                bulk.commit()
+            finally:
+                connection.close()
+        else:
+            bulk = BulkInsert(model, session, withAutoCommit=1000)
+            for wkb in geometries:
+                polygon = ogr.CreateGeometryFromWkb(wkb)
+                # add shapefile path to dict
+                # self.shpFilePath
+                bulk.add(dict(
+                    the_geom = WKTElement(polygon.ExportToWkt(), 4326),
+                    shapefilepath=shpFile
+                ))
+                count += 1
+            bulk.commit()
+        tend = time.time()
+        logger.info('[%s]: Commit %s features for %s (%.0f rows/sec).' % (
+            pid, count, shpFile, count / max(tend - t0, 1e-6)))
     except Exception as e:
         logger.error(e, exc_info=True)
         raise Exception(e)
@@ -135,13 +328,13 @@ def populateFeatures(args):
             session.close_all()
             engine.dispose()
 
-    if reproject:
+    if reproject and reprojector is None:
         # Discard file after reprojection if specified in config
         if not keepfiles:
             logger.info('[%s] Removing %s...' % (pid, shpFile))
             cleanup(shpFile)
 
-    return count
+    return UnitTiming(pid, args.unitName, count, tstart, time.time())
 
 
 class DB:
@@ -392,46 +585,206 @@ class DB:
         toAFrames    = self.config.get('Reprojection', 'toAFrames')
         logfile      = self.config.get('Reprojection', 'logfile')
         errorfile    = self.config.get('Reprojection', 'errorfile')
+        loader       = self.loader()
+        # inprocess (pyproj, geosuite as a fallback) or geosuite
+        reprojectEngine = self._getOption('Reprojection', 'engine', 'geosuite')
+        heightGrids  = parseHeightGrids(
+            self._getOption('Reprojection', 'heightgrids', ''))
 
         if not os.path.exists(outDirectory):
             raise OSError('%s does not exist' % outDirectory)
-        if not os.path.exists(geosuiteCmd):
+        if reprojectEngine != 'inprocess' and not os.path.exists(geosuiteCmd):
             raise OSError('%s does not exist' % geosuiteCmd)
 
         tstart = time.time()
         models = modelsPyramid.models
         featuresArgs = []
+        # Large files are split in ranges of features (FIDs), not possible when
+        # the files are reprojected as a whole by geosuite
+        unitFeatures = int(self._getOption('Data', 'unitfeatures', '0'))
+        if reproject == '1' and shpReprojector(PopulateFeaturesArguments(
+                reprojectEngine=reprojectEngine, fromPFrames=fromPFrames,
+                toPFrames=toPFrames, fromAFrames=fromAFrames, toAFrames=toAFrames,
+                heightGrids=heightGrids)) is None:
+            unitFeatures = 0
         for i in range(0, len(models)):
             model = models[i]
             for shp in model.__shapefiles__:
-
-                featuresArgs.append(PopulateFeaturesArguments(
-                    engineURL    = self.userEngine.url,
-                    modelIndex   = i,
-                    shpFile      = shp,
-                    reproject    = True if reproject == '1' else False,
-                    keepfiles    = True if keepfiles == '1' else False,
-                    outDirectory = outDirectory,
-                    geosuiteCmd  = geosuiteCmd,
-                    fromPFrames  = fromPFrames,
-                    toPFrames    = toPFrames,
-                    fromAFrames  = fromAFrames,
-                    toAFrames    = toAFrames,
-                    logfile      = logfile,
-                    errorfile    = errorfile
+                featureCount = featuresCount(shp)
+                ranges = fidRanges(featureCount, unitFeatures)
+                for fidRange in ranges:
+                    cost = fidRange[1] - fidRange[0]
+                    unitName = os.path.basename(shp)
+                    if len(ranges) == 1:
+                        fidRange = None
+                    else:
+                        unitName += '[%s:%s]' % fidRange
+                    featuresArgs.append(PopulateFeaturesArguments(
+                        engineURL    = self.userEngine.url,
+                        modelIndex   = i,
+                        shpFile      = shp,
+                        fidRange     = fidRange,
+                        cost         = cost,
+                        unitName     = unitName,
+                        reproject    = True if reproject == '1' else False,
+                        keepfiles    = True if keepfiles == '1' else False,
+                        outDirectory = outDirectory,
+                        geosuiteCmd  = geosuiteCmd,
+                        fromPFrames  = fromPFrames,
+                        toPFrames    = toPFrames,
+                        fromAFrames  = fromAFrames,
+                        toAFrames    = toAFrames,
+                        logfile      = logfile,
+                        errorfile    = errorfile,
+                        loader       = loader,
+                        reprojectEngine = reprojectEngine,
+                        heightGrids  = heightGrids
+                    ))
+
+        # Tables loaded, the indexes are dropped during the load if deferred
+        tables = []
+        for model in models:
+            if model.__shapefiles__ and model.__table__ not in tables:
+                tables.append(model.__table__)
+        deferIndexes = self.deferIndexes()
+        indexesArgs = []
+        connection = self.userEngine.raw_connection()
+        try:
+            for table in tables:
+                indexes = tableIndexes(connection, table.schema, table.name)
+                if deferIndexes:
+                    dropIndexes(connection, table.schema, indexes)
+                    indexes = geometryIndexes(table.schema, table.name, indexes)
+                indexesArgs.append(TableIndexesArguments(
+                    engineURL          = self.userEngine.url,
+                    schema             = table.schema,
+                    table              = table.name,
+                    indexes            = indexes,
+                    build              = deferIndexes,
+                    maintenanceWorkMem = self._getOption(
+                        'Data', 'maintenanceworkmem', '1GB'),
+                    cluster            = self._getOption('Data', 'cluster', '0') == '1'
                 ))
+        finally:
+            connection.close()
 
         cpuCount = multiprocessing.cpu_count()
-        numFiles = len(featuresArgs)
-        numProcs = cpuCount if numFiles >= cpuCount else numFiles
-        pm = PoolManager(logger=logger, numProcs=numProcs, factor=1)
+        numUnits = len(featuresArgs)
+        numProcs = cpuCount if numUnits >= cpuCount else numUnits
+        # Largest units first, the small ones fill the gaps at the end
+        featuresArgs.sort(key=lambda args: args.cost, reverse=True)
+        logger.info('%s work units of %s features' % (
+            numUnits, sum([args.cost for args in featuresArgs])))
+        pm = PoolManager(logger=logger, numProcs=numProcs, factor=1, store=True)
+
+        tunits = time.time()
+        try:
+            pm.process(featuresArgs, populateFeatures, 1)
 
-        pm.process(featuresArgs, populateFeatures, 1)
+            tload = time.time()
+            logger.info('All features have been loaded. It took %s' % str(
+                datetime.timedelta(seconds=tload - tstart)))
+            for line in WorkersReport(pm.results, tunits, tload).lines():
+                logger.info(line)
+        finally:
+            # Even if a unit failed, the deferred indexes were dropped.
+            # One table per process, maintenance_work_mem is used per process
+            numTables = len(indexesArgs)
+            if numTables > 0:
+                numProcs = cpuCount if numTables >= cpuCount else numTables
+                pm = PoolManager(logger=logger, numProcs=numProcs, factor=1)
+                pm.process(indexesArgs, buildTableIndexes, 1)
 
         tend = time.time()
         logger.info('All tables have been created. It took %s' % str(
             datetime.timedelta(seconds=tend - tstart)))
 
+    def _getOption(self, section, option, default):
+        if self.config.has_option(section, option):
+            return self.config.get(section, option)
+        return default
+
+    def tileKeys(self):
+        # Tiles queried by their keys (B-tree) instead of their bbox (GiST)
+        return self._getOption('Data', 'tilekeys', '0') == '1'
+
+    def populateTileKeys(self):
+        logger.info('Action: populateTileKeys()')
+        tstart = time.time()
+        models = modelsPyramid.models
+        # Zoom levels served by each table
+        zooms = {}
+        for zoom in range(modelsPyramid.tileMinZ, modelsPyramid.tileMaxZ + 1):
+            model = modelsPyramid.getModelByZoom(zoom)
+            if model is not None:
+                zooms.setdefault(model.__tablename__, []).append(zoom)
+
+        unitFeatures = int(self._getOption('Data', 'unitfeatures', '0'))
+        keysArgs = []
+        indexesArgs = []
+        with self.userSession() as session:
+            for model in models:
+                table = model.__table__
+                if table.name not in zooms:
+                    continue
+                tilesTable = model.tileKeysTable()
+                tilesTable.drop(self.userEngine, checkfirst=True)
+                tilesTable.create(self.userEngine)
+                minId, maxId = session.query(
+                    func.min(model.id), func.max(model.id)).one()
+                if minId is None:
+                    continue
+                for zoom in zooms[table.name]:
+                    for start, end in fidRanges(maxId - minId + 1, unitFeatures):
+                        keysArgs.append(TileKeysArguments(
+                            engineURL = self.userEngine.url,
+                            schema    = table.schema,
+                            table     = table.name,
+                            zoom      = zoom,
+                            idRange   = (minId + start, minId + end)
+                        ))
+                name = 'idx_%s_tile_key' % tilesTable.name
+                indexesArgs.append(TableIndexesArguments(
+                    engineURL          = self.userEngine.url,
+                    schema             = table.schema,
+                    table              = tilesTable.name,
+                    indexes            = [(name, 'CREATE INDEX %s ON %s.%s '
+                        '(tile_key, id)' % (name, table.schema, tilesTable.name))],
+                    build              = True,
+                    maintenanceWorkMem = self._getOption(
+                        'Data', 'maintenanceworkmem', '1GB'),
+                    cluster            = False
+                ))
+
+        cpuCount = multiprocessing.cpu_count()
+        if keysArgs:
+            # Highest zoom levels first, they have the most tile keys
+            keysArgs.sort(key=lambda args: args.zoom, reverse=True)
+            numProcs = min(cpuCount, len(keysArgs))
+            pm = PoolManager(logger=logger, numProcs=numProcs, factor=1, store=True)
+            tkeys = time.time()
+            pm.process(keysArgs, populateTileKeys, 1)
+            tend = time.time()
+            logger.info('%s tile keys written in %s' % (
+                sum([t.cost for t in pm.results]),
+                str(datetime.timedelta(seconds=tend - tkeys))))
+            for line in WorkersReport(pm.results, tkeys, tend).lines():
+                logger.info(line)
+        if indexesArgs:
+            numProcs = min(cpuCount, len(indexesArgs))
+            pm = PoolManager(logger=logger, numProcs=numProcs, factor=1)
+            pm.process(indexesArgs, buildTableIndexes, 1)
+        logger.info('All tile keys have been created. It took %s' % str(
+            datetime.timedelta(seconds=time.time() - tstart)))
+
+    def loader(self):
+        # copy: COPY of hex EWKB, orm: bulk inserts of WKT through the ORM
+        return self._getOption('Data', 'loader', 'orm')
+
+    def deferIndexes(self):
+        # Build the indexes after the load instead of updating them per row
+        return self._getOption('Data', 'deferindexes', '0') == '1'
+
     def populateLakes(self):
         self.setupDatabase()
         logger.info('Action: populateLakes()')
@@ -445,54 +798,84 @@ class DB:
                 sys.exit(1)
 
             count = 1
+            t0 = time.time()
             shp = ShpToGDALFeatures(shpFile)
             logger.info('Processing %s' % (shpFile))
-            bulk = BulkInsert(Lakes, session, withAutoCommit=1000)
-
-            for feature in shp.getFeatures():
-                polygon = feature.GetGeometryRef()
-                # Force 2D for lakes
-                polygon.FlattenTo2D()
-                # add shapefile path to dict
-                # self.shpFilePath
-                bulk.add(dict(
-                    the_geom = WKTElement(polygon.ExportToWkt(), 4326)
-                ))
-                count += 1
-            bulk.commit()
-            logger.info('Commit %s features for %s.' % (count, shpFile))
+            if self.loader() == 'copy':
+                connection = self.userEngine.raw_connection()
+                try:
+                    # The spatial index is built once all the lakes are loaded
+                    indexes = tableIndexes(connection, 'public', 'lakes')
+                    dropIndexes(connection, 'public', indexes)
+                    bulk = copyLoader(connection, Lakes, ['the_geom'])
+                    for feature in shp.getFeatures():
+                        polygon = feature.GetGeometryRef()
+                        # Force 2D for lakes
+                        polygon.FlattenTo2D()
+                        bulk.add(dict(
+                            the_geom = hexEWKB(polygon.ExportToWkb(), 4326)
+                        ))
+                        count += 1
+                    bulk.commit()
+                    createIndexes(connection, indexes)
+                finally:
+                    connection.close()
+            else:
+                bulk = BulkInsert(Lakes, session, withAutoCommit=1000)
+
+                for feature in shp.getFeatures():
+                    polygon = feature.GetGeometryRef()
+                    # Force 2D for lakes
+                    polygon.FlattenTo2D()
+                    # add shapefile path to dict
+                    # self.shpFilePath
+                    bulk.add(dict(
+                        the_geom = WKTElement(polygon.ExportToWkt(), 4326)
+                    ))
+                    count += 1
+                bulk.commit()
+            tend = time.time()
+            logger.info('Commit %s features for %s (%.0f rows/sec).' % (
+                count, shpFile, count / max(tend - t0, 1e-6)))
             # Once all features have been commited, start creating all
             # the simplified versions of the lakes
             logger.info('Simplifying lakes')
-            tiles = TerrainTiles(self.dbConfigFile, tmsConfig, time.time())
-            geodetic = GlobalGeodetic(True)
-            bounds = (tiles.minLon, tiles.minLat, tiles.maxLon, tiles.maxLat)
-            zooms = range(tiles.tileMinZ, tiles.tileMaxZ + 1)
-            for i in xrange(0, len(zooms)):
-                zoom = zooms[i]
-                tablename = 'lakes_%s' % zoom
-                tileMinX, tileMinY = geodetic.LonLatToTile(
-                    bounds[0], bounds[1], zoom
-                )
-                tileMaxX, tileMaxY = geodetic.LonLatToTile(
-                    bounds[2], bounds[3], zoom
-                )
-                tileBounds = geodetic.TileBounds(tileMinX, tileMinY, zoom)
-                pointA = transformCoordinate('POINT(%s %s)' % (
-                    tileBounds[0], tileBounds[1]), 4326, 21781
-                ).GetPoints()[0]
-                pointB = transformCoordinate('POINT(%s %s)' % (
-                    tileBounds[2], tileBounds[3]), 4326, 21781
-                ).GetPoints()[0]
-                length = c2d.distance(pointA, pointB)
-                pixelArea = pow(length, 2) / pow(256.0, 2)
-                pixelLength = math.sqrt(pixelArea)
-                session.execute(
-                    create_simplified_geom_table(tablename, pixelLength)
-                )
-                session.commit()
-                logger.info('Commit table public.%s with %s meters '
-                    'tolerance' % (tablename, pixelLength))
+            t0 = time.time()
+            changed = session.execute(update_lakes_21781()).scalar()
+            session.commit()
+            logger.info('%s lakes transformed to EPSG:21781 in %.1fs' % (
+                changed, time.time() - t0))
+
+        tiles = TerrainTiles(self.dbConfigFile, tmsConfig, time.time())
+        geodetic = GlobalGeodetic(True)
+        bounds = (tiles.minLon, tiles.minLat, tiles.maxLon, tiles.maxLat)
+        zooms = range(tiles.tileMinZ, tiles.tileMaxZ + 1)
+        lakesArgs = []
+        for zoom in zooms:
+            tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], zoom)
+            tileBounds = geodetic.TileBounds(tileMinX, tileMinY, zoom)
+            easts, norths, alts = transformCoordinates(
+                [tileBounds[0], tileBounds[2]], [tileBounds[1], tileBounds[3]],
+                None, 4326, 21781)
+            length = c2d.distance((easts[0], norths[0]), (easts[1], norths[1]))
+            pixelArea = pow(length, 2) / pow(256.0, 2)
+            lakesArgs.append(SimplifyLakesArguments(
+                engineURL = self.userEngine.url,
+                zoom      = zoom,
+                tablename = 'lakes_%s' % zoom,
+                tolerance = math.sqrt(pixelArea)
+            ))
+
+        # One zoom level per process and connection
+        t0 = time.time()
+        numProcs = min(multiprocessing.cpu_count(), len(lakesArgs))
+        pm = PoolManager(logger=logger, numProcs=numProcs, factor=1, store=True)
+        pm.process(lakesArgs, simplifyLakes, 1)
+        for zoom, tablename, tolerance, count, duration in sorted(pm.results):
+            logger.info('Zoom %s: %s lakes simplified in public.%s with %s meters '
+                'tolerance in %.1fs' % (zoom, count, tablename, tolerance, duration))
+        logger.info('Lakes simplified for %s zoom levels in %.1fs' % (
+            len(lakesArgs), time.time() - t0))
 
     def dropDatabase(self):
         logger.info('Action: dropDatabase()')
@@ -540,6 +923,8 @@ class DB:
         # Create missing tables in case new ones were added
         self.setupDatabase()
         self.populateTables()
+        if self.tileKeys():
+            self.populateTileKeys()
 
     def destroy(self):
         logger.info('Action: destroy()')
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import socket
+import struct
+import numpy as np
+
+from forge.lib.global_geodetic import GlobalGeodetic
+
+
+# One record per written tile: zoom, x, y
+_record = struct.Struct('<BII')
+
+
+class TileJournal:
+
+    """
+    Append only record of the tiles written by a process.
+    Each process writes its own file in the journal directory,
+    the records are flushed right away.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        self.filePath = os.path.join(directory, '%s-%s.journal' % (
+            socket.gethostname(), os.getpid()))
+        self._f = open(self.filePath, 'ab')
+
+    def add(self, x, y, z):
+        self._f.write(_record.pack(z, x, y))
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def readJournals(directory):
+    """
+    Yields the (x, y, z) records of all the journals of a directory.
+    A truncated last record (interrupted write) is ignored.
+    """
+    for filePath in sorted(glob.glob(os.path.join(directory, '*.journal'))):
+        with open(filePath, 'rb') as f:
+            data = f.read()
+        end = len(data) - len(data) % _record.size
+        for offset in xrange(0, end, _record.size):
+            z, x, y = _record.unpack_from(data, offset)
+            yield (x, y, z)
+
+
+# Index file: magic, version, number of zoom levels, then per zoom level
+# z, tileMinX, tileMinY, tileMaxX, tileMaxY, offset and size of its bitmap
+_magic = 'FAIX'
+_version = 1
+_fileHeader = struct.Struct('<4sBB')
+_zoomHeader = struct.Struct('<BIIIIQQ')
+
+
+def parseKey(keyName, basePath, template='{z}/{x}/{y}', gridOrigin='bottomLeft'):
+    """
+    Returns the (x, y, z) coordinates (bottom left origin) of a key name
+    or None if it doesn't match the template.
+    """
+    if not keyName.startswith(basePath):
+        return None
+    parts = keyName[len(basePath):].split('.')[0].split('/')
+    # e.g. {z}/{x}/{y} -> ['z', 'x', 'y']
+    pattern = [p.strip('{}') for p in template.split('/')]
+    if len(parts) != len(pattern) or not all([p.isdigit() for p in parts]):
+        return None
+    xyz = dict(zip(pattern, map(int, parts)))
+    if gridOrigin == 'topLeft':
+        geodetic = GlobalGeodetic(True)
+        xyz['y'] = geodetic.GetNumberOfYTilesAtZoom(xyz['z']) - xyz['y'] - 1
+    return (xyz['x'], xyz['y'], xyz['z'])
+
+
+class AvailabilityBitmap:
+
+    """
+    One bit per tile of the grid covering the bounds for each zoom level.
+    Rows are stored one after the other (from tileMinY to tileMaxY),
+    bit i of the zoom level is the bit i & 7 of the byte i >> 3.
+    An index saved to a file can be memory-mapped (see load).
+    """
+
+    def __init__(self, bounds=None, minZoom=None, maxZoom=None):
+        self.bounds = bounds
+        self.minZoom = minZoom
+        self.maxZoom = maxZoom
+        self.ranges = {}
+        self.bitmaps = {}
+        if bounds is None:
+            return
+        geodetic = GlobalGeodetic(True)
+        for z in range(minZoom, maxZoom + 1):
+            tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], z)
+            tileMaxX, tileMaxY = geodetic.LonLatToTile(bounds[2], bounds[3], z)
+            self.ranges[z] = (tileMinX, tileMinY, tileMaxX, tileMaxY)
+            self.bitmaps[z] = np.zeros(
+                (self._nbTiles(z) + 7) // 8, dtype=np.uint8)
+
+    def _nbTiles(self, z):
+        tileMinX, tileMinY, tileMaxX, tileMaxY = self.ranges[z]
+        return (tileMaxX - tileMinX + 1) * (tileMaxY - tileMinY + 1)
+
+    def _index(self, x, y, z):
+        tileMinX, tileMinY, tileMaxX, tileMaxY = self.ranges[z]
+        if x < tileMinX or x > tileMaxX or y < tileMinY or y > tileMaxY:
+            return None
+        return (y - tileMinY) * (tileMaxX - tileMinX + 1) + x - tileMinX
+
+    def add(self, x, y, z):
+        if z not in self.bitmaps:
+            return
+        i = self._index(x, y, z)
+        if i is not None:
+            self.bitmaps[z][i >> 3] |= 1 << (i & 7)
+
+    def contains(self, x, y, z):
+        if z not in self.bitmaps:
+            return False
+        i = self._index(x, y, z)
+        if i is None:
+            return False
+        return bool(self.bitmaps[z][i >> 3] & (1 << (i & 7)))
+
+    def bits(self, z, start=0, length=None):
+        # Boolean array of the tiles of a zoom level (numpy < 1.17 has no
+        # little endian unpackbits)
+        if length is None:
+            length = self._nbTiles(z) - start
+        data = self.bitmaps[z][start >> 3:((start + length + 7) >> 3)]
+        bits = np.unpackbits(data).reshape(-1, 8)[:, ::-1].ravel()
+        return bits[start & 7:(start & 7) + length].astype(bool)
+
+    def count(self, z):
+        return int(np.count_nonzero(self.bits(z)))
+
+    def tiles(self, z):
+        """
+        Yields the (x, y, z) coordinates of the available tiles, row by row.
+        """
+        tileMinX, tileMinY, tileMaxX, tileMaxY = self.ranges[z]
+        width = tileMaxX - tileMinX + 1
+        for i in np.flatnonzero(self.bits(z)):
+            yield (int(i % width) + tileMinX, int(i // width) + tileMinY, z)
+
+    def _rangesFromBits(self, row, tileMinX):
+        # Starts and ends of the runs of available tiles
+        edges = np.diff(np.concatenate(([0], row.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return [[int(s) + tileMinX, int(e) + tileMinX] for s, e in zip(starts, ends)]
+
+    # [[A, B],...,[G, H]] ranges of available x values for a given row
+    def rowRanges(self, z, y):
+        tileMinX, tileMinY, tileMaxX, tileMaxY = self.ranges[z]
+        width = tileMaxX - tileMinX + 1
+        start = (y - tileMinY) * width
+        return self._rangesFromBits(self.bits(z, start, width), tileMinX)
+
+    # {y: [[A, B],...]} for the rows with at least one tile
+    def zoomRanges(self, z):
+        tileMinX, tileMinY, tileMaxX, tileMaxY = self.ranges[z]
+        width = tileMaxX - tileMinX + 1
+        rows = self.bits(z).reshape(-1, width)
+        ranges = {}
+        for j in np.flatnonzero(rows.any(axis=1)):
+            ranges[int(j) + tileMinY] = self._rangesFromBits(rows[j], tileMinX)
+        return ranges
+
+    def updateMetadata(self, tMeta):
+        for z in range(self.minZoom, self.maxZoom + 1):
+            tMeta.setAvailableRanges(z, self.zoomRanges(z))
+        return tMeta
+
+    def _sameGrid(self, other, z):
+        return z in other.ranges and self.ranges[z] == other.ranges[z]
+
+    def merge(self, other):
+        """
+        Adds the tiles of another index (within the bounds of this one).
+        """
+        for z in sorted(self.bitmaps.keys()):
+            if z not in other.bitmaps:
+                continue
+            if self._sameGrid(other, z):
+                self.bitmaps[z] |= other.bitmaps[z]
+            else:
+                for (x, y, zoom) in other.tiles(z):
+                    self.add(x, y, zoom)
+        return self
+
+    def difference(self, other):
+        """
+        Yields the tiles of this index which are not in the other one.
+        """
+        for z in sorted(self.bitmaps.keys()):
+            if self._sameGrid(other, z):
+                diff = AvailabilityBitmap()
+                diff.ranges[z] = self.ranges[z]
+                diff.bitmaps[z] = self.bitmaps[z] & ~other.bitmaps[z]
+                for tile in diff.tiles(z):
+                    yield tile
+            else:
+                for (x, y, zoom) in self.tiles(z):
+                    if not other.contains(x, y, zoom):
+                        yield (x, y, zoom)
+
+    def save(self, filePath):
+        zooms = sorted(self.bitmaps.keys())
+        offset = _fileHeader.size + _zoomHeader.size * len(zooms)
+        with open(filePath, 'wb') as f:
+            f.write(_fileHeader.pack(_magic, _version, len(zooms)))
+            for z in zooms:
+                # Bitmaps are 8 bytes aligned
+                offset += -offset % 8
+                f.write(_zoomHeader.pack(
+                    *((z,) + self.ranges[z] + (offset, len(self.bitmaps[z])))))
+                offset += len(self.bitmaps[z])
+            for z in zooms:
+                f.write('\0' * (-f.tell() % 8))
+                f.write(self.bitmaps[z].tostring())
+
+    @classmethod
+    def load(cls, filePath, mmap=True, mode='r'):
+        """
+        Reads an index. With mmap, the bitmaps are memory-mapped
+        (mode r: read only, r+: changes are written to the file,
+        c: copy on write).
+        """
+        index = cls()
+        with open(filePath, 'rb') as f:
+            magic, version, nbZooms = _fileHeader.unpack(f.read(_fileHeader.size))
+            if magic != _magic or version != _version:
+                raise ValueError('%s is not an availability index' % filePath)
+            headers = [_zoomHeader.unpack(f.read(_zoomHeader.size))
+                for i in range(0, nbZooms)]
+            for (z, tileMinX, tileMinY, tileMaxX, tileMaxY, offset, size) in headers:
+                index.ranges[z] = (tileMinX, tileMinY, tileMaxX, tileMaxY)
+                if mmap:
+                    index.bitmaps[z] = np.memmap(
+                        filePath, dtype=np.uint8, mode=mode, offset=offset,
+                        shape=(size,))
+                else:
+                    f.seek(offset)
+                    index.bitmaps[z] = np.frombuffer(
+                        f.read(size), dtype=np.uint8).copy()
+        if index.ranges:
+            index.minZoom = min(index.ranges.keys())
+            index.maxZoom = max(index.ranges.keys())
+        return index
@@ -14,6 +14,9 @@ from forge.lib.helpers import timestamp
 from forge.configs import tmsConfig
 from forge.lib.logs import getLogger
 from forge.lib.poolmanager import PoolManager
+from forge.lib.manifest import isUnchanged
+from forge.lib.s3_partitions import gridPrefixes, discoverPartitions, \
+    partitionsOutsideGrid, processKeys
 
 logging.getLogger('boto').setLevel(logging.CRITICAL)
 
@@ -45,15 +48,25 @@ def getBucket():
     return bucket
 
 
+# Returns False if the upload was skipped because the content didn't change
 def writeToS3(b, path, content, origin, bucketBasePath,
-        contentType='application/octet-stream', contentEnc='gzip'):
+        contentType='application/octet-stream', contentEnc='gzip',
+        contentHash=None, manifest=None):
+    keyName = bucketBasePath + path
+    if contentHash is not None and isUnchanged(b, keyName, contentHash, manifest):
+        return False
     headers = {'Content-Type': contentType}
     k = Key(b)
-    k.key = bucketBasePath + path
+    k.key = keyName
     k.set_metadata('IWI_Origin', origin)
+    if contentHash is not None:
+        k.set_metadata('IWI_Hash', contentHash)
     headers['Content-Encoding'] = contentEnc
     headers['Access-Control-Allow-Origin'] = '*'
     k.set_contents_from_file(content, headers=headers)
+    if contentHash is not None and manifest is not None:
+        manifest.put(keyName, contentHash, k.size)
+    return True
 
 copycount = multiprocessing.Value('i', 0)
 
@@ -116,57 +129,109 @@ def copyKeys(fromPrefix, toPrefix, zooms):
      copycount.value))
 
 
+keycount = multiprocessing.Value('l', 0)
+errorcount = multiprocessing.Value('l', 0)
+
+
+def _increment(counter, n):
+    with counter.get_lock():
+        counter.value += n
+        return counter.value
+
+
+def _deleteBatch(bucket, names):
+    results = bucket.delete_keys(names, quiet=True)
+    if len(results.errors) > 0:
+        _increment(errorcount, len(results.errors))
+        for err in results.errors:
+            log.error('Could not delete %s: %s' % (err.key, err.message))
+    return len(names) - len(results.errors)
+
+
+def processPartition(args):
+    # Returns the number of keys of the partition and, when listing,
+    # their rows (printed by the parent process)
+    (prefix, shallow, action, t0) = args
+    try:
+        return processKeys(getBucket(), prefix, shallow, action, t0, keycount,
+            _deleteBatch, log)
+    except Exception as e:
+        log.error('Error while processing partition %s: %s' % (prefix, e),
+            exc_info=True)
+        raise Exception(e)
+
+
+def _printRows(result):
+    for row in result[1]:
+        print row
+
+
 class S3Keys:
 
-    def __init__(self, prefix, bucketBasePath):
-        self.bucket = getBucket()
+    def __init__(self, prefix, bucketBasePath, factor=4):
         self.counter = 0
+        self.bucketBasePath = bucketBasePath
         self.prefix = bucketBasePath
+        self.factor = factor
         if prefix is not None:
             self.prefix += prefix
         else:
             raise Exception('One must define a prefix')
-        self.keysList = self.bucket.list(prefix=self.prefix)
+        bounds = (
+            tmsConfig.getfloat('Extent', 'minLon'),
+            tmsConfig.getfloat('Extent', 'minLat'),
+            tmsConfig.getfloat('Extent', 'maxLon'),
+            tmsConfig.getfloat('Extent', 'maxLat')
+        )
+        zooms = range(
+            tmsConfig.getint('Zooms', 'tileMinZ'),
+            tmsConfig.getint('Zooms', 'tileMaxZ') + 1
+        )
+        # The partitions are the prefixes found in the bucket, the tiles
+        # grid of the configuration is only used to report the unexpected ones
+        self.partitions = discoverPartitions(getBucket(), prefix, bucketBasePath)
+        outside = partitionsOutsideGrid(
+            self.partitions, gridPrefixes(prefix, bucketBasePath, bounds, zooms))
+        if outside:
+            log.info('%s partitions outside of the configured extent and zoom '
+                'levels, e.g. %s' % (len(outside), outside[0]))
+
+    def _run(self, action):
+        t0 = time.time()
+        keycount.value = 0
+        errorcount.value = 0
+        # Listing is IO bound, use more processes than cpus
+        pm = PoolManager(log, factor=self.factor,
+            callback=_printRows if action == 'list' else None)
+        partitions = [(p, shallow, action, t0) for (p, shallow) in self.partitions]
+        pm.process(partitions, processPartition, 1)
+        tend = time.time()
+        self.counter = keycount.value
+        print '%s keys processed in %s over %s partitions (%.0f keys/sec)' % (
+            self.counter, str(datetime.timedelta(seconds=tend - t0)),
+            len(self.partitions), self.counter / max(tend - t0, 1e-6))
+        return self.counter
 
     def delete(self):
-        keysToDelete = []
         print 'Are you sure you want to delete all tiles ' \
             'starting with %s? (y/n)' % self.prefix
         answer = raw_input('> ')
         if answer.lower() != 'y':
             sys.exit(1)
         print 'Deleting keys for prefix %s...' % self.prefix
-        for key in self.keysList:
-            keysToDelete.append(key)
-            if len(keysToDelete) % 1000 == 0:
-                self._deleteKeysResults(self.bucket.delete_keys(keysToDelete))
-                keysToDelete = []
-        if len(keysToDelete) > 0:
-            self._deleteKeysResults(self.bucket.delete_keys(keysToDelete))
-        print '%s keys have been deleted' % self.counter
+        self._run('delete')
+        print '%s could not be deleted.' % errorcount.value
+        print '%s keys have been deleted' % (self.counter - errorcount.value)
 
     def listKeys(self):
         print 'Listing keys for prefix %s...' % self.prefix
-        for key in self.keysList:
-            print "{name}\t{size}\t{modified}".format(
-                name=key.name,
-                size=key.size,
-                modified=key.last_modified,
-            )
-            # So that one can interrput it from keyboard
-            time.sleep(.2)
+        self._run('list')
 
     def count(self):
         print 'Counting keys for prefix %s...' % self.prefix
-        nbKeys = len(list(self.keysList))
+        nbKeys = self._run('count')
         print '%s keys have been found for prefix %s' % (nbKeys, self.prefix)
 
-    def _deleteKeysResults(self, results):
-        nbDeleted = len(results.deleted)
-        print '%s could not be deleted.' % len(results.errors)
-        print '%s have been deleted.' % nbDeleted
-        self.counter += len(results.deleted)
-
 
 def _getSQSConn():
     try:
@@ -183,7 +248,11 @@ def getSQS():
     return connSQS
 
 
-def writeSQSMessage(q, message):
+def writeSQSMessage(q, message, attempts=None):
     m = boto.sqs.message.Message()
     m.set_body(message)
+    if attempts is not None:
+        m.message_attributes = {
+            'attempts': {'data_type': 'Number', 'string_value': str(attempts)}
+        }
     q.write(m)
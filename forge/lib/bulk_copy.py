@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import time
+import struct
+import binascii
+from cStringIO import StringIO
+
+
+# EWKB flags of the geometry type
+wkbZ = 0x80000000
+wkbM = 0x40000000
+wkbSRID = 0x20000000
+
+
+def toEWKB(wkb, srid):
+    """
+    Adds the srid to a WKB geometry (OGR/PostGIS 2.5D or ISO flavour),
+    only the outer geometry carries it.
+    """
+    byteOrder = '<' if ord(wkb[0]) == 1 else '>'
+    geomType = struct.unpack(byteOrder + 'I', wkb[1:5])[0]
+    if geomType & wkbSRID:
+        return wkb
+    # ISO types: 1000 Z, 2000 M, 3000 ZM
+    isoFlags = {1: wkbZ, 2: wkbM, 3: wkbZ | wkbM}
+    baseType = geomType & 0x0fffffff
+    if baseType >= 1000:
+        geomType = (geomType & 0xf0000000) | isoFlags.get(baseType // 1000, 0) | \
+            (baseType % 1000)
+    return wkb[0] + struct.pack(byteOrder + 'II', geomType | wkbSRID, srid) + wkb[5:]
+
+
+def hexEWKB(wkb, srid):
+    # PostGIS parses hex encoded EWKB as input of the geometry type
+    return binascii.hexlify(toEWKB(wkb, srid)).upper()
+
+
+def copyValue(value):
+    # COPY text format
+    if value is None:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyLoader:
+
+    """
+    Streams rows into a table with COPY ... FROM STDIN.
+    Rows are buffered in memory up to bufferSize bytes, each flush is
+    committed. The primary keys are drawn from the sequence of the table
+    (one query per flush) as COPY doesn't evaluate the column defaults.
+    """
+
+    def __init__(self, connection, tableName, columns, sequenceName=None,
+            pkColumn='id', bufferSize=8 * 1024 * 1024):
+        self.connection = connection
+        self.tableName = tableName
+        self.columns = list(columns)
+        self.sequenceName = sequenceName
+        self.pkColumn = pkColumn
+        self.bufferSize = bufferSize
+        self.lines = []
+        self.size = 0
+        self.count = 0
+        self.t0 = time.time()
+
+    def add(self, row):
+        line = '\t'.join([copyValue(row.get(c)) for c in self.columns])
+        self.lines.append(line)
+        self.size += len(line) + 1
+        if self.size >= self.bufferSize:
+            self.flush()
+
+    def addN(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def _nextIds(self, cursor, n):
+        cursor.execute(
+            'SELECT nextval(%s) FROM generate_series(1, %s)',
+            (self.sequenceName, n))
+        return [r[0] for r in cursor.fetchall()]
+
+    def flush(self):
+        if not self.lines:
+            return
+        cursor = self.connection.cursor()
+        try:
+            columns = self.columns
+            data = StringIO()
+            if self.sequenceName is not None:
+                columns = [self.pkColumn] + columns
+                ids = self._nextIds(cursor, len(self.lines))
+                for pk, line in zip(ids, self.lines):
+                    data.write('%s\t%s\n' % (pk, line))
+            else:
+                for line in self.lines:
+                    data.write(line + '\n')
+            data.seek(0)
+            cursor.copy_expert('COPY %s (%s) FROM STDIN' % (
+                self.tableName, ', '.join(columns)), data)
+            self.connection.commit()
+        finally:
+            cursor.close()
+        self.count += len(self.lines)
+        self.lines = []
+        self.size = 0
+
+    def commit(self):
+        self.flush()
+
+    def rowsPerSecond(self):
+        return self.count / max(time.time() - self.t0, 1e-6)
+
+
+def tableIndexes(connection, schema, table, primaryKey=False):
+    """
+    Returns the (name, definition) of the indexes of a table.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            'SELECT c.relname, pg_get_indexdef(i.indexrelid) '
+            'FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'JOIN pg_class t ON t.oid = i.indrelid '
+            'JOIN pg_namespace n ON n.oid = t.relnamespace '
+            'WHERE n.nspname = %s AND t.relname = %s AND '
+            '(i.indisprimary = false OR %s)', (schema, table, primaryKey))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def dropIndexes(connection, schema, indexes):
+    cursor = connection.cursor()
+    try:
+        for name, definition in indexes:
+            cursor.execute('DROP INDEX IF EXISTS %s.%s' % (schema, name))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def createIndexes(connection, indexes):
+    cursor = connection.cursor()
+    try:
+        for name, definition in indexes:
+            cursor.execute(definition)
+        connection.commit()
+    finally:
+        cursor.close()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import time
+import httplib
+import urlparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+from forge.lib.global_geodetic import GlobalGeodetic
+
+
+def tileAddress(tileXYZ, gridOrigin):
+    # Account for a different origin
+    if gridOrigin == 'topLeft':
+        geodetic = GlobalGeodetic(True)
+        nbYTiles = geodetic.GetNumberOfYTilesAtZoom(tileXYZ[2])
+        tileXYZ = (tileXYZ[0], nbYTiles - tileXYZ[1] - 1, tileXYZ[2])
+    return '/'.join((str(tileXYZ[2]), str(tileXYZ[1]), str(tileXYZ[0])))
+
+
+class RateLimiter:
+
+    """
+    Token bucket shared by the threads of a process.
+    A rate of None (or 0) means no limit.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostConnections(threading.local):
+
+    """
+    Keep alive connections, one per host and per thread.
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.connections = {}
+
+    def get(self, scheme, netloc):
+        conn = self.connections.get((scheme, netloc))
+        if conn is None:
+            if scheme == 'https':
+                conn = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                conn = httplib.HTTPConnection(netloc, timeout=self.timeout)
+            self.connections[(scheme, netloc)] = conn
+        return conn
+
+    def reset(self, scheme, netloc):
+        conn = self.connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections = {}
+
+
+def resourceExists(url, headers={}, connections=None, retries=1):
+    """
+    HEAD request, returns True for a 200 and False for a 403 or a 404.
+    """
+    if connections is None:
+        connections = HostConnections()
+    parsed = urlparse.urlsplit(url)
+    path = parsed.path
+    if parsed.query:
+        path += '?' + parsed.query
+    for attempt in range(0, retries + 1):
+        conn = connections.get(parsed.scheme, parsed.netloc)
+        try:
+            conn.request('HEAD', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (httplib.HTTPException, IOError):
+            # The server may have closed the kept alive connection
+            connections.reset(parsed.scheme, parsed.netloc)
+            if attempt == retries:
+                raise
+            continue
+        if response.getheader('connection', '').lower() == 'close':
+            connections.reset(parsed.scheme, parsed.netloc)
+        if response.status == 200:
+            return True
+        elif response.status in (403, 404):
+            return False
+        raise Exception('Unexpected status %s for %s' % (response.status, url))
+
+
+class ExistenceChecker:
+
+    """
+    Checks the existence of tiles with concurrent HEAD requests.
+    A tile is always requested on the same host so that each thread
+    reuses one connection per host.
+    """
+
+    def __init__(self, tilesURLs, basePath, tFormat, gridOrigin,
+            headers={}, threads=16, rate=None, scheme='http'):
+        self.entryPoints = ['%s:%s' % (scheme, u) for u in tilesURLs]
+        self.basePath = basePath
+        self.tFormat = tFormat
+        self.gridOrigin = gridOrigin
+        self.headers = headers
+        self.threads = threads
+        self.limiter = RateLimiter(rate)
+        self.connections = HostConnections()
+        self.counter = 0
+        self.missing = 0
+
+    def url(self, tileXYZ):
+        entryPoint = self.entryPoints[
+            (tileXYZ[0] + tileXYZ[1]) % len(self.entryPoints)]
+        return '%s%s%s.%s' % (
+            entryPoint, self.basePath, tileAddress(tileXYZ, self.gridOrigin),
+            self.tFormat)
+
+    def _check(self, tileXYZ):
+        self.limiter.acquire()
+        exists = resourceExists(
+            self.url(tileXYZ), headers=self.headers, connections=self.connections)
+        return (tileXYZ, exists)
+
+    # Yields the coordinates of the missing tiles
+    def missingTiles(self, tilesXYZ, chunks=20):
+        pool = ThreadPool(self.threads)
+        try:
+            for tileXYZ, exists in pool.imap_unordered(
+                    self._check, tilesXYZ, chunksize=chunks):
+                self.counter += 1
+                if not exists:
+                    self.missing += 1
+                    yield tileXYZ
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def missingFromKeys(keyNames, basePath, tFormat, gridOrigin, tilesXYZ):
+    """
+    Same as ExistenceChecker.missingTiles but based on the names of the keys
+    listed in the bucket.
+    """
+    keyNames = set(keyNames)
+    for tileXYZ in tilesXYZ:
+        keyName = '%s%s.%s' % (basePath, tileAddress(tileXYZ, gridOrigin), tFormat)
+        if keyName not in keyNames:
+            yield tileXYZ
@@ -110,6 +110,10 @@ class GlobalGeodetic(object):
         b = self.TileBounds(tx, ty, zoom)
         return (b[1], b[0], b[3], b[2])
 
+    def TileKey(self, tx, ty, zoom):
+        "Returns a bigint identifying the given tile (zoom, row and column)"
+        return (zoom << 56) | (ty << 28) | tx
+
     def GetNumberOfXTilesAtZoom(self, zoom):
         "Returns the number of tiles over x at a given zoom level (only 256px)"
         return self._numberOfLevelZeroTilesX << zoom
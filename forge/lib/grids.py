@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from forge.lib.global_geodetic import GlobalGeodetic
+
+
+# Supported dispatch orders of the tiles of a zoom level
+ORDERINGS = ('column', 'morton', 'hilbert')
+
+# The morton and hilbert orders are sorted by blocks of 2^BLOCK_BITS tiles of side
+BLOCK_BITS = 8
+
+
+class ZoomGrid:
+
+    """
+    Tiles of the global geodetic grid covering bounds at a given zoom level.
+    The x and y axes are handled separately: a tile is fully inside the bounds
+    if its column and its row are, so that counts are arithmetic.
+    """
+
+    def __init__(self, bounds, zoom, fullonly=0, geodetic=None):
+        geodetic = geodetic or GlobalGeodetic(True)
+        self.zoom = zoom
+        self.bounds = bounds
+        # Same semantic as GlobalGeodetic.LonLatToTile
+        res = geodetic.resFact / 2 ** zoom
+        tileSize = float(geodetic.tileSize)
+        pixels = np.array([
+            (180 + bounds[0]) / res, (90 + bounds[1]) / res,
+            (180 + bounds[2]) / res, (90 + bounds[3]) / res
+        ])
+        tiles = np.where(
+            pixels > 0, np.ceil(pixels / tileSize) - 1, 0).astype(np.int64)
+        self.tileMinX, self.tileMinY, self.tileMaxX, self.tileMaxY = \
+            [int(t) for t in tiles]
+
+        # Same arithmetic as GlobalGeodetic.TileBounds
+        self.xs = np.arange(self.tileMinX, self.tileMaxX + 1, dtype=np.int64)
+        self.ys = np.arange(self.tileMinY, self.tileMaxY + 1, dtype=np.int64)
+        self.minLons = self.xs * geodetic.tileSize * res - 180
+        self.maxLons = (self.xs + 1) * geodetic.tileSize * res - 180
+        self.minLats = self.ys * geodetic.tileSize * res - 90
+        self.maxLats = (self.ys + 1) * geodetic.tileSize * res - 90
+        if fullonly:
+            # Same semantic as forge.lib.tiles.isInside
+            xMask = (self.minLons >= bounds[0]) & (self.maxLons <= bounds[2])
+            yMask = (self.minLats >= bounds[1]) & (self.maxLats <= bounds[3])
+            self.xs, self.minLons, self.maxLons = \
+                self.xs[xMask], self.minLons[xMask], self.maxLons[xMask]
+            self.ys, self.minLats, self.maxLats = \
+                self.ys[yMask], self.minLats[yMask], self.maxLats[yMask]
+
+    def count(self):
+        return len(self.xs) * len(self.ys)
+
+    def _blocks(self, ordering):
+        # Indices in xs and ys of the tiles in the requested order, yielded
+        # by aligned square blocks of tiles visited along the same curve:
+        # sorting within each block gives the order of the whole zoom level.
+        # Keys are computed relative to the first tile.
+        relX = self.xs - self.tileMinX
+        relY = self.ys - self.tileMinY
+        if ordering == 'morton':
+            bits = BLOCK_BITS
+
+            def keys(xs, ys):
+                return mortonKeys(xs, ys)
+
+            def blockKeys(bx, by):
+                return mortonKeys(bx, by)
+        elif ordering == 'hilbert':
+            side = max(self.tileMaxX - self.tileMinX, self.tileMaxY - self.tileMinY) + 1
+            order = int(np.ceil(np.log2(max(side, 2))))
+            bits = min(BLOCK_BITS, order)
+
+            def keys(xs, ys):
+                return hilbertKeys(xs, ys, order)
+
+            # All the tiles of an aligned block share the high bits of their keys
+            def blockKeys(bx, by):
+                return hilbertKeys(bx << bits, by << bits, order) >> (2 * bits)
+        else:
+            raise ValueError('Unknown tiles ordering %s' % ordering)
+        if len(relX) == 0 or len(relY) == 0:
+            return
+
+        nbBX = int(relX[-1] >> bits) + 1
+        nbBY = int(relY[-1] >> bits) + 1
+        bx = np.repeat(np.arange(nbBX, dtype=np.int64), nbBY)
+        by = np.tile(np.arange(nbBY, dtype=np.int64), nbBX)
+        for b in np.argsort(blockKeys(bx, by), kind='mergesort').tolist():
+            x0, x1 = np.searchsorted(relX, [bx[b] << bits, (bx[b] + 1) << bits])
+            y0, y1 = np.searchsorted(relY, [by[b] << bits, (by[b] + 1) << bits])
+            if x0 == x1 or y0 == y1:
+                continue
+            ix = np.repeat(np.arange(x0, x1, dtype=np.int64), y1 - y0)
+            iy = np.tile(np.arange(y0, y1, dtype=np.int64), x1 - x0)
+            inBlock = np.argsort(keys(relX[ix], relY[iy]), kind='mergesort')
+            yield ix[inBlock], iy[inBlock]
+
+    def tiles(self, ordering='column'):
+        """
+        Yields (bounds, (x, y, z)) like forge.lib.tiles.grid, by default
+        column by column (x outer, y inner).
+        """
+        xs, ys = self.xs.tolist(), self.ys.tolist()
+        minLons, maxLons = self.minLons.tolist(), self.maxLons.tolist()
+        minLats, maxLats = self.minLats.tolist(), self.maxLats.tolist()
+        if ordering == 'column':
+            for i in xrange(len(xs)):
+                for j in xrange(len(ys)):
+                    yield (
+                        (minLons[i], minLats[j], maxLons[i], maxLats[j]),
+                        (xs[i], ys[j], self.zoom)
+                    )
+            return
+        for ix, iy in self._blocks(ordering):
+            for i, j in zip(ix.tolist(), iy.tolist()):
+                yield (
+                    (minLons[i], minLats[j], maxLons[i], maxLats[j]),
+                    (xs[i], ys[j], self.zoom)
+                )
+
+
+def zoomGrids(bounds, zoomLevels, fullonly=0):
+    geodetic = GlobalGeodetic(True)
+    return [ZoomGrid(bounds, z, fullonly, geodetic) for z in zoomLevels]
+
+
+def tilesCount(bounds, zoomLevels, fullonly=0):
+    return sum([g.count() for g in zoomGrids(bounds, zoomLevels, fullonly)])
+
+
+def mortonKeys(xs, ys):
+    """
+    Z-order keys (interleaved bits, x first) of arrays of tile indices.
+    """
+    xs = np.asarray(xs, dtype=np.uint64)
+    ys = np.asarray(ys, dtype=np.uint64)
+    keys = np.zeros(xs.shape, dtype=np.uint64)
+    one = np.uint64(1)
+    for b in range(0, 32):
+        bit = np.uint64(b)
+        keys |= ((xs >> bit) & one) << np.uint64(2 * b)
+        keys |= ((ys >> bit) & one) << np.uint64(2 * b + 1)
+    return keys
+
+
+def hilbertKeys(xs, ys, order):
+    """
+    Distances along the Hilbert curve filling a square of 2^order tiles
+    of side for arrays of tile indices.
+    """
+    x = np.array(xs, dtype=np.int64)
+    y = np.array(ys, dtype=np.int64)
+    keys = np.zeros(x.shape, dtype=np.int64)
+    n = 1 << order
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return keys
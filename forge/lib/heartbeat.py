@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import math
+import time
+import threading
+
+# AWS SQS limits for the visibility timeout (in seconds)
+MIN_VISIBILITY_TIMEOUT = 30
+MAX_VISIBILITY_TIMEOUT = 43200
+# Minimal time without progress before a worker is considered as stalled
+STALL_TIMEOUT = 3600
+
+
+class DurationEstimator:
+
+    """
+    Keeps an exponential moving average of the time spent per tile
+    and derives a visibility timeout for a given number of tiles.
+    """
+
+    def __init__(self, initial=60.0, alpha=0.2, safety=2.0,
+            minTimeout=MIN_VISIBILITY_TIMEOUT, maxTimeout=MAX_VISIBILITY_TIMEOUT):
+        self.average = float(initial)
+        self.alpha = alpha
+        self.safety = safety
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.samples = 0
+
+    def add(self, duration):
+        if self.samples == 0:
+            self.average = float(duration)
+        else:
+            self.average = self.alpha * duration + \
+                (1.0 - self.alpha) * self.average
+        self.samples += 1
+
+    def timeout(self, nbTiles):
+        seconds = int(math.ceil(self.average * max(nbTiles, 1) * self.safety))
+        return min(max(seconds, self.minTimeout), self.maxTimeout)
+
+
+class VisibilityHeartbeat(threading.Thread):
+
+    """
+    Extends the visibility of a message while its batch is progressing.
+    :param extend: callable receiving the new visibility timeout in seconds
+    :param estimator: a DurationEstimator instance
+    :param nbTiles: number of tiles contained in the batch
+    :param timeout: visibility timeout the message was received with
+    :param stallTimeout: minimal time without progress before giving up
+    :param clock: returns the current time in seconds
+    The heartbeat gives up when no tile has been completed for longer than
+    the time estimated for all the remaining tiles (and at least stallTimeout),
+    so that a stalled worker lets the message become visible again for
+    other workers. Once the lease is lost (leaseLost) the message may be
+    processed by another worker and must not be deleted.
+    """
+
+    def __init__(self, extend, estimator, nbTiles, logger=None, timeout=None,
+            stallTimeout=STALL_TIMEOUT, clock=time.time):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.extend = extend
+        self.estimator = estimator
+        self.nbTiles = nbTiles
+        self.done = 0
+        self.logger = logger
+        self.beats = 0
+        self.stallTimeout = stallTimeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stopEvent = threading.Event()
+        self.lastProgress = clock()
+        if timeout is None:
+            timeout = self.currentTimeout()
+        self.leaseExpiry = self.lastProgress + timeout
+
+    def remaining(self):
+        with self._lock:
+            return self.nbTiles - self.done
+
+    def progress(self):
+        with self._lock:
+            self.done += 1
+            self.lastProgress = self.clock()
+
+    def currentTimeout(self):
+        return self.estimator.timeout(self.remaining())
+
+    def stalled(self):
+        with self._lock:
+            idle = self.clock() - self.lastProgress
+        # A single slow tile must not be taken for a stalled worker
+        return idle > max(self.currentTimeout(), self.stallTimeout)
+
+    def leaseLost(self):
+        return self.clock() >= self.leaseExpiry
+
+    def _interval(self, timeout):
+        # Beat well before the current lease expires
+        return max(timeout / 3.0, 1.0)
+
+    def beat(self):
+        """
+        Extends the visibility once, returns the new timeout
+        or None if the worker is stalled.
+        """
+        if self.stalled():
+            if self.logger:
+                self.logger.warning('No progress for %s tiles, releasing '
+                    'the heartbeat' % self.remaining())
+            return None
+        timeout = self.currentTimeout()
+        now = self.clock()
+        try:
+            self.extend(timeout)
+            self.beats += 1
+            self.leaseExpiry = now + timeout
+        except Exception as e:
+            if self.logger:
+                self.logger.error('Could not extend visibility timeout: '
+                    '%s' % e, exc_info=True)
+        return timeout
+
+    def run(self):
+        timeout = self.leaseExpiry - self.clock()
+        while not self._stopEvent.wait(self._interval(timeout)):
+            timeout = self.beat()
+            if timeout is None:
+                break
+
+    def stop(self):
+        self._stopEvent.set()
+        if self.is_alive():
+            self.join()
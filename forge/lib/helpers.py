@@ -4,9 +4,12 @@ from osgeo import osr, ogr
 import os
 import gzip
 import sys
+import zlib
+import struct
 import time
 import datetime
 import cStringIO
+import numpy as np
 from pyproj import Proj, transform
 
 
@@ -37,17 +40,85 @@ def createBBox(center, length):
     return [xmin, ymin, xmax, ymax]
 
 
+# Spatial references, OSR transformations and projections are
+# created once per process
+_spatialReferences = {}
+_transformations = {}
+_projs = {}
+_transformers = {}
+
+
+def getSpatialReference(srid):
+    if srid not in _spatialReferences:
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(srid)
+        _spatialReferences[srid] = srs
+    return _spatialReferences[srid]
+
+
+def getTransformation(srid_from, srid_to):
+    key = (srid_from, srid_to)
+    if key not in _transformations:
+        _transformations[key] = osr.CoordinateTransformation(
+            getSpatialReference(srid_from), getSpatialReference(srid_to))
+    return _transformations[key]
+
+
 def transformCoordinate(wkt, srid_from, srid_to):
-    srid_in = osr.SpatialReference()
-    srid_in.ImportFromEPSG(srid_from)
-    srid_out = osr.SpatialReference()
-    srid_out.ImportFromEPSG(srid_to)
     geom = ogr.CreateGeometryFromWkt(wkt)
-    geom.AssignSpatialReference(srid_in)
-    geom.TransformTo(srid_out)
+    geom.AssignSpatialReference(getSpatialReference(srid_from))
+    geom.Transform(getTransformation(srid_from, srid_to))
+    geom.AssignSpatialReference(getSpatialReference(srid_to))
     return geom
 
 
+def getProj(definition):
+    if definition not in _projs:
+        _projs[definition] = Proj(definition)
+    return _projs[definition]
+
+
+def epsgProj(srid):
+    if srid == 4326:
+        return getProj('+proj=longlat +datum=WGS84 +no_defs')
+    return getProj('+init=epsg:%s' % srid)
+
+
+class Transformer:
+
+    """
+    Transforms arrays of coordinates from an EPSG code to another.
+    """
+
+    def __init__(self, srid_from, srid_to):
+        self.fromProj = epsgProj(srid_from)
+        self.toProj = epsgProj(srid_to)
+
+    def transform(self, xs, ys, zs=None):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        if zs is None:
+            xs, ys = transform(self.fromProj, self.toProj, xs, ys)
+            return xs, ys, None
+        zs = np.asarray(zs, dtype=np.float64)
+        return transform(self.fromProj, self.toProj, xs, ys, zs)
+
+
+def getTransformer(srid_from, srid_to):
+    key = (srid_from, srid_to)
+    if key not in _transformers:
+        _transformers[key] = Transformer(srid_from, srid_to)
+    return _transformers[key]
+
+
+def transformCoordinates(xs, ys, zs, srid_from, srid_to):
+    """
+    Array version of transformCoordinate, returns the (xs, ys, zs) arrays
+    (zs can be None).
+    """
+    return getTransformer(srid_from, srid_to).transform(xs, ys, zs)
+
+
 def gzipFileContent(filePath):
     content = open(filePath)
     compressed = cStringIO.StringIO()
@@ -59,10 +130,66 @@ def gzipFileContent(filePath):
     return compressed
 
 
-def gzipFileObject(data):
+class GzipWriter:
+
+    """
+    Compresses on the fly into a file like object (gzip member).
+    The header uses a fixed mtime (0) and OS (255, unknown) so that identical
+    contents always lead to identical bytes (and ETags).
+    """
+
+    def __init__(self, fileObject, compresslevel=5):
+        self.fileObject = fileObject
+        if compresslevel == 9:
+            xfl = '\x02'
+        elif compresslevel == 1:
+            xfl = '\x04'
+        else:
+            xfl = '\x00'
+        self.fileObject.write(
+            '\x1f\x8b\x08\x00' + struct.pack('<I', 0) + xfl + '\xff')
+        # Negative window bits -> raw deflate stream, the gzip framing is ours
+        self._compressor = zlib.compressobj(
+            compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = zlib.crc32('')
+        self._size = 0
+
+    def write(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self.fileObject.write(self._compressor.compress(data))
+
+    # The underlying file object is left open
+    def close(self):
+        self.fileObject.write(self._compressor.flush())
+        self.fileObject.write(struct.pack('<II', self._crc & 0xffffffff,
+            self._size & 0xffffffff))
+
+
+def gzipCompress(data, compresslevel=5):
+    """
+    Returns the gzip member of data as a string.
+    """
+    compressed = cStringIO.StringIO()
+    gz = GzipWriter(compressed, compresslevel)
+    gz.write(data)
+    gz.close()
+    return compressed.getvalue()
+
+
+def gzipFileObject(data, compresslevel=5, chunkSize=1 << 16):
     compressed = cStringIO.StringIO()
-    gz = gzip.GzipFile(fileobj=compressed, mode='w', compresslevel=5)
-    gz.write(data.getvalue())
+    gz = GzipWriter(compressed, compresslevel)
+    if hasattr(data, 'read'):
+        # Stream from the file object rather than copying its buffer
+        if hasattr(data, 'seek'):
+            data.seek(0)
+        chunk = data.read(chunkSize)
+        while chunk:
+            gz.write(chunk)
+            chunk = data.read(chunkSize)
+    else:
+        gz.write(data)
     gz.close()
     compressed.seek(0)
     return compressed
@@ -85,7 +212,6 @@ def error(msg, exitCode=1, usage=None):
     sys.exit(exitCode)
 
 
-
 def cleanup(filePath, extensions=['.shp', '.shx', '.prj', '.dbf']):
     if os.path.isfile(filePath):
         dirName = os.path.dirname(filePath)
@@ -100,12 +226,11 @@ def cleanup(filePath, extensions=['.shp', '.shx', '.prj', '.dbf']):
 
 
 def degreesToMeters(arc):
-    projWGS84 = Proj(proj='latlong', datum='WGS84')
-    projLV03 = Proj(init='epsg:21781')
     chCenterWGS84 = [8.3, 46.85]
-    p1 = transform(projWGS84, projLV03, *chCenterWGS84)
-    p2 = transform(projWGS84, projLV03, chCenterWGS84[0] + arc, chCenterWGS84[1])
-    return p2[0] - p1[0]
+    easts, norths, alts = transformCoordinates(
+        [chCenterWGS84[0], chCenterWGS84[0] + arc],
+        [chCenterWGS84[1], chCenterWGS84[1]], None, 4326, 21781)
+    return easts[1] - easts[0]
 
 
 class Bulk:
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import math
+import numpy as np
 
 # Constants taken from http://cesiumjs.org/2013/04/25/Horizon-culling/
 radiusX = 6378137.0
@@ -30,6 +31,20 @@ def LLH2ECEF(lon, lat, alt):
 
     return [x, y, z]
 
+
+def LLH2ECEFArray(lons, lats, alts):
+    # Same as LLH2ECEF for arrays of coordinates, returns a (N, 3) array
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    n = wgs84_a / np.sqrt(1 - wgs84_e2 * (np.sin(lats) ** 2))
+
+    x = (n + alts) * np.cos(lats) * np.cos(lons)
+    y = (n + alts) * np.cos(lats) * np.sin(lons)
+    z = (n * (1 - wgs84_e2) + alts) * np.sin(lats)
+
+    return np.column_stack((x, y, z))
+
+
 # alt is in meters
 
 
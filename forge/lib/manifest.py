@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import hashlib
+
+
+def contentHash(data):
+    """
+    Returns the sha1 hex digest of a string or of a file like object
+    holding the uncompressed content of a tile.
+    """
+    if hasattr(data, 'getvalue'):
+        data = data.getvalue()
+    return hashlib.sha1(data).hexdigest()
+
+
+class TileManifest:
+
+    """
+    Local record of the content hashes of the keys written to the bucket.
+    It is stored in a sqlite file, so that several processes can share it.
+    Writes are commited every autoCommit puts.
+    """
+
+    def __init__(self, filePath, autoCommit=1):
+        self.filePath = filePath
+        self.autoCommit = autoCommit
+        self.pending = 0
+        self.conn = sqlite3.connect(filePath, timeout=60)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS manifest ('
+            'key TEXT PRIMARY KEY, hash TEXT NOT NULL, size INTEGER)'
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute(
+            'SELECT hash FROM manifest WHERE key = ?', (key,)
+        ).fetchone()
+        if row is not None:
+            return str(row[0])
+
+    def put(self, key, hash, size=None):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO manifest (key, hash, size) VALUES (?, ?, ?)',
+            (key, hash, size)
+        )
+        self.pending += 1
+        if self.pending >= self.autoCommit:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM manifest').fetchone()[0]
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def isUnchanged(b, keyName, contentHash, manifest=None):
+    """
+    Compares the hash of the content to write with the hash recorded
+    in the local manifest or, if unknown, in the metadata of the stored key.
+    """
+    if manifest is not None:
+        previous = manifest.get(keyName)
+        if previous is not None:
+            return previous == contentHash
+    # HEAD request, metadata names are returned lower cased
+    existing = b.get_key(keyName)
+    if existing is None:
+        return False
+    previous = existing.get_metadata('iwi_hash')
+    if previous is not None and manifest is not None:
+        manifest.put(keyName, previous, existing.size)
+    return previous == contentHash
@@ -8,10 +8,12 @@ import signal
 class PoolManager:
 
     def __init__(self, logger, numProcs=multiprocessing.cpu_count(),
-            factor=1, store=False):
+            factor=1, store=False, callback=None):
         self._numProcs = int(numProcs * factor)
         self.logger = logger
         self.store = store
+        # Called in the parent process with each result (instead of storing it)
+        self.callback = callback
         self.results = []
         self._pool = multiprocessing.Pool(self._numProcs, self._initProcess)
 
@@ -22,7 +24,10 @@ class PoolManager:
     def _writer(self, records):
         for r in records:
             if r:
-                self.results.append(r)
+                if self.callback is not None:
+                    self.callback(r)
+                else:
+                    self.results.append(r)
 
     # Assure that sub processes don't get keyborad interrupts
     def _initProcess(self):
@@ -36,10 +41,15 @@ class PoolManager:
 
     # Blocking call
     def process(self, iterable, func, chunks):
-        if self.store:
-            self._writer(self._pool.imap_unordered(
-                func, iterable, chunksize=chunks
-            ))
+        if self.store or self.callback is not None:
+            try:
+                self._writer(self._pool.imap_unordered(
+                    func, iterable, chunksize=chunks
+                ))
+            except Exception:
+                # A worker failed, its exception is raised by the results
+                self._abort()
+                raise
         else:
             self._pool.imap_unordered(func, iterable, chunks)
         self._pool.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from pyproj import transform
+
+from forge.lib.helpers import getProj
+
+
+# Planimetric frames (geosuite names)
+PFRAMES = {
+    'lv03': '+init=epsg:21781',
+    'lv95': '+init=epsg:2056',
+    'wgs84': '+proj=longlat +datum=WGS84 +no_defs',
+    'wgs84-ed': '+proj=longlat +datum=WGS84 +no_defs'
+}
+
+
+def parseHeightGrids(value):
+    # e.g. ln02=/geodata/grids/ln02.gtx,lhn95=/geodata/grids/lhn95.gtx
+    grids = {}
+    for item in value.split(','):
+        if '=' in item:
+            frame, path = item.split('=', 1)
+            grids[frame.strip()] = path.strip()
+    return grids
+
+
+class Reprojector:
+
+    """
+    Transforms coordinates arrays from a pair of geosuite frames to another.
+    Heights are left untouched when the altimetric frames are the same,
+    otherwise they go through the vertical grids of the frames
+    (the frames without grid are ellipsoidal heights).
+    Raises a ValueError for unsupported frames.
+    """
+
+    def __init__(self, fromPFrame, toPFrame, fromAFrame, toAFrame, heightGrids={}):
+        for frame in (fromPFrame, toPFrame):
+            if frame not in PFRAMES:
+                raise ValueError('Unsupported planimetric frame %s' % frame)
+        self.withHeights = fromAFrame != toAFrame
+        fromDef = PFRAMES[fromPFrame]
+        toDef = PFRAMES[toPFrame]
+        if self.withHeights:
+            fromDef += self._geoidGrids(fromAFrame, heightGrids)
+            toDef += self._geoidGrids(toAFrame, heightGrids)
+        self.fromProj = getProj(fromDef)
+        self.toProj = getProj(toDef)
+
+    def _geoidGrids(self, aFrame, heightGrids):
+        if aFrame in ('ellipsoid', 'bessel', 'wgs84'):
+            return ''
+        if aFrame not in heightGrids:
+            raise ValueError('No height grid for the altimetric frame %s' % aFrame)
+        return ' +geoidgrids=%s' % heightGrids[aFrame]
+
+    def transform(self, xs, ys, zs=None):
+        """
+        Returns the transformed (xs, ys, zs) arrays.
+        """
+        if self.withHeights and zs is not None:
+            return transform(self.fromProj, self.toProj, xs, ys, zs)
+        xs, ys = transform(self.fromProj, self.toProj, xs, ys)
+        return xs, ys, zs
+
+
+def reprojectTriangles(triangles, reprojector):
+    """
+    Reprojects a (N, 3, 3) array of triangles with a single transformation.
+    """
+    if len(triangles) == 0:
+        return triangles
+    coords = np.array(triangles, dtype=np.float64).reshape(-1, 3)
+    xs, ys, zs = reprojector.transform(coords[:, 0], coords[:, 1], coords[:, 2])
+    coords[:, 0] = xs
+    coords[:, 1] = ys
+    coords[:, 2] = zs
+    return coords.reshape(-1, 3, 3)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from forge.lib.global_geodetic import GlobalGeodetic
+
+
+# Number of keys between two progress reports
+PROGRESS_STEP = 100000
+
+
+def gridPrefixes(prefix, bucketBasePath, bounds, zooms):
+    """
+    Split a key prefix into z/x/ prefixes derived from the tiles grid.
+    A prefix deeper than a zoom level (or not following the z/x/y scheme)
+    is returned as is.
+    """
+    geodetic = GlobalGeodetic(True)
+    zoomLevels = _zoomLevels(prefix, zooms)
+    if zoomLevels is None:
+        return [bucketBasePath + prefix]
+
+    prefixes = []
+    for z in zoomLevels:
+        tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], z)
+        tileMaxX, tileMaxY = geodetic.LonLatToTile(bounds[2], bounds[3], z)
+        for x in xrange(tileMinX, tileMaxX + 1):
+            prefixes.append('%s%s/%s/' % (bucketBasePath, z, x))
+    return prefixes
+
+
+def _zoomLevels(prefix, zooms):
+    # The zoom levels covered by a prefix, None if deeper than a zoom level
+    parts = [p for p in prefix.split('/') if p]
+    if len(parts) == 0:
+        return zooms
+    elif len(parts) == 1 and parts[0].isdigit() and prefix.endswith('/'):
+        return [int(parts[0])]
+    return None
+
+
+def _listLevel(bucket, prefix):
+    # Sub prefixes (ending with /) and names of the keys directly under a prefix
+    prefixes = []
+    keys = []
+    for entry in bucket.list(prefix=prefix, delimiter='/'):
+        if entry.name.endswith('/'):
+            prefixes.append(entry.name)
+        else:
+            keys.append(entry.name)
+    return prefixes, keys
+
+
+def discoverPartitions(bucket, prefix, bucketBasePath):
+    """
+    Split a key prefix into the z/x/ prefixes actually found in the bucket
+    (listings with a / delimiter). Returns a list of (prefix, shallow):
+    the keys of a shallow partition are the ones directly under its prefix
+    (e.g. layer.json), the other partitions are listed recursively.
+    Prefixes not following the z/x/y scheme are listed as a whole.
+    """
+    if _zoomLevels(prefix, []) is None:
+        return [(bucketBasePath + prefix, False)]
+
+    partitions = []
+    levels = [bucketBasePath + prefix]
+    if not prefix:
+        zoomPrefixes, keys = _listLevel(bucket, bucketBasePath)
+        if keys:
+            partitions.append((bucketBasePath, True))
+        levels = []
+        for zoomPrefix in zoomPrefixes:
+            if zoomPrefix[len(bucketBasePath):-1].isdigit():
+                levels.append(zoomPrefix)
+            else:
+                partitions.append((zoomPrefix, False))
+
+    for level in levels:
+        xPrefixes, keys = _listLevel(bucket, level)
+        if keys:
+            partitions.append((level, True))
+        partitions += [(p, False) for p in xPrefixes]
+    return partitions
+
+
+def partitionsOutsideGrid(partitions, gridPartitions):
+    # The recursive partitions not expected from the tiles grid
+    expected = set(gridPartitions)
+    return [p for (p, shallow) in partitions if not shallow and p not in expected]
+
+
+def processKeys(bucket, prefix, shallow, action, t0, counter, deleteBatch,
+        logger=None):
+    """
+    Lists, counts or deletes (with deleteBatch(bucket, names)) the keys of
+    a partition. The keys are added to the shared counter by steps of 1000.
+    Returns the number of keys and, when listing, their rows.
+    """
+    count = 0
+    rows = []
+    batch = []
+    if shallow:
+        # Only the keys directly under the prefix
+        keys = (k for k in bucket.list(prefix=prefix, delimiter='/')
+            if not k.name.endswith('/'))
+    else:
+        keys = bucket.list(prefix=prefix)
+    for key in keys:
+        count += 1
+        if action == 'list':
+            rows.append("{name}\t{size}\t{modified}".format(
+                name=key.name,
+                size=key.size,
+                modified=key.last_modified,
+            ))
+        elif action == 'delete':
+            batch.append(key.name)
+            if len(batch) == 1000:
+                deleteBatch(bucket, batch)
+                batch = []
+        if count % 1000 == 0:
+            incrementProgress(counter, 1000, action, t0, logger)
+    if len(batch) > 0:
+        deleteBatch(bucket, batch)
+    if count % 1000:
+        incrementProgress(counter, count % 1000, action, t0, logger)
+    return (count, rows)
+
+
+def incrementProgress(counter, n, action, t0, logger=None):
+    """
+    Adds n keys to the shared counter and reports the progress each time
+    a multiple of PROGRESS_STEP is crossed (the partitions end anywhere).
+    """
+    with counter.get_lock():
+        counter.value += n
+        val = counter.value
+    if logger is not None and \
+            (val - n) // PROGRESS_STEP != val // PROGRESS_STEP:
+        elapsed = time.time() - t0
+        logger.info('%s %s keys so far (%.0f keys/sec)' % (
+            action.capitalize(), val, val / max(elapsed, 1e-6)))
+    return val
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+
+def fidRanges(featureCount, unitSize):
+    """
+    Splits the features of a file in ranges of FIDs [start, end[
+    of about unitSize features (a single range if unitSize is 0).
+    """
+    if unitSize <= 0 or featureCount <= unitSize:
+        return [(0, featureCount)]
+    nbUnits = -(-featureCount // unitSize)
+    # Balanced ranges rather than a small remainder: the sizes differ by 1 at most
+    size, remainder = divmod(featureCount, nbUnits)
+    ranges = []
+    start = 0
+    for i in range(0, nbUnits):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+class UnitTiming(object):
+
+    """
+    Outcome of a work unit, as returned by a worker.
+    """
+
+    def __init__(self, pid, name, cost, start, end):
+        self.pid = pid
+        self.name = name
+        self.cost = cost
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class WorkersReport(object):
+
+    """
+    Utilization of the workers of a run and its critical path: the units
+    of the worker that finished last, the run can't be shorter than the
+    longest unit.
+    """
+
+    def __init__(self, timings, tstart, tend):
+        self.wallTime = max(tend - tstart, 1e-6)
+        self.workers = {}
+        for timing in sorted(timings, key=lambda t: t.start):
+            self.workers.setdefault(timing.pid, []).append(timing)
+        self.longestUnit = max(timings, key=lambda t: t.duration) \
+            if timings else None
+        self.criticalPath = max(self.workers.values(),
+            key=lambda units: units[-1].end) if self.workers else []
+
+    def busyTime(self, pid):
+        return sum([t.duration for t in self.workers[pid]])
+
+    def utilization(self, pid):
+        return self.busyTime(pid) / self.wallTime
+
+    def lines(self):
+        lines = []
+        for pid in sorted(self.workers):
+            lines.append('[%s] %s units, busy %.1fs (%.0f%%)' % (
+                pid, len(self.workers[pid]), self.busyTime(pid),
+                100 * self.utilization(pid)))
+        if self.workers:
+            busy = sum([self.busyTime(pid) for pid in self.workers])
+            lines.append('Average utilization %.0f%% over %.1fs' % (
+                100 * busy / (self.wallTime * len(self.workers)), self.wallTime))
+        if self.criticalPath:
+            lines.append('Critical path (%.1fs): %s' % (
+                self.criticalPath[-1].end - self.criticalPath[0].start,
+                ', '.join(['%s (%.1fs)' % (t.name, t.duration)
+                    for t in self.criticalPath])))
+        if self.longestUnit is not None:
+            lines.append('Longest unit: %s (%.1fs, %s features)' % (
+                self.longestUnit.name, self.longestUnit.duration,
+                self.longestUnit.cost))
+        return lines
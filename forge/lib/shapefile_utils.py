@@ -1,9 +1,66 @@
 # -*- coding: utf-8 -*-
 
 import re
+import struct
+import numpy as np
 from osgeo import ogr
 
 
+# A triangle as a WKB 2.5D polygon: byte order, type, number of rings,
+# number of points and the 4 points of the closed ring (x, y, z)
+_wkbPolygon25D = 3 | 0x80000000
+_wkbPolygonZ = 1003
+_triangleHeader = 13
+TRIANGLE_WKB_SIZE = _triangleHeader + 4 * 3 * 8
+
+
+def trianglesFromWKBs(wkbs):
+    """
+    Returns the vertices of a list of WKB triangles (3D polygons with
+    a single ring of 4 points) as a (N, 3, 3) float64 array.
+    """
+    if len(wkbs) == 0:
+        return np.zeros((0, 3, 3))
+    data = np.frombuffer(''.join(wkbs), dtype=np.uint8)
+    if len(data) != len(wkbs) * TRIANGLE_WKB_SIZE:
+        raise TypeError('Only 3D triangles are supported')
+    data = data.reshape(len(wkbs), TRIANGLE_WKB_SIZE)
+    # Checks the distinct headers only
+    for header in np.unique(data[:, :_triangleHeader], axis=0):
+        byteOrder = '<' if header[0] == 1 else '>'
+        geomType, nbRings, nbPoints = struct.unpack(
+            byteOrder + 'III', header[1:].tostring())
+        if geomType not in (_wkbPolygon25D, _wkbPolygonZ) or \
+                nbRings != 1 or nbPoints != 4:
+            raise TypeError('Only 3D triangles are supported (type %s, %s rings, '
+                '%s points)' % (geomType, nbRings, nbPoints))
+    # The closing point is left out
+    coords = np.ascontiguousarray(data[:, _triangleHeader:_triangleHeader + 72])
+    little = data[:, 0] == 1
+    triangles = np.empty((len(wkbs), 9))
+    triangles[little] = coords[little].view('<f8')
+    triangles[~little] = coords[~little].view('>f8')
+    return triangles.reshape(-1, 3, 3)
+
+
+def trianglesToWKBs(triangles):
+    """
+    Returns a (N, 3, 3) array of triangles as a list of WKB 2.5D polygons
+    (little endian).
+    """
+    n = len(triangles)
+    data = np.empty((n, TRIANGLE_WKB_SIZE), dtype=np.uint8)
+    data[:, :_triangleHeader] = np.frombuffer(
+        struct.pack('<BIII', 1, _wkbPolygon25D, 1, 4), dtype=np.uint8)
+    # Closed ring
+    ring = np.concatenate([triangles, triangles[:, :1]], axis=1)
+    data[:, _triangleHeader:] = np.ascontiguousarray(
+        ring.reshape(n, 12), dtype='<f8').view(np.uint8)
+    raw = data.tostring()
+    return [raw[i:i + TRIANGLE_WKB_SIZE]
+        for i in xrange(0, n * TRIANGLE_WKB_SIZE, TRIANGLE_WKB_SIZE)]
+
+
 class ShpToGDALFeatures(object):
 
     def __init__(self, shpFilePath=None):
@@ -38,6 +95,39 @@ class ShpToGDALFeatures(object):
         for feature in layer:
             yield feature
 
+    def getFeatureCount(self):
+        dataSource = self._getDatasource()
+        layer = dataSource.GetLayer()
+        return layer.GetFeatureCount()
+
+    # Yields lists of WKB geometries of up to chunkSize features,
+    # optionally of the features of FIDs in [start, end[ only
+    def getWKBChunks(self, chunkSize=10000, fidRange=None):
+        dataSource = self._getDatasource()
+        layer = dataSource.GetLayer()
+        features = layer
+        if fidRange is not None:
+            # The FIDs of a shapefile are the record numbers, the shx index
+            # gives a direct access to the first one
+            start, end = fidRange
+            layer.SetNextByIndex(start)
+            features = (layer.GetNextFeature() for i in xrange(start, end))
+        chunk = []
+        for feature in features:
+            if feature is None:
+                break
+            chunk.append(feature.GetGeometryRef().ExportToWkb())
+            if len(chunk) == chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # Yields the triangles of a TIN by chunks of (N, 3, 3) arrays
+    def getTriangles(self, chunkSize=10000, fidRange=None):
+        for wkbs in self.getWKBChunks(chunkSize, fidRange):
+            yield trianglesFromWKBs(wkbs)
+
     def _getDatasource(self):
         dataSource = self.drv.Open(self.shpFilePath, 0)
         if dataSource is None:
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import json
+from bisect import bisect_left
+from itertools import chain
 from forge.lib.global_geodetic import GlobalGeodetic
 
 # Zoom 0 to 8
@@ -37,95 +39,121 @@ globalTilesConfig = [
 
 class _TileJSON:
 
-    # [[A, B],...,[G, H]] range of x values
+    # The missing tiles are stored per zoom and per row as a sorted
+    # list of x values (holes). The position is found by bisection but the
+    # insert shifts the list, O(n) in the number of holes of the row which
+    # stays small for the swiss extent (use AvailabilityBitmap otherwise)
     def removeTile(self, x, y, z):
         tileMinX = self.metadata[z]['x'][0]
         tileMaxX = self.metadata[z]['x'][1]
+        if x < tileMinX or x > tileMaxX:
+            return
 
-        if y not in self.ranges[z]:
-            self.ranges[z][y] = self._createRanges(tileMinX, tileMaxX, x)
+        holes = self.holes[z].get(y)
+        if holes is None:
+            self.holes[z][y] = [x]
         else:
-            newRanges = []
-            for r in self.ranges[z][y]:
-                newRanges += self._createRanges(r[0], r[1], x)
-            self.ranges[z][y] = newRanges
+            i = bisect_left(holes, x)
+            if i == len(holes) or holes[i] != x:
+                holes.insert(i, x)
+
+    # Merge per row lists of missing x values {y: [x1,...,xn]}
+    def addHoles(self, z, holes):
+        for y, xs in holes.iteritems():
+            if y in self.holes[z]:
+                for x in xs:
+                    self.removeTile(x, y, z)
+            else:
+                tileMinX = self.metadata[z]['x'][0]
+                tileMaxX = self.metadata[z]['x'][1]
+                self.holes[z][y] = sorted(set(
+                    [x for x in xs if x >= tileMinX and x <= tileMaxX]))
+
+    # [[A, B],...,[G, H]] range of x values available for a given row
+    def rowRanges(self, z, y):
+        tileMinX = self.metadata[z]['x'][0]
+        tileMaxX = self.metadata[z]['x'][1]
+        holes = self.holes[z].get(y)
+        if not holes:
+            return [[tileMinX, tileMaxX]]
+
+        ranges = []
+        start = tileMinX
+        for x in holes:
+            if x > start:
+                ranges.append([start, x - 1])
+            start = x + 1
+        if start <= tileMaxX:
+            ranges.append([start, tileMaxX])
+        return ranges
+
+    # Replace the availability of a zoom level with the given ranges
+    # {y: [[A, B],...,[G, H]]}, rows which are not listed have no tiles
+    def setAvailableRanges(self, z, ranges):
+        tileMinX = self.metadata[z]['x'][0]
+        tileMaxX = self.metadata[z]['x'][1]
+        tileMinY = self.metadata[z]['y'][0]
+        tileMaxY = self.metadata[z]['y'][1]
+        self.holes[z] = {}
+        for y in xrange(tileMinY, tileMaxY + 1):
+            holes = []
+            start = tileMinX
+            for r in sorted(ranges.get(y, [])):
+                startX = max(r[0], start)
+                endX = min(r[1], tileMaxX)
+                if startX > endX:
+                    continue
+                holes.extend(xrange(start, startX))
+                start = endX + 1
+            holes.extend(xrange(start, tileMaxX + 1))
+            if holes:
+                self.holes[z][y] = holes
+
+    # Merge identical consecutive rows into rectangles in a single pass
+    def zoomRectangles(self, z):
+        return list(self.iterZoomRectangles(z))
+
+    # Rectangles are yielded as soon as they can't grow anymore over y
+    def iterZoomRectangles(self, z):
+        tileMinY = self.metadata[z]['y'][0]
+        tileMaxY = self.metadata[z]['y'][1]
+        previousRow = None
+        previousRec = []
+        for y in xrange(tileMinY, tileMaxY + 1):
+            newRow = self.rowRanges(z, y)
+            # Current row over x is equal to previous row
+            # -> increase rectangles size over y
+            if newRow == previousRow:
+                for rec in previousRec:
+                    rec['endY'] = y
+            # Move temp rectangles in the final list, create new temp recs
+            else:
+                for rec in previousRec:
+                    yield rec
+                previousRec = [
+                    self._createRectangle(r[0], r[1], y, y) for r in newRow
+                ]
+            previousRow = newRow
+        # Finally push the last recs
+        for rec in previousRec:
+            yield rec
+
+    def _globalTiles(self):
+        # Make sure not to add an existing zoom level
+        if self.useGlobalTiles:
+            return [globalTilesConfig[z]
+                for z in range(0, len(globalTilesConfig) - 1)
+                if z < self.meta['minzoom']]
+        return []
 
     # Multi geometries are not supported
     def toJSON(self):
 
         for z in range(self.tileMinZoom, self.tileMaxZoom + 1):
-            tileMinX = self.metadata[z]['x'][0]
-            tileMaxX = self.metadata[z]['x'][1]
-            tileMinY = self.metadata[z]['y'][0]
-            tileMaxY = self.metadata[z]['y'][1]
-
-            for y in xrange(tileMinY, tileMaxY + 1):
-                # Holding data for layers.json
-                # The whole range over x is available -> only one range
-                if y not in self.ranges[z]:
-                    if y == tileMinY:
-                        # We only care about x values
-                        previousRow = [[tileMinX, tileMaxX]]
-                        previousRec = [
-                            self._createRectangle(tileMinX, tileMaxX, tileMinY, tileMinY)
-                        ]
-
-                    newRow = [[tileMinX, tileMaxX]]
-                    # Current row over x is equal to previous row
-                    # -> increase rectangle size over y
-                    if previousRow[0][0] == newRow[0][0] and \
-                            previousRow[0][1] == newRow[0][1]:
-                        previousRec[0]['endY'] = y
-                    # Move temp rectangle in the final list, create new temp rec
-                    else:
-                        self.available[z - self.tileMinZoom] += previousRec
-                        previousRec = [
-                            self._createRectangle(tileMinX, tileMaxX, y, y)
-                        ]
-
-                # Use custom ranges
-                else:
-                    isEqual = True
-                    newRow = self.ranges[z][y]
-                    # In case the new row is empty equality is not met
-                    if y == tileMinY or len(newRow) == 0:
-                        isEqual = False
-                    else:
-                        for i in xrange(0, len(newRow)):
-                            # Simplification for now, only identical ranges can be merged
-                            if len(previousRow) >= i + 1:
-                                pRange = previousRow[i]
-                                nRange = newRow[i]
-                                # Different ranges
-                                if pRange[0] != nRange[0] or pRange[1] != nRange[1]:
-                                    isEqual = False
-                                    break
-                            else:
-                                isEqual = False
-                    # Previous row doesn't change and previous rectangle changes over y
-                    if isEqual:
-                        for i in range(0, len(previousRec)):
-                            previousRec[i]['endY'] = y
-                    else:
-                        if y != tileMinY:
-                            self.available[z - self.tileMinZoom] += previousRec
-                        previousRec = []
-                        for r in newRow:
-                            previousRec.append(
-                                self._createRectangle(r[0], r[1], y, y)
-                            )
-                previousRow = newRow
-
-            # Finally push the last rec
-            self.meta['available'][z - self.tileMinZoom] += previousRec
+            self.meta['available'][z - self.tileMinZoom] += self.zoomRectangles(z)
 
         # Add global tiles config to the metadata
-        if self.useGlobalTiles:
-            # Make sure not to add an existing zoom level
-            for z in reversed(range(0, len(globalTilesConfig) - 1)):
-                if z < self.meta['minzoom']:
-                    self.meta['available'] = [globalTilesConfig[z]] + \
-                        self.meta['available']
+        self.meta['available'] = self._globalTiles() + self.meta['available']
         # Always start at 0
         self.meta['minzoom'] = 0
 
@@ -133,10 +161,70 @@ class _TileJSON:
         nbRanges = len(self.meta['available'])
         nbZooms = self.meta['maxzoom'] + 1
         if nbRanges < nbZooms:
-            for i in range(0, nbZooms - nbRanges):
-                self.meta['available'] = [[]] + self.meta['available']
+            self.meta['available'] = [[] for i in range(0, nbZooms - nbRanges)] + \
+                self.meta['available']
         return json.dumps(self.meta)
 
+    def _writeAvailable(self, f, maxZoom):
+        globalTiles = self._globalTiles()
+        nbRanges = len(globalTiles) + len(self.meta['available'])
+        nbZooms = self.meta['maxzoom'] + 1
+        zooms = [[] for i in range(0, nbZooms - nbRanges)] + globalTiles
+        f.write('[')
+        for i in range(0, len(zooms)):
+            if i > 0:
+                f.write(', ')
+            if maxZoom is not None and i > maxZoom:
+                f.write('[]')
+            else:
+                f.write(json.dumps(zooms[i]))
+        for i in range(0, len(self.meta['available'])):
+            if i > 0 or len(zooms) > 0:
+                f.write(', ')
+            rectangles = iter(self.meta['available'][i])
+            z = self.tileMinZoom + i
+            if maxZoom is not None and len(zooms) + i > maxZoom:
+                rectangles = iter([])
+            elif z <= self.tileMaxZoom:
+                rectangles = chain(rectangles, self.iterZoomRectangles(z))
+            # Rectangles are written by batches
+            f.write('[')
+            batch = []
+            first = True
+            for rec in rectangles:
+                batch.append(json.dumps(rec))
+                if len(batch) == 1000:
+                    f.write(('' if first else ', ') + ', '.join(batch))
+                    batch = []
+                    first = False
+            if batch:
+                f.write(('' if first else ', ') + ', '.join(batch))
+            f.write(']')
+        f.write(']')
+
+    def writeJSON(self, f, maxZoom=None):
+        """
+        Streams the same content as toJSON into a file like object
+        (rectangles are written as they are produced).
+        Unlike toJSON, it leaves the metadata untouched.
+        The levels after maxZoom are written empty if given.
+        """
+        f.write('{')
+        first = True
+        for key, value in self.meta.iteritems():
+            if not first:
+                f.write(', ')
+            first = False
+            f.write(json.dumps(key) + ': ')
+            if key == 'available':
+                self._writeAvailable(f, maxZoom)
+            elif key == 'minzoom':
+                # Always start at 0
+                f.write(json.dumps(0))
+            else:
+                f.write(json.dumps(value))
+        f.write('}')
+
     def _createRectangle(self, startX, endX, startY, endY):
         return {
             'startX': startX,
@@ -145,25 +233,11 @@ class _TileJSON:
             'endY': endY
         }
 
-    def _createRanges(self, minVal, maxVal, breakVal):
-        if breakVal == minVal and breakVal == maxVal:
-            return []
-        elif breakVal == minVal:
-            return [[breakVal + 1, maxVal]]
-        elif breakVal == maxVal:
-            return [[minVal, breakVal - 1]]
-        elif breakVal > minVal and breakVal < maxVal:
-            return [[minVal, breakVal - 1], [breakVal + 1, maxVal]]
-        elif breakVal < minVal:
-            return [[minVal, maxVal]]
-        elif breakVal > maxVal:
-            return [[minVal, maxVal]]
-
     def _initPyramidMetadata(self):
         # It keeps track of the starting and ending tiles
         # and the missing tiles in between
         self.metadata = {}
-        self.ranges = {}
+        self.holes = {}
         geodetic = GlobalGeodetic(True)
         bounds = self.meta['bounds']
         # Assume the whole extent is available
@@ -174,4 +248,4 @@ class _TileJSON:
                 x=[tileMinX, tileMaxX],
                 y=[tileMinY, tileMaxY]
             )
-            self.ranges[z] = {}
+            self.holes[z] = {}
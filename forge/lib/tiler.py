@@ -2,9 +2,11 @@
 
 import os
 import time
+import json
 import datetime
 import ConfigParser
 import multiprocessing
+import numpy as np
 from sqlalchemy.sql import and_
 from sqlalchemy.orm.exc import NoResultFound
 from geoalchemy2 import WKBElement
@@ -13,16 +15,24 @@ from geoalchemy2.shape import to_shape
 import forge.lib.cartesian2d as c2d
 from forge.db import DB
 from forge.terrain import TerrainTile
-from forge.terrain.metadata import TerrainMetadata
+from forge.terrain.metadata import TerrainMetadata, ChildAvailability
 from forge.terrain.topology import TerrainTopology
+from forge.models import tilesRangesLiteral, watermaskTilesLiteral
 from forge.models.tables import modelsPyramid
-from forge.lib.tiles import TerrainTiles, QueueTerrainTiles
-from forge.lib.boto_conn import getBucket, writeToS3, getSQS, writeSQSMessage
-from forge.lib.helpers import gzipFileObject, timestamp, transformCoordinate, createBBox
+from forge.lib.tiles import TerrainTiles, QueueTerrainTiles, tileOptions
+from forge.lib.boto_conn import getBucket, writeToS3
+from forge.lib.queues import getQueue, queueSettings
+from forge.lib.helpers import gzipFileObject, timestamp, createBBox, \
+    transformCoordinates
 from forge.lib.global_geodetic import GlobalGeodetic
+from forge.lib.grids import ZoomGrid, zoomGrids, tilesCount
 from forge.lib.geometry_processors import processRingCoordinates
 from forge.lib.logs import getLogger
 from forge.lib.poolmanager import PoolManager
+from forge.lib.heartbeat import DurationEstimator, VisibilityHeartbeat
+from forge.lib.manifest import TileManifest, contentHash
+from forge.lib.availability import TileJournal, AvailabilityBitmap, readJournals
+from forge.lib.watermask import WatermaskZoom, WatermaskStore, rasterBand
 
 
 # Init logging
@@ -34,61 +44,175 @@ logger = getLogger(loggingConfig, __name__, suffix=timestamp())
 # shared counter
 tilecount = multiprocessing.Value('i', 0)
 skipcount = multiprocessing.Value('i', 0)
-
+# uploads avoided because the tile content didn't change
+uploadskipcount = multiprocessing.Value('i', 0)
+uploadskipbytes = multiprocessing.Value('l', 0)
+# seconds spent waiting for the database (tiles written or skipped)
+dbtime = multiprocessing.Value('d', 0.0)
+
+# Default visibility timeout of the queue, messages are leased
+# for a duration sized from the observed time per tile when read
 visibility_timeout = 3600
+# Initial guess of the time needed to create one tile (in seconds)
+tileDurationEstimate = 30.0
+# Number of times a tile is put back in the queue after a failure
+maxAttempts = 3
+
+# One manifest connection per process
+_manifests = {}
+
+
+def _getManifest(filePath):
+    if filePath is None:
+        return None
+    if filePath not in _manifests:
+        _manifests[filePath] = TileManifest(filePath)
+    return _manifests[filePath]
+
+
+# One journal of the written tiles per process
+_journals = {}
+
+
+def _getJournal(directory):
+    if directory is None:
+        return None
+    if directory not in _journals:
+        _journals[directory] = TileJournal(directory)
+    return _journals[directory]
+
+
+# Availability of the descendants, loaded once per process
+_childAvailability = {}
+
+
+def _getChildAvailability(filePath, nbLevels):
+    if filePath not in _childAvailability:
+        with open(filePath, 'r') as f:
+            available = json.load(f)['available']
+        _childAvailability[filePath] = ChildAvailability(available, nbLevels)
+    return _childAvailability[filePath]
+
+
+# Pre-rasterized watermasks, opened once per process
+_watermaskStores = {}
+
+
+def _getWatermaskStore(directory):
+    if directory not in _watermaskStores:
+        _watermaskStores[directory] = WatermaskStore(directory)
+    return _watermaskStores[directory]
+
+
+def _logDBTime():
+    nbTiles = tilecount.value + skipcount.value
+    if nbTiles > 0:
+        logger.info('%.1fs spent in database queries (%.3fs per tile)' % (
+            dbtime.value, dbtime.value / nbTiles))
+
+
+def _logUploadSkips():
+    if uploadskipcount.value > 0:
+        logger.info('%s uploads (%s bytes) were avoided because the tiles '
+            'did not change' % (uploadskipcount.value, uploadskipbytes.value))
+
+
+def _parseTilesMessage(body):
+    tiles = map(int, body.split(','))
+    if len(tiles) % 3 != 0:
+        raise ValueError('Expected a multiple of 3 values, got %s' % len(tiles))
+    return [tiles[i:i + 3] for i in range(0, len(tiles), 3)]
+
+
+def _formatTilesMessage(tiles):
+    return ','.join(['%s,%s,%s' % (t[0], t[1], t[2]) for t in tiles])
+
+
+def _requeueTiles(q, tiles, attempts, pid):
+    if attempts >= maxAttempts:
+        logger.error('[%s] Giving up on %s tiles after %s attempts: %s' % (
+            pid, len(tiles), attempts, _formatTilesMessage(tiles)))
+        return
+    q.write(_formatTilesMessage(tiles), attempts=attempts + 1)
+    logger.warning('[%s] Re-enqueued %s tiles (attempt %s)' % (
+        pid, len(tiles), attempts + 1))
 
 
 def createTileFromQueue(tq):
     pid = os.getpid()
     try:
-        (qName, t0, dbConfigFile, hasLighting, hasWatermask) = tq
-        sqs = getSQS()
-        q = sqs.get_queue(qName)
+        (qSettings, t0, dbConfigFile, bucketBasePath,
+         hasLighting, hasWatermask, maxChunks, options) = tq
+        q = getQueue(qSettings)
         geodetic = GlobalGeodetic(True)
+        estimator = DurationEstimator(initial=tileDurationEstimate)
         # we do this as long as we are finding messages in the queue
         while True:
-            parseOk = True
+            m = None
             try:
                 # 20 is maximum wait time
-                m = q.read(
-                    visibility_timeout = visibility_timeout,
-                    wait_time_seconds = 20
-                )
+                visibility = estimator.timeout(maxChunks)
+                m = q.read(visibility, waitTime=20)
                 if m is None:
                     logger.info(
                         '[%s] No more messages found. Closing process' % pid)
                     break
                 body = m.get_body()
-                tiles = map(int, body.split(','))
+                tiles = _parseTilesMessage(body)
             except Exception as e:
-                parseOk = False
-
-            if not parseOk or len(tiles) % 3 != 0:
+                if m is None:
+                    raise
                 logger.warning(
                     '[%s] Unparsable message received.'
                     'Skipping...and removing message [%s]' % (pid, m.get_body())
                 )
-                q.delete_message(m)
+                q.delete(m)
                 continue
 
-            for i in range(0, len(tiles), 3):
-                try:
-                    tileXYZ = [tiles[i], tiles[i + 1], tiles[i + 2]]
-                    tilebounds = geodetic.TileBounds(
-                        tileXYZ[0], tileXYZ[1], tileXYZ[2]
-                    )
-                    createTile(
-                        (tilebounds, tileXYZ, t0, dbConfigFile,
-                         hasLighting, hasWatermask)
-                    )
-                except Exception as e:
-                    logger.error('[%s] Error while processing '
-                        'specific tile %s' % (pid, str(e)), exc_info=True)
-
-            # when successfull, we delete the message from the queue
-            logger.info('[%s] Successfully treated an SQS message: %s' % (
-                pid, body))
-            q.delete_message(m)
+            heartbeat = VisibilityHeartbeat(
+                lambda timeout: q.changeVisibility(m, timeout),
+                estimator, len(tiles), logger=logger, timeout=visibility
+            )
+            heartbeat.start()
+            failed = []
+            done = 0
+            try:
+                for tileXYZ in tiles:
+                    t1 = time.time()
+                    try:
+                        tilebounds = geodetic.TileBounds(
+                            tileXYZ[0], tileXYZ[1], tileXYZ[2]
+                        )
+                        createTile(
+                            (tilebounds, tileXYZ, t0, dbConfigFile,
+                             bucketBasePath, hasLighting, hasWatermask, options)
+                        )
+                        estimator.add(time.time() - t1)
+                    except Exception as e:
+                        failed.append(tileXYZ)
+                        logger.error('[%s] Error while processing '
+                            'specific tile %s' % (pid, str(e)), exc_info=True)
+                    done += 1
+                    heartbeat.progress()
+            finally:
+                heartbeat.stop()
+                # Acknowledge per tile: whatever was not treated successfully
+                # goes back to the queue and the original message is removed
+                pending = failed + tiles[done:]
+                if heartbeat.leaseLost():
+                    # The message is visible again, possibly processed by
+                    # another worker: it is neither requeued nor deleted
+                    logger.warning('[%s] Visibility timeout of the message '
+                        'expired, leaving it in the queue: %s' % (pid, body))
+                else:
+                    if pending:
+                        _requeueTiles(q, pending, m.attempts, pid)
+                    q.delete(m)
+
+            logger.info('[%s] Successfully treated a queue message: %s '
+                '(%s tiles failed, %.2fs per tile, %s heartbeats)' % (
+                    pid, body, len(failed), estimator.average, heartbeat.beats))
+            logger.info('[%s] Queue counters: %s' % (pid, q.stats()))
     except Exception as e:
         logger.error('[%s] Error occured during processing. '
             'Halting process ' % str(e), exc_info=True)
@@ -100,7 +224,7 @@ def createTile(tile):
 
     try:
         (bounds, tileXYZ, t0, dbConfigFile, bucketBasePath,
-            hasLighting, hasWatermask) = tile
+            hasLighting, hasWatermask, options) = tile
 
         db = DB(dbConfigFile)
         with db.userSession() as session:
@@ -109,14 +233,19 @@ def createTile(tile):
             # Get the model according to the zoom level
             model = modelsPyramid.getModelByZoom(tileXYZ[2])
 
+            # Results are fetched at once to measure the time spent in the db
+            tdb = time.time()
             watermask = []
-            if hasWatermask:
+            if hasWatermask and options.watermaskStore:
+                store = _getWatermaskStore(options.watermaskStore)
+                watermask = store.mask(*tileXYZ)
+            elif hasWatermask:
                 lakeModel = modelsPyramid.getLakeModelByZoom(tileXYZ[2])
                 query = session.query(
-                    lakeModel.watermaskRasterize(bounds).label('watermask')
+                    lakeModel.watermaskRasterize(bounds, raw=True).label('watermask')
                 )
-                for q in query:
-                    watermask = q.watermask
+                for q in query.all():
+                    watermask = rasterBand(str(q.watermask))
 
             # Get the interpolated point at the 4 corners
             # 0: (minX, minY), 1: (minX, maxY), 2: (maxX, maxY), 3: (maxX, minY)
@@ -127,12 +256,22 @@ def createTile(tile):
                 (bounds[2], bounds[1], 0)
             ]
 
+            # The features of the tile, by key (B-tree) or by bbox (GiST)
+            tileKey = None
+            if db.tileKeys():
+                tileKey = GlobalGeodetic(True).TileKey(*tileXYZ)
+
             def toSubQuery(x):
+                if tileKey is not None:
+                    # The features touching a corner intersect the tile
+                    candidates = model.tileKeyIntersects(tileKey)
+                else:
+                    candidates = model.bboxIntersects(createBBox(pts[x], 0.01))
                 return session.query(
                     model.id, model.interpolateHeightOnPlane(pts[x])
                 ).filter(
                     and_(
-                        model.bboxIntersects(createBBox(pts[x], 0.01)),
+                        candidates,
                         model.pointIntersects(pts[x])
                     )
                 ).subquery('p%s' % x)
@@ -144,7 +283,7 @@ def createTile(tile):
             step = 2
             j = step
             query = session.query(*subqueries)
-            for q in query:
+            for q in query.all():
                 for i in range(0, len(q), step):
                     sub = q[i:j]
                     j += step
@@ -157,10 +296,14 @@ def createTile(tile):
             query = session.query(
                 model.id,
                 clippedGeometry.label('clip')
-            ).filter(model.bboxIntersects(bounds))
+            ).filter(model.tileKeyIntersects(tileKey) if tileKey is not None
+                else model.bboxIntersects(bounds))
+            clips = query.all()
+            with dbtime.get_lock():
+                dbtime.value += time.time() - tdb
 
             terrainTopo = TerrainTopology(hasLighting=hasLighting)
-            for q in query:
+            for q in clips:
                 coords = list(to_shape(q.clip).exterior.coords)
                 if q.id in cornerPts:
                     pt = cornerPts[q.id][0]
@@ -187,26 +330,46 @@ def createTile(tile):
             if verticesLength > 0:
                 terrainTopo.create()
                 # Prepare terrain tile
-                terrainFormat = TerrainTile(watermask=watermask)
+                metadata = None
+                n = options.metadataAvailability
+                if n and tileXYZ[2] % n == 0:
+                    children = _getChildAvailability(options.availabilityFile, n)
+                    metadata = dict(available=children.forTile(*tileXYZ))
+                terrainFormat = TerrainTile(watermask=watermask, metadata=metadata)
                 terrainFormat.fromTerrainTopology(terrainTopo, bounds=bounds)
 
                 # Bytes manipulation and compression
                 fileObject = terrainFormat.toStringIO()
-                compressedFile = gzipFileObject(fileObject)
-                writeToS3(
+                tileHash = None
+                if options.skipUnchanged:
+                    tileHash = contentHash(fileObject)
+                compressedFile = gzipFileObject(
+                    fileObject, compresslevel=options.compressLevels[tileXYZ[2]]
+                )
+                uploaded = writeToS3(
                     bucket, bucketKey, compressedFile, model.__tablename__,
-                    bucketBasePath, contentType=terrainFormat.getContentType()
+                    bucketBasePath, contentType=terrainFormat.getContentType(),
+                    contentHash=tileHash, manifest=_getManifest(options.manifest)
                 )
+                if not uploaded:
+                    with uploadskipcount.get_lock():
+                        uploadskipcount.value += 1
+                    with uploadskipbytes.get_lock():
+                        uploadskipbytes.value += len(compressedFile.getvalue())
+                journal = _getJournal(options.journal)
+                if journal is not None:
+                    journal.add(tileXYZ[0], tileXYZ[1], tileXYZ[2])
                 tend = time.time()
                 tilecount.value += 1
                 val = tilecount.value
                 total = val + skipcount.value
                 if val % 10 == 0:
                     logger.info('[%s] Last tile %s (%s rings). '
-                        '%s to write %s tiles. (total processed: %s)' % (
+                        '%s to write %s tiles. (total processed: %s, '
+                        '%.3fs of db per tile)' % (
                             pid, bucketKey, verticesLength,
                             str(datetime.timedelta(seconds=tend - t0)),
-                            val, total
+                            val, total, dbtime.value / total
                         )
                     )
 
@@ -231,7 +394,7 @@ def createTile(tile):
 
 def scanTerrain(tMeta, tile, session, tilecount):
     try:
-        (bounds, tileXYZ, t0, dbConfigFile, hasLighting, hasWatermask) = tile
+        bounds, tileXYZ, t0 = tile[0], tile[1], tile[2]
 
         # Get the model according to the zoom level
         model = modelsPyramid.getModelByZoom(tileXYZ[2])
@@ -254,6 +417,105 @@ def scanTerrain(tMeta, tile, session, tilecount):
     return tMeta
 
 
+def scanZoom(tMeta, zoom, session):
+    """
+    Set the availability of a zoom level with a single set based query:
+    the bounding boxes of the features are snapped to the grid in PostGIS
+    and only the ranges of covered tiles per row are returned.
+    """
+    model = modelsPyramid.getModelByZoom(zoom)
+    tileMinX, tileMaxX = tMeta.metadata[zoom]['x']
+    tileMinY, tileMaxY = tMeta.metadata[zoom]['y']
+    tileSize = 180.0 / 2 ** zoom
+    query = tilesRangesLiteral(model.__table_args__['schema'], model.__tablename__)
+    # Same filter as the per tile scan: the extent of the tiles of the zoom level
+    results = session.execute(query, dict(
+        tileSize=tileSize,
+        minX=tileMinX, maxX=tileMaxX, minY=tileMinY, maxY=tileMaxY,
+        minLon=tileMinX * tileSize - 180, minLat=tileMinY * tileSize - 90,
+        maxLon=(tileMaxX + 1) * tileSize - 180, maxLat=(tileMaxY + 1) * tileSize - 90
+    ))
+    ranges = {}
+    nbTiles = 0
+    for (y, startX, endX) in results:
+        ranges.setdefault(y, []).append([startX, endX])
+        nbTiles += endX - startX + 1
+    tMeta.setAvailableRanges(zoom, ranges)
+    return nbTiles
+
+
+def rasterizeWatermasks(unit):
+    """
+    Rasterizes the lakes of the tiles of a unit (partly covered by water)
+    and writes their masks to the watermask file of the zoom level.
+    """
+    dbConfigFile, filePath, zoom, tilesXY = unit
+    pid = os.getpid()
+    geodetic = GlobalGeodetic(True)
+    zoomMasks = WatermaskZoom(filePath, mode='r+')
+    db = DB(dbConfigFile)
+    try:
+        with db.userSession() as session:
+            lakeModel = modelsPyramid.getLakeModelByZoom(zoom)
+            for (x, y) in tilesXY:
+                bounds = geodetic.TileBounds(x, y, zoom)
+                query = session.query(
+                    lakeModel.watermaskRasterize(bounds, raw=True).label('watermask'))
+                mask = np.zeros(1, dtype=np.uint8)
+                for q in query.all():
+                    mask = rasterBand(str(q.watermask))
+                if len(mask) == 1:
+                    mask = np.repeat(mask, 256 * 256)
+                zoomMasks.setMask(x, y, mask)
+        zoomMasks.flush()
+    except Exception as e:
+        logger.error('[%s] %s' % (pid, e), exc_info=True)
+        raise Exception(e)
+    finally:
+        db.userEngine.dispose()
+    return len(tilesXY)
+
+
+def classifyWatermaskTiles(session, zoomGrid):
+    """
+    Lists the (x, y) of the all water tiles and of the tiles partly covered
+    by water of a zoom level with a single query.
+    """
+    zoom = zoomGrid.zoom
+    lakeModel = modelsPyramid.getLakeModelByZoom(zoom)
+    tileSize = 180.0 / 2 ** zoom
+    query = watermaskTilesLiteral(
+        lakeModel.__table_args__['schema'], lakeModel.__tablename__)
+    results = session.execute(query, dict(
+        tileSize=tileSize,
+        minX=zoomGrid.tileMinX, maxX=zoomGrid.tileMaxX,
+        minY=zoomGrid.tileMinY, maxY=zoomGrid.tileMaxY,
+        minLon=zoomGrid.tileMinX * tileSize - 180,
+        minLat=zoomGrid.tileMinY * tileSize - 90,
+        maxLon=(zoomGrid.tileMaxX + 1) * tileSize - 180,
+        maxLat=(zoomGrid.tileMaxY + 1) * tileSize - 90
+    ))
+    water = []
+    mixed = []
+    for (x, y, inside) in results:
+        if inside:
+            water.append((x, y))
+        else:
+            mixed.append((x, y))
+    return water, mixed
+
+
+def _missingAvailabilityFile(options):
+    # Checked before starting the workers, each tile would fail otherwise
+    if options.metadataAvailability and \
+            not os.path.isfile(options.availabilityFile):
+        logger.error('Missing availability file %s, run the metadata command '
+            'first (metadataavailability: %s)' % (
+                options.availabilityFile, options.metadataAvailability))
+        return True
+    return False
+
+
 class TilerManager:
 
     def __init__(self, dbConfigFile, tmsConfigFile):
@@ -268,8 +530,13 @@ class TilerManager:
 
         tilecount.value = 0
         skipcount.value = 0
+        uploadskipcount.value = 0
+        uploadskipbytes.value = 0
+        dbtime.value = 0.0
 
         tiles = TerrainTiles(self.dbConfigFile, self.tmsConfig, self.t0)
+        if _missingAvailabilityFile(tiles.options):
+            return
         procfactor = int(self.tmsConfig.get('General', 'procfactor'))
 
         pm = PoolManager(logger=logger, factor=procfactor)
@@ -283,8 +550,8 @@ class TilerManager:
         if maxChunks < 1:
             maxChunks = 1
 
-        logger.info('Starting creation of %s tiles (%s per chunk)' % (
-            nbTiles, maxChunks))
+        logger.info('Starting creation of %s tiles (%s per chunk, %s order)' % (
+            nbTiles, maxChunks, tiles.ordering))
         pm.process(tiles, createTile, maxChunks)
 
         tend = time.time()
@@ -292,20 +559,24 @@ class TilerManager:
             str(datetime.timedelta(seconds=tend - self.t0)), tilecount.value,
             skipcount.value
         ))
+        _logDBTime()
+        _logUploadSkips()
 
-    # Create AWS sqs queue with all the tiles to create
+    # Create a queue (AWS sqs or sql table) with all the tiles to create
     # based on current configuration as well as meta data
     def createQueue(self):
-        queueName = self.tmsConfig.get('General', 'sqsqueue')
+        qSettings = queueSettings(self.tmsConfig)
+        queueName = qSettings[0]
         maxChunks = int(self.tmsConfig.get('General', 'maxChunks'))
         self.t0 = time.time()
         if len(queueName) <= 0:
             logger.error('Missing queueName')
             return
+        if _missingAvailabilityFile(tileOptions(self.tmsConfig)):
+            return
         try:
-            sqs = getSQS()
-            q = sqs.get_queue(queueName)
-            if q is not None:
+            q = getQueue(qSettings)
+            if q.exists():
                 logger.error('Queue already exists. Can\'t overwrite'
                     ' existing queue. [%s]' % (queueName))
                 return
@@ -313,10 +584,8 @@ class TilerManager:
             # queue with default message visiblity time of 3600. So each message is
             # blocked for other users for 3600 seconds. Default would be 30 seconds.
             # It's that high because each message contains maxChunks tiles
-            q = sqs.create_queue(queueName, visibility_timeout = visibility_timeout)
-            # Assure queue is kept for maximum of 14 weeks (aws limit).
-            # default would be 4 days.
-            sqs.set_queue_attribute(q, 'MessageRetentionPeriod', 1209600)
+            # Workers lease messages using the observed time per tile though.
+            q.create(visibility_timeout)
         except Exception as e:
             logger.error('Error during creation of queue:\n' + str(e), exc_info=True)
             return
@@ -330,53 +599,52 @@ class TilerManager:
         tiles = TerrainTiles(self.dbConfigFile, self.tmsConfig, self.t0)
         nbTiles = self.numOfTiles()
         try:
-            logger.info('Starting creation of SQS queue with approx. '
-                '%s tiles)' % (nbTiles))
+            logger.info('Starting creation of %s queue with approx. '
+                '%s tiles (%s order)' % (qSettings[1], nbTiles, tiles.ordering))
             totalcount = 0
-            tcount = 0
             messagecount = 0
-            msg = ''
+            chunk = []
+            messages = []
             for tile in tiles:
-                (bounds, tileXYZ, t0, dbConfigFile,
-                 hasLighting, hasWatermask) = tile
-                if msg:
-                    msg += ','
-                msg += ('%s,%s,%s' % (
-                    str(tileXYZ[0]), str(tileXYZ[1]), str(tileXYZ[2])
-                ))
-                tcount += 1
-                if tcount >= maxChunks:
-                    messagecount += 1
-                    writeSQSMessage(q, msg)
-                    tcount = 0
-                    msg = ''
+                # A message covers a single zoom level so that its tiles
+                # are close to each other with the morton and hilbert orders
+                if len(chunk) >= maxChunks or \
+                        (chunk and chunk[-1][2] != tile[1][2]):
+                    messages.append(_formatTilesMessage(chunk))
+                    chunk = []
+                if len(messages) >= 10:
+                    messagecount += len(messages)
+                    q.writeBatch(messages)
+                    messages = []
+                chunk.append(tile[1])
                 totalcount = totalcount + 1
-            if msg:
-                messagecount += 1
-                writeSQSMessage(q, msg)
+            if chunk:
+                messages.append(_formatTilesMessage(chunk))
+            if messages:
+                messagecount += len(messages)
+                q.writeBatch(messages)
         except Exception as e:
-            logger.error('Error during writing of sqs message:\n' + str(e),
+            logger.error('Error during writing of queue message:\n' + str(e),
                 exc_info=True)
 
         tend = time.time()
-        logger.info('It took %s to create %s message in SQS gueue '
+        logger.info('It took %s to create %s message in %s gueue '
             'representing %s tiles' % (
                 str(datetime.timedelta(seconds=tend - self.t0)),
-                messagecount, totalcount
+                messagecount, qSettings[1], totalcount
             )
         )
 
     # To delete an existing queue. Be very carefull...alot of info
     # will be deleted potentially
     def deleteQueue(self):
-        queueName = self.tmsConfig.get('General', 'sqsqueue')
-        if len(queueName) <= 0:
+        qSettings = queueSettings(self.tmsConfig)
+        if len(qSettings[0]) <= 0:
             logger.error('Missing queueName')
             return
         try:
-            sqs = getSQS()
-            q = sqs.get_queue(queueName)
-            sqs.delete_queue(q)
+            q = getQueue(qSettings)
+            q.destroy()
         except Exception as e:
             logger.error('Error during deletion of queue:\n' + str(e), exc_info=True)
             return
@@ -385,16 +653,22 @@ class TilerManager:
     def createTiles(self):
         tilecount.value = 0
         skipcount.value = 0
-        queueName = self.tmsConfig.get('General', 'sqsqueue')
+        uploadskipcount.value = 0
+        uploadskipbytes.value = 0
+        dbtime.value = 0.0
+        qSettings = queueSettings(self.tmsConfig)
+        queueName = qSettings[0]
         self.t0 = time.time()
         if len(queueName) <= 0:
             logger.error('Missing queueName')
             return
+        if _missingAvailabilityFile(tileOptions(self.tmsConfig)):
+            return
         procfactor = int(self.tmsConfig.get('General', 'procfactor'))
 
         pm = PoolManager(logger=logger, factor=procfactor)
         qtiles = QueueTerrainTiles(
-            queueName, self.dbConfigFile, self.tmsConfig, self.t0, pm.numOfProcesses()
+            qSettings, self.dbConfigFile, self.tmsConfig, self.t0, pm.numOfProcesses()
         )
 
         logger.info('Starting creation of tiles from queue %s ' % (queueName))
@@ -404,16 +678,17 @@ class TilerManager:
             str(datetime.timedelta(seconds=tend - self.t0)), tilecount.value,
             skipcount.value
         ))
+        _logDBTime()
+        _logUploadSkips()
 
     def queueStats(self):
-        queueName = self.tmsConfig.get('General', 'sqsqueue')
-        if len(queueName) <= 0:
+        qSettings = queueSettings(self.tmsConfig)
+        if len(qSettings[0]) <= 0:
             logger.error('Missing queueName')
             return
         try:
-            sqs = getSQS()
-            q = sqs.get_queue(queueName)
-            attrs = sqs.get_queue_attributes(q)
+            q = getQueue(qSettings)
+            attrs = q.attributes()
         except Exception as e:
             logger.error('Error during statistics collection:\n' + str(e), exc_info=True)
             return
@@ -435,18 +710,42 @@ class TilerManager:
         tMeta = TerrainMetadata(
             bounds=tiles.bounds, minzoom=tiles.tileMinZ, maxzoom=tiles.tileMaxZ,
             useGlobalTiles=True, hasLighting=tiles.hasLighting,
-            hasWatermask=tiles.hasWatermask, baseUrls=baseUrls)
+            hasWatermask=tiles.hasWatermask, baseUrls=baseUrls,
+            metadataAvailability=tiles.options.metadataAvailability)
+
+        mode = 'bulk'
+        if self.tmsConfig.has_option('General', 'metadatamode'):
+            mode = self.tmsConfig.get('General', 'metadatamode')
 
         try:
             with db.userSession() as session:
-                tilecount = 1
-                for tile in tiles:
-                    tMeta = scanTerrain(tMeta, tile, session, tilecount)
-                    tilecount += 1
-
-                tend = time.time()
-                logger.info('It took %s to scan %s tiles' % (
-                    str(datetime.timedelta(seconds=tend - t0)), tilecount))
+                if mode == 'journal':
+                    if tiles.options.journal is None:
+                        raise ValueError('No journal directory defined')
+                    bitmap = AvailabilityBitmap(
+                        tiles.bounds, tiles.tileMinZ, tiles.tileMaxZ)
+                    for (x, y, z) in readJournals(tiles.options.journal):
+                        bitmap.add(x, y, z)
+                    bitmap.updateMetadata(tMeta)
+                    for zoom in range(tiles.tileMinZ, tiles.tileMaxZ + 1):
+                        logger.info('Zoom %s: %s available tiles' % (
+                            zoom, bitmap.count(zoom)))
+                elif mode == 'bulk':
+                    for zoom in range(tiles.tileMinZ, tiles.tileMaxZ + 1):
+                        tz = time.time()
+                        nbTiles = scanZoom(tMeta, zoom, session)
+                        logger.info('Zoom %s: %s available tiles, it took %s' % (
+                            zoom, nbTiles,
+                            str(datetime.timedelta(seconds=time.time() - tz))))
+                else:
+                    tilecount = 1
+                    for tile in tiles:
+                        tMeta = scanTerrain(tMeta, tile, session, tilecount)
+                        tilecount += 1
+
+                    tend = time.time()
+                    logger.info('It took %s to scan %s tiles' % (
+                        str(datetime.timedelta(seconds=tend - t0)), tilecount))
         except Exception as e:
             logger.error('An error occured during layer.json creation')
             logger.error('%s' % e, exc_info=True)
@@ -455,7 +754,62 @@ class TilerManager:
             db.userEngine.dispose()
 
         with open('.tmp/layer.json', 'w') as f:
-            f.write(tMeta.toJSON())
+            tMeta.writeJSON(f, maxZoom=tMeta.maxAvailableZoom())
+        # All the levels are needed to write the metadata extension of the tiles
+        if tiles.options.metadataAvailability:
+            with open(tiles.options.availabilityFile, 'w') as f:
+                tMeta.writeJSON(f)
+
+    # Rasterize the lakes once per zoom level into the watermask store
+    def watermask(self):
+        t0 = time.time()
+        tiles = TerrainTiles(self.dbConfigFile, self.tmsConfig, t0)
+        store = tiles.options.watermaskStore
+        if store is None:
+            logger.error('Missing watermaskstore')
+            return
+        if not os.path.isdir(store):
+            os.makedirs(store)
+        procfactor = int(self.tmsConfig.get('General', 'procfactor'))
+        # Number of tiles rasterized per unit of work
+        chunkSize = 64
+
+        db = DB(self.dbConfigFile)
+        for zoom in range(tiles.tileMinZ, tiles.tileMaxZ + 1):
+            tz = time.time()
+            zoomGrid = ZoomGrid(tiles.bounds, zoom)
+            try:
+                with db.userSession() as session:
+                    water, mixed = classifyWatermaskTiles(session, zoomGrid)
+            finally:
+                db.userEngine.dispose()
+            filePath = WatermaskStore(store).filePath(zoom)
+            zoomMasks = WatermaskZoom.create(filePath, zoom, (
+                zoomGrid.tileMinX, zoomGrid.tileMinY,
+                zoomGrid.tileMaxX, zoomGrid.tileMaxY), water, mixed)
+            mixed = list(zoomMasks.mixedTiles())
+            del zoomMasks
+            units = [(self.dbConfigFile, filePath, zoom, mixed[i:i + chunkSize])
+                for i in range(0, len(mixed), chunkSize)]
+            rasterized = 0
+            if units:
+                pm = PoolManager(logger=logger, factor=procfactor, store=True)
+                try:
+                    pm.process(units, rasterizeWatermasks, 1)
+                    rasterized = sum(pm.results)
+                except Exception as e:
+                    logger.error('Zoom %s: %s' % (zoom, e), exc_info=True)
+            if rasterized != len(mixed):
+                # A zoom level with missing masks would be read as dry land
+                logger.error('Zoom %s: %s of %s tiles rasterized, removing %s' % (
+                    zoom, rasterized, len(mixed), filePath))
+                os.remove(filePath)
+                continue
+            logger.info('Zoom %s: %s tiles, %s all water, %s rasterized, '
+                'it took %s' % (zoom, zoomGrid.count(), len(water), len(mixed),
+                    str(datetime.timedelta(seconds=time.time() - tz))))
+        logger.info('Watermasks written to %s in %s' % (
+            store, str(datetime.timedelta(seconds=time.time() - t0))))
 
     def _stats(self, withDb=True):
         self.t0 = time.time()
@@ -463,56 +817,47 @@ class TilerManager:
 
         msg = '\n'
         tiles = TerrainTiles(self.dbConfigFile, self.tmsConfig, self.t0)
-        geodetic = GlobalGeodetic(True)
         bounds = (tiles.minLon, tiles.minLat, tiles.maxLon, tiles.maxLat)
-        zooms = range(tiles.tileMinZ, tiles.tileMaxZ + 1)
+        grids = zoomGrids(bounds, range(tiles.tileMinZ, tiles.tileMaxZ + 1),
+            tiles.fullonly)
+        # Tile sides in meters, all the zoom levels are reprojected at once
+        # (first tile of each zoom level)
+        lons = [g.minLons[0] if len(g.xs) else 0.0 for g in grids]
+        lats = [g.minLats[0] if len(g.ys) else 0.0 for g in grids]
+        sides = [g.maxLons[0] - g.minLons[0] if len(g.xs) else 0.0 for g in grids]
+        pointsA = transformCoordinates(lons, lats, None, 4326, 21781)
+        pointsB = transformCoordinates(
+            np.array(lons) + sides, np.array(lats) + sides, None, 4326, 21781)
 
         db = DB('configs/terrain/database.cfg')
         try:
             with db.userSession() as session:
-                for i in xrange(0, len(zooms)):
-                    zoom = zooms[i]
+                for i in xrange(0, len(grids)):
+                    zoomGrid = grids[i]
+                    zoom = zoomGrid.zoom
                     model = modelsPyramid.getModelByZoom(zoom)
                     nbObjects = None
                     if withDb:
                         nbObjects = session.query(model).filter(
                             model.bboxIntersects(bounds)
                         ).count()
-                    tileMinX, tileMinY = geodetic.LonLatToTile(
-                        bounds[0], bounds[1], zoom
-                    )
-                    tileMaxX, tileMaxY = geodetic.LonLatToTile(
-                        bounds[2], bounds[3], zoom
-                    )
-                    # Fast approach, but might not be fully correct
-                    if tiles.fullonly == 1:
-                        tileMinX += 1
-                        tileMinY += 1
-                        tileMaxX -= 1
-                        tileMaxY -= 1
-                    tileBounds = geodetic.TileBounds(tileMinX, tileMinY, zoom)
-                    xCount = tileMaxX - tileMinX + 1
-                    yCount = tileMaxY - tileMinY + 1
-                    nbTiles = xCount * yCount
+                    xCount = len(zoomGrid.xs)
+                    yCount = len(zoomGrid.ys)
+                    nbTiles = zoomGrid.count()
                     total += nbTiles
-                    pointA = transformCoordinate('POINT(%s %s)' % (
-                        tileBounds[0], tileBounds[1]), 4326, 21781
-                    ).GetPoints()[0]
-                    pointB = transformCoordinate('POINT(%s %s)' % (
-                        tileBounds[2], tileBounds[3]), 4326, 21781
-                    ).GetPoints()[0]
-                    length = c2d.distance(pointA, pointB)
-                    if tiles.fullonly == 1:
-                        msg += 'WARNING: stats are approximative because ' \
-                               'fullonly is activated!\n'
+                    length = c2d.distance(
+                        (pointsA[0][i], pointsA[1][i]), (pointsB[0][i], pointsB[1][i]))
                     msg += 'At zoom %s:\n' % zoom
                     msg += 'We expect %s tiles overall\n' % nbTiles
-                    msg += 'Min X is %s, Max X is %s\n' % (tileMinX, tileMaxX)
-                    msg += '%s columns over X\n' % xCount
-                    msg += 'Min Y is %s, Max Y is %s\n' % (tileMinY, tileMaxY)
-                    msg += '%s rows over Y\n' % yCount
-                    msg += '\n'
-                    msg += 'A tile side is around %s meters' % int(round(length))
+                    if xCount > 0 and yCount > 0:
+                        msg += 'Min X is %s, Max X is %s\n' % (
+                            zoomGrid.xs[0], zoomGrid.xs[-1])
+                        msg += '%s columns over X\n' % xCount
+                        msg += 'Min Y is %s, Max Y is %s\n' % (
+                            zoomGrid.ys[0], zoomGrid.ys[-1])
+                        msg += '%s rows over Y\n' % yCount
+                        msg += '\n'
+                        msg += 'A tile side is around %s meters' % int(round(length))
                     if nbTiles > 0 and nbObjects is not None:
                         msg += 'We have an average of about %s triangles ' \
                                'per tile\n' % int(round(nbObjects / nbTiles))
@@ -527,9 +872,11 @@ class TilerManager:
 
         return (total, msg)
 
+    # Arithmetic count, neither the database nor the projections are needed
     def numOfTiles(self):
-        (total, msg) = self._stats(False)
-        return total
+        tiles = TerrainTiles(self.dbConfigFile, self.tmsConfig, time.time())
+        return tilesCount(tiles.bounds, range(tiles.tileMinZ, tiles.tileMaxZ + 1),
+            tiles.fullonly)
 
     def stats(self):
         (total, msg) = self._stats(True)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from forge.lib.global_geodetic import GlobalGeodetic
+from forge.lib.grids import zoomGrids, ORDERINGS
 
 
 def isInside(tile, bounds):
@@ -10,18 +10,65 @@ def isInside(tile, bounds):
     return False
 
 
-def grid(bounds, zoomLevels, fullonly):
-    geodetic = GlobalGeodetic(True)
-
-    for tileZ in zoomLevels:
-        tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], tileZ)
-        tileMaxX, tileMaxY = geodetic.LonLatToTile(bounds[2], bounds[3], tileZ)
-
-        for tileX in xrange(tileMinX, tileMaxX + 1):
-            for tileY in xrange(tileMinY, tileMaxY + 1):
-                tilebounds = geodetic.TileBounds(tileX, tileY, tileZ)
-                if fullonly == 0 or isInside(tilebounds, bounds):
-                    yield (tilebounds, (tileX, tileY, tileZ))
+def grid(bounds, zoomLevels, fullonly, ordering='column'):
+    for zoomGrid in zoomGrids(bounds, zoomLevels, fullonly):
+        for tile in zoomGrid.tiles(ordering):
+            yield tile
+
+
+# Create pickable object
+class TileOptions(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def getOption(tmsConfig, section, option, default, getter='get'):
+    if tmsConfig.has_option(section, option):
+        return getattr(tmsConfig, getter)(section, option)
+    return default
+
+
+def _compressLevels(tmsConfig):
+    # Per zoom level, e.g. [17] compresslevel: 9
+    default = getOption(tmsConfig, 'General', 'compresslevel', 5, getter='getint')
+    levels = {}
+    for z in range(tmsConfig.getint('Zooms', 'tileMinZ'),
+            tmsConfig.getint('Zooms', 'tileMaxZ') + 1):
+        levels[z] = getOption(tmsConfig, str(z), 'compresslevel', default,
+            getter='getint')
+    return levels
+
+
+def tileOptions(tmsConfig):
+    # The availability file is written by the metadata command (bulk or
+    # pertile) before the tiles are created, the journal only after
+    if getOption(tmsConfig, 'General', 'metadataavailability', 0,
+            getter='getint') and \
+            getOption(tmsConfig, 'General', 'metadatamode', 'bulk') == 'journal':
+        raise ValueError('metadataavailability requires the availability file '
+            'before the tiles are created, it can\'t be used with '
+            'metadatamode: journal')
+    return TileOptions(
+        # gzip compression level per zoom
+        compressLevels = _compressLevels(tmsConfig),
+        # Skip the upload of tiles whose content didn't change
+        skipUnchanged = getOption(tmsConfig, 'General', 'skipunchanged', 0,
+            getter='getint'),
+        # Local manifest of the content hashes, S3 metadata is used otherwise
+        manifest = getOption(tmsConfig, 'General', 'manifest', '') or None,
+        # Directory of the journals of the written tiles
+        journal = getOption(tmsConfig, 'General', 'journal', '') or None,
+        # Availability of the next N levels written in the tiles every N levels
+        metadataAvailability = getOption(tmsConfig, 'General',
+            'metadataavailability', 0, getter='getint'),
+        availabilityFile = getOption(tmsConfig, 'General', 'availabilityfile',
+            '.tmp/availability.json'),
+        # Directory of the pre-rasterized watermasks (watermask command),
+        # the lakes are rasterized per tile otherwise
+        watermaskStore = getOption(tmsConfig, 'Extensions', 'watermaskstore',
+            '') or None
+    )
 
 
 class Tiles:
@@ -72,29 +119,43 @@ class TerrainTiles:
         self.hasWatermask = tmsConfig.getint('Extensions', 'watermask')
 
         self.dbConfigFile = dbConfigFile
+        self.options = tileOptions(tmsConfig)
+
+        # Order of the tiles within a zoom level, consecutive tiles of
+        # the morton and hilbert orders are close to each other
+        self.ordering = getOption(tmsConfig, 'General', 'tilesorder', 'column')
+        if self.ordering not in ORDERINGS:
+            raise ValueError('Unknown tiles order %s (expected one of %s)' % (
+                self.ordering, ', '.join(ORDERINGS)))
 
     def __iter__(self):
         zRange = range(self.tileMinZ, self.tileMaxZ + 1)
 
-        for bounds, tileXYZ in grid(self.bounds, zRange, self.fullonly):
+        for bounds, tileXYZ in grid(
+                self.bounds, zRange, self.fullonly, self.ordering):
             yield (bounds, tileXYZ, self.t0, self.dbConfigFile,
-                self.bucketBasePath, self.hasLighting, self.hasWatermask)
+                self.bucketBasePath, self.hasLighting, self.hasWatermask,
+                self.options)
 
 
 class QueueTerrainTiles:
 
-    def __init__(self, qName, dbConfigFile, tmsConfig, t0, num):
+    def __init__(self, qSettings, dbConfigFile, tmsConfig, t0, num):
         self.t0 = t0
         self.dbConfigFile = dbConfigFile
-        self.qName = qName
+        # (name, backend, url) see forge.lib.queues.queueSettings
+        self.qSettings = qSettings
         self.num = num
 
         self.bucketBasePath = tmsConfig.get('General', 'bucketPath')
+        self.maxChunks = tmsConfig.getint('General', 'maxChunks')
 
         self.hasLighting = tmsConfig.getint('Extensions', 'lighting')
         self.hasWatermask = tmsConfig.getint('Extensions', 'watermask')
+        self.options = tileOptions(tmsConfig)
 
     def __iter__(self):
         for i in range(0, self.num):
-            yield (self.qName, self.t0, self.dbConfigFile,
-                self.bucketBasePath, self.hasLighting, self.hasWatermask)
+            yield (self.qSettings, self.t0, self.dbConfigFile,
+                self.bucketBasePath, self.hasLighting, self.hasWatermask,
+                self.maxChunks, self.options)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import numpy as np
+
+
+# Classes of the tiles
+LAND = 0
+WATER = 1
+MIXED = 2
+
+# 256 x 256 pixels, one byte per pixel (0: land, 255: water)
+MASK_SIZE = 256 * 256
+
+# Per zoom level file: magic, version, zoom, tile range, number of masks,
+# then one class per tile (row after row), the sorted indices of the mixed
+# tiles and their masks (8 bytes aligned)
+_magic = 'FWMK'
+_version = 1
+_header = struct.Struct('<4sBBIIIIQ')
+
+
+def _align(offset):
+    return offset + (-offset % 8)
+
+
+class WatermaskZoom:
+
+    """
+    Pre-rasterized watermasks of a zoom level. Only the masks of the
+    tiles partly covered by water are stored, the class of the tiles
+    tells the all land and all water tiles apart without reading masks.
+    """
+
+    def __init__(self, filePath, mode='r'):
+        self.filePath = filePath
+        with open(filePath, 'rb') as f:
+            header = _header.unpack(f.read(_header.size))
+        (magic, version, self.zoom, self.tileMinX, self.tileMinY,
+            self.tileMaxX, self.tileMaxY, nbMasks) = header
+        if magic != _magic or version != _version:
+            raise ValueError('%s is not a watermask file' % filePath)
+        self.width = self.tileMaxX - self.tileMinX + 1
+        nbTiles = self.width * (self.tileMaxY - self.tileMinY + 1)
+        offset = _header.size
+        self.classes = np.memmap(filePath, dtype=np.uint8, mode='r',
+            offset=offset, shape=(nbTiles,))
+        offset = _align(offset + nbTiles)
+        self.indices = np.memmap(filePath, dtype='<u4', mode='r',
+            offset=offset, shape=(nbMasks,)) if nbMasks else np.zeros(0, '<u4')
+        offset = _align(offset + 4 * nbMasks)
+        self.masks = np.memmap(filePath, dtype=np.uint8, mode=mode,
+            offset=offset, shape=(nbMasks, MASK_SIZE)) if nbMasks else None
+
+    @classmethod
+    def create(cls, filePath, zoom, tileRange, water, mixed):
+        """
+        Writes the classes of the tiles of a zoom level, water and mixed
+        are lists of (x, y), the other tiles are land. The masks of the
+        mixed tiles are zeros until set with setMask (opened with r+).
+        """
+        tileMinX, tileMinY, tileMaxX, tileMaxY = tileRange
+        width = tileMaxX - tileMinX + 1
+        classes = np.zeros(width * (tileMaxY - tileMinY + 1), dtype=np.uint8)
+
+        def indices(tiles):
+            return np.array([(y - tileMinY) * width + x - tileMinX
+                for (x, y) in tiles], dtype='<u4')
+        classes[indices(water)] = WATER
+        mixedIndices = np.unique(indices(mixed))
+        classes[mixedIndices] = MIXED
+        with open(filePath, 'wb') as f:
+            f.write(_header.pack(_magic, _version, zoom, tileMinX, tileMinY,
+                tileMaxX, tileMaxY, len(mixedIndices)))
+            f.write(classes.tostring())
+            f.write('\0' * (-f.tell() % 8))
+            f.write(mixedIndices.tostring())
+            f.write('\0' * (-f.tell() % 8))
+            # Sparse file, filled by setMask
+            f.truncate(f.tell() + len(mixedIndices) * MASK_SIZE)
+        return cls(filePath, mode='r+')
+
+    def _index(self, x, y):
+        if x < self.tileMinX or x > self.tileMaxX or \
+                y < self.tileMinY or y > self.tileMaxY:
+            return None
+        return (y - self.tileMinY) * self.width + x - self.tileMinX
+
+    def tileClass(self, x, y):
+        i = self._index(x, y)
+        if i is None:
+            return LAND
+        return int(self.classes[i])
+
+    def _slot(self, x, y):
+        i = self._index(x, y)
+        slot = int(np.searchsorted(self.indices, i))
+        if slot == len(self.indices) or self.indices[slot] != i:
+            raise KeyError('Tile %s/%s/%s has no mask' % (self.zoom, x, y))
+        return slot
+
+    def setMask(self, x, y, mask):
+        self.masks[self._slot(x, y)] = np.frombuffer(mask, dtype=np.uint8) \
+            if isinstance(mask, str) else mask
+
+    def mixedTiles(self):
+        for i in self.indices:
+            yield (int(i % self.width) + self.tileMinX,
+                int(i // self.width) + self.tileMinY)
+
+    def mask(self, x, y):
+        """
+        Returns the uint8 mask of a tile, a single pixel for the
+        all land and all water tiles.
+        """
+        tileClass = self.tileClass(x, y)
+        if tileClass == LAND:
+            return np.zeros(1, dtype=np.uint8)
+        elif tileClass == WATER:
+            return np.full(1, 255, dtype=np.uint8)
+        return self.masks[self._slot(x, y)]
+
+    def flush(self):
+        if self.masks is not None:
+            self.masks.flush()
+
+
+class WatermaskStore:
+
+    """
+    Directory of watermask files, one per zoom level.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.zooms = {}
+
+    def filePath(self, z):
+        return os.path.join(self.directory, '%s.watermask' % z)
+
+    def zoom(self, z):
+        if z not in self.zooms:
+            self.zooms[z] = WatermaskZoom(self.filePath(z))
+        return self.zooms[z]
+
+    def mask(self, x, y, z):
+        return self.zoom(z).mask(x, y)
+
+
+# PostGIS WKB raster: endianness, version, number of bands,
+# scale x/y, upper left x/y, skew x/y, srid, width and height
+_rasterHeader = 'BHHddddddiHH'
+_rasterHeaderSize = struct.calcsize('<' + _rasterHeader)
+
+# Pixel type (4 lower bits of the band flags) -> size of the nodata value
+_pixelSizes = {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 2, 6: 2, 7: 4, 8: 4, 10: 4, 11: 8}
+_pixel8BUI = 4
+_bandOffline = 0x80
+
+
+def rasterBand(wkb):
+    """
+    Returns the pixels of the first band of a 8BUI raster in the PostGIS
+    WKB format (as returned by ST_AsBinary) as a uint8 array, without
+    copying them.
+    """
+    byteOrder = '<' if ord(wkb[0]) == 1 else '>'
+    header = struct.unpack_from(byteOrder + _rasterHeader, wkb, 0)
+    nbBands, width, height = header[2], header[-2], header[-1]
+    if nbBands < 1:
+        raise ValueError('Raster without band')
+    flags = ord(wkb[_rasterHeaderSize])
+    pixelType = flags & 0x0f
+    if pixelType != _pixel8BUI or flags & _bandOffline:
+        raise ValueError('Unsupported raster band (flags %s)' % flags)
+    offset = _rasterHeaderSize + 1 + _pixelSizes[pixelType]
+    return np.frombuffer(wkb, dtype=np.uint8, count=width * height, offset=offset)
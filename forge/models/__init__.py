@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
-from sqlalchemy.sql import func, and_
+from sqlalchemy import Table, Column, BigInteger
+from sqlalchemy.sql import func, and_, select
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import FunctionElement, text
 from geoalchemy2.elements import WKBElement
@@ -19,6 +20,14 @@ class create_simplified_geom_table(FunctionElement):
     name = "create_simplified_geom_table"
 
 
+class update_lakes_21781(FunctionElement):
+    name = "update_lakes_21781"
+
+
+class update_simplified_geom_table(FunctionElement):
+    name = "update_simplified_geom_table"
+
+
 @compiles(_interpolate_height_on_plane)
 def _compile_interpolate_height(element, compiler, **kw):
     return "_interpolate_height_on_plane(%s)" % compiler.process(element.clauses)
@@ -34,6 +43,16 @@ def _compile_create_simplified_geom_table(element, compiler, **kw):
     return "create_simplified_geom_table(%s)" % compiler.process(element.clauses)
 
 
+@compiles(update_lakes_21781)
+def _compile_update_lakes_21781(element, compiler, **kw):
+    return "update_lakes_21781(%s)" % compiler.process(element.clauses)
+
+
+@compiles(update_simplified_geom_table)
+def _compile_update_simplified_geom_table(element, compiler, **kw):
+    return "update_simplified_geom_table(%s)" % compiler.process(element.clauses)
+
+
 class Vector(object):
 
     @classmethod
@@ -44,6 +63,32 @@ class Vector(object):
     def geometryColumn(cls):
         return cls.__mapper__.columns['the_geom']
 
+    """
+    Returns the sqlalchemy.Table of the tile keys of the table (one row per
+    feature and tile of a zoom level it intersects), see tileKeysLiteral
+    """
+    @classmethod
+    def tileKeysTable(cls):
+        table = cls.__table__
+        return Table(
+            '%s_tiles' % table.name, table.metadata,
+            Column('tile_key', BigInteger(), nullable=False),
+            Column('id', BigInteger(), nullable=False),
+            schema=table.schema, keep_existing=True
+        )
+
+    """
+    Returns a sqlalchemy filter of the features intersecting a tile
+    (equality lookup on the B-tree index of the tile keys)
+    :params key: The tile key (see GlobalGeodetic.TileKey)
+    """
+    @classmethod
+    def tileKeyIntersects(cls, key):
+        tiles = cls.tileKeysTable()
+        return cls.primaryKeyColumn().in_(
+            select([tiles.c.id]).where(tiles.c.tile_key == key)
+        )
+
     """
     Returns a sqlalchemy.sql.functions.Function clipping function
     :param bbox: A list of 4 coordinates [minX, minY, maxX, maxY]
@@ -130,19 +175,21 @@ class Vector(object):
     :params srid: Spatial reference system numerical ID
     """
     @classmethod
-    def watermaskRasterize(cls, bbox, width=256, height=256, srid=4326):
+    def watermaskRasterize(cls, bbox, width=256, height=256, srid=4326, raw=False):
         geomColumn = cls.geometryColumn()
         bboxGeom = shapelyBBox(bbox)
         wkbGeometry = WKBElement(buffer(bboxGeom.wkb), srid)
+        raster = bgdi_watermask_rasterize(
+            wkbGeometry, width, height,
+            '.'.join((cls.__table_args__['schema'], cls.__tablename__)),
+            geomColumn.name
+        )
+        if raw:
+            # The raster as bytes (PostGIS WKB), see forge.lib.watermask.rasterBand
+            return func.ST_AsBinary(raster)
         # ST_DumpValues(Raster, Band Number, True -> returns None
         # and False -> returns numerical vals)
-        return func.ST_DumpValues(
-            bgdi_watermask_rasterize(
-                wkbGeometry, width, height,
-                '.'.join((cls.__table_args__['schema'], cls.__tablename__)),
-                geomColumn.name
-            ), 1, False
-        )
+        return func.ST_DumpValues(raster, 1, False)
 
 
 """
@@ -169,3 +216,104 @@ def tableExtentLiteral(schemaname, tablename, srid):
                 "FROM (SELECT ST_Collect(ST_Transform(the_geom, %d)) AS r "
                 "FROM %s.%s) AS foo" % (srid, schemaname, tablename)
                 )
+
+
+def _tilesCTE(schemaname, tablename):
+    # Distinct (x, y) of the tiles covered by the bounding boxes of the
+    # features within the tile range of a zoom level
+    return ("WITH tiles AS ("
+            "SELECT DISTINCT gx.x, gy.y FROM %s.%s AS t, "
+            "generate_series("
+            "GREATEST("
+            "CEIL((ST_XMin(t.the_geom) + 180) / :tileSize)::int - 1, :minX), "
+            "LEAST(FLOOR((ST_XMax(t.the_geom) + 180) / :tileSize)::int, :maxX)"
+            ") AS gx(x), "
+            "generate_series("
+            "GREATEST("
+            "CEIL((ST_YMin(t.the_geom) + 90) / :tileSize)::int - 1, :minY), "
+            "LEAST(FLOOR((ST_YMax(t.the_geom) + 90) / :tileSize)::int, :maxY)"
+            ") AS gy(y) "
+            "WHERE t.the_geom && "
+            "ST_MakeEnvelope(:minLon, :minLat, :maxLon, :maxLat, 4326)) " % (
+                schemaname, tablename))
+
+
+"""
+Returns a sqlalchemy.sql.expression.text
+Lists the ranges of x tiles per row (y) covered by the bounding boxes of the
+geometries of a table at a given zoom level of the global geodetic grid.
+Bounds are snapped to the grid server side, a tile touching a bbox counts
+as covered (like the && operator).
+Rows: (y, startX, endX) ordered by y and startX.
+:params schemaname: the schema name
+:params tablename: the table name
+Bind params: tileSize (in degrees), minX, maxX, minY, maxY (tile indices)
+and minLon, minLat, maxLon, maxLat (extent)
+"""
+
+
+def tilesRangesLiteral(schemaname, tablename):
+    return text(_tilesCTE(schemaname, tablename) +
+                "SELECT y, MIN(x) AS startx, MAX(x) AS endx FROM ("
+                "SELECT x, y, "
+                "x - ROW_NUMBER() OVER (PARTITION BY y ORDER BY x) AS grp "
+                "FROM tiles) AS islands "
+                "GROUP BY y, grp ORDER BY y, startx"
+                )
+
+
+"""
+Returns a sqlalchemy.sql.expression.text
+Lists the tiles of a zoom level intersecting the polygons of a table
+(same tests as bgdi_watermask_rasterize).
+Rows: (x, y, inside), inside is true if a polygon contains the whole tile.
+:params schemaname: the schema name
+:params tablename: the table name
+Bind params: same as tilesRangesLiteral
+"""
+
+
+def watermaskTilesLiteral(schemaname, tablename):
+    return text(_tilesCTE(schemaname, tablename) +
+                ", envelopes AS ("
+                "SELECT x, y, ST_MakeEnvelope("
+                "x * :tileSize - 180, y * :tileSize - 90, "
+                "(x + 1) * :tileSize - 180, (y + 1) * :tileSize - 90, 4326) AS env "
+                "FROM tiles) "
+                "SELECT e.x, e.y, bool_or(ST_ContainsProperly(t.the_geom, e.env)) "
+                "AS inside FROM envelopes AS e "
+                "JOIN %s.%s AS t ON ST_Intersects(e.env, t.the_geom) "
+                "GROUP BY e.x, e.y" % (schemaname, tablename)
+                )
+
+
+"""
+Returns a sqlalchemy.sql.expression.text
+Inserts into <tablename>_tiles a row (tile_key, id) per feature and tile of
+a zoom level it intersects, for the features of ids in [minId, maxId].
+Tile keys are computed as in GlobalGeodetic.TileKey.
+:params schemaname: the schema name
+:params tablename: the table name
+Bind params: zoom, tileSize (in degrees), minId and maxId
+"""
+
+
+def tileKeysLiteral(schemaname, tablename):
+    return text("INSERT INTO %s.%s_tiles (tile_key, id) "
+                "SELECT (CAST(:zoom AS bigint) << 56) | (gy.y::bigint << 28) "
+                "| gx.x, t.id "
+                "FROM %s.%s AS t, "
+                "generate_series("
+                "CEIL((ST_XMin(t.the_geom) + 180) / :tileSize)::int - 1, "
+                "FLOOR((ST_XMax(t.the_geom) + 180) / :tileSize)::int"
+                ") AS gx(x), "
+                "generate_series("
+                "CEIL((ST_YMin(t.the_geom) + 90) / :tileSize)::int - 1, "
+                "FLOOR((ST_YMax(t.the_geom) + 90) / :tileSize)::int"
+                ") AS gy(y) "
+                "WHERE t.id BETWEEN :minId AND :maxId "
+                "AND ST_Intersects(t.the_geom, ST_MakeEnvelope("
+                "gx.x * :tileSize - 180, gy.y * :tileSize - 90, "
+                "(gx.x + 1) * :tileSize - 180, (gy.y + 1) * :tileSize - 90, 4326))" % (
+                    schemaname, tablename, schemaname, tablename)
+                )
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import getopt
+from textwrap import dedent
+from forge.configs import tmsConfig
+from forge.lib.helpers import error
+from forge.lib.availability import AvailabilityBitmap, readJournals, parseKey
+
+
+def usage():
+    print(dedent('''\
+        Usage: venv/bin/python forge/scripts/availability_index.py
+               [-o <index>|--output=<index>] [-j <dir>|--journal=<dir>]
+               [-k <file>|--keys=<file>] [-s|--s3] <command> [<args>]
+
+        Commands:
+            build:              build an index of the tiles of the extent
+                                and zoom levels of tms.cfg from a journal
+                                directory (-j), a listing of keys (-k, one
+                                key per line, e.g. the output of
+                                s3_tiles.py list) or the bucket (-s)
+            merge <a> <b>...:   merge indexes into the output (-o)
+            diff <a> <b>:       list the tiles of a missing in b and of b
+                                missing in a
+            query <a> z/x/y...: tell if tiles exist
+            count <a>:          count the tiles per zoom level
+    '''))
+
+
+def emptyIndex():
+    bounds = (
+        tmsConfig.getfloat('Extent', 'minLon'),
+        tmsConfig.getfloat('Extent', 'minLat'),
+        tmsConfig.getfloat('Extent', 'maxLon'),
+        tmsConfig.getfloat('Extent', 'maxLat')
+    )
+    return AvailabilityBitmap(
+        bounds, tmsConfig.getint('Zooms', 'tileMinZ'),
+        tmsConfig.getint('Zooms', 'tileMaxZ'))
+
+
+def listedKeys(keysFile, fromS3):
+    if keysFile is not None:
+        with open(keysFile, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield line.split('\t')[0].strip()
+    if fromS3:
+        # Connects to S3 when imported
+        from forge.lib.boto_conn import getBucket
+        bucketBasePath = tmsConfig.get('General', 'bucketpath')
+        bucket = getBucket()
+        for z in range(tmsConfig.getint('Zooms', 'tileMinZ'),
+                tmsConfig.getint('Zooms', 'tileMaxZ') + 1):
+            for key in bucket.list(prefix='%s%s/' % (bucketBasePath, z)):
+                yield key.name
+
+
+def build(output, journal, keysFile, fromS3):
+    t0 = time.time()
+    index = emptyIndex()
+    count = 0
+    if journal is not None:
+        for (x, y, z) in readJournals(journal):
+            index.add(x, y, z)
+            count += 1
+    bucketBasePath = tmsConfig.get('General', 'bucketpath')
+    for keyName in listedKeys(keysFile, fromS3):
+        xyz = parseKey(keyName, bucketBasePath)
+        if xyz is not None:
+            index.add(*xyz)
+            count += 1
+    index.save(output)
+    print '%s records indexed in %s in %.3fs' % (count, output, time.time() - t0)
+
+
+def merge(output, filePaths):
+    index = AvailabilityBitmap.load(filePaths[0], mmap=False)
+    for filePath in filePaths[1:]:
+        index.merge(AvailabilityBitmap.load(filePath))
+    index.save(output)
+    print '%s indexes merged in %s' % (len(filePaths), output)
+
+
+def diff(filePathA, filePathB):
+    a = AvailabilityBitmap.load(filePathA)
+    b = AvailabilityBitmap.load(filePathB)
+    for (x, y, z) in a.difference(b):
+        print '-\t%s/%s/%s' % (z, x, y)
+    for (x, y, z) in b.difference(a):
+        print '+\t%s/%s/%s' % (z, x, y)
+
+
+def query(filePath, tiles):
+    index = AvailabilityBitmap.load(filePath)
+    for tile in tiles:
+        z, x, y = map(int, tile.split('/'))
+        print '%s\t%s' % (tile, index.contains(x, y, z))
+
+
+def count(filePath):
+    index = AvailabilityBitmap.load(filePath)
+    for z in sorted(index.ranges.keys()):
+        print '%s\t%s' % (z, index.count(z))
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:j:k:s',
+            ['output=', 'journal=', 'keys=', 's3'])
+    except getopt.GetoptError as err:
+        error(str(err), 2, usage=usage)
+
+    output = None
+    journal = None
+    keysFile = None
+    fromS3 = False
+    for o, a in opts:
+        if o in ('-o', '--output'):
+            output = a
+        elif o in ('-j', '--journal'):
+            journal = a
+        elif o in ('-k', '--keys'):
+            keysFile = a
+        elif o in ('-s', '--s3'):
+            fromS3 = True
+
+    if len(args) < 1:
+        error('you must specify a command', 3, usage=usage)
+
+    command = args[0]
+    if command == 'build':
+        if output is None:
+            error('you must specify an output file', 3, usage=usage)
+        if journal is None and keysFile is None and not fromS3:
+            error('you must specify a journal, a keys file or s3', 3, usage=usage)
+        build(output, journal, keysFile, fromS3)
+    elif command == 'merge':
+        if output is None or len(args) < 2:
+            error('you must specify an output file and indexes', 3, usage=usage)
+        merge(output, args[1:])
+    elif command == 'diff':
+        if len(args) != 3:
+            error('you must specify two indexes', 3, usage=usage)
+        diff(args[1], args[2])
+    elif command == 'query':
+        if len(args) < 3:
+            error('you must specify an index and tiles', 3, usage=usage)
+        query(args[1], args[2:])
+    elif command == 'count':
+        if len(args) != 2:
+            error('you must specify an index', 3, usage=usage)
+        count(args[1])
+    else:
+        error("unknown command '%(command)s'" % {'command': command}, 4, usage=usage)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ def usage():
             setupfunctions:     setup custom sql functions
             populate:           imports shapefiles
             populatelakes:      imports lakes shapefile
+            populatetilekeys:   writes the keys of the tiles of the features
             dropuser:           drop the user only
             dropdb:             drop the db only
             destroy:            destroy the database and users
@@ -57,6 +58,8 @@ def main():
         db.populate()
     elif command == 'populatelakes':
         db.populateLakes()
+    elif command == 'populatetilekeys':
+        db.populateTileKeys()
     elif command == 'dropuser':
         db.dropUser()
     elif command == 'dropdb':
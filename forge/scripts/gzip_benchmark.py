@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import gzip
+import time
+import getopt
+import cStringIO
+from textwrap import dedent
+from forge.lib.helpers import error, gzipCompress
+
+
+def usage():
+    print(dedent('''\
+        Usage: venv/bin/python forge/scripts/gzip_benchmark.py
+               [-d <directory>|--directory=<directory>]
+               [-n <repeat>|--repeat=<repeat>]
+
+        Compares the size and the time of the gzip compression of the
+        .terrain files of a directory (uncompressed tiles) for all the
+        compression levels. Default directory: forge/data/quantized-mesh/
+    '''))
+
+
+def legacyGzip(data, compresslevel):
+    compressed = cStringIO.StringIO()
+    gz = gzip.GzipFile(fileobj=compressed, mode='w', compresslevel=compresslevel)
+    gz.write(data)
+    gz.close()
+    return compressed.getvalue()
+
+
+def bench(func, tiles, level, repeat):
+    t0 = time.time()
+    for i in xrange(0, repeat):
+        for data in tiles:
+            func(data, level)
+    tend = time.time()
+    return (tend - t0) / (repeat * len(tiles))
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:n:', ['directory=', 'repeat='])
+    except getopt.GetoptError as err:
+        error(str(err), 2, usage=usage)
+
+    directory = 'forge/data/quantized-mesh/'
+    repeat = 20
+    for o, a in opts:
+        if o in ('-d', '--directory'):
+            directory = a
+        elif o in ('-n', '--repeat'):
+            repeat = int(a)
+
+    if not os.path.isdir(directory):
+        error('%s is not a directory' % directory, 1, usage=usage)
+
+    tiles = []
+    for fileName in sorted(os.listdir(directory)):
+        if fileName.endswith('.terrain'):
+            with open(os.path.join(directory, fileName), 'rb') as f:
+                tiles.append(f.read())
+    if len(tiles) == 0:
+        error('no .terrain file found in %s' % directory, 1, usage=usage)
+
+    rawSize = sum([len(t) for t in tiles])
+    print '%s tiles, %s bytes uncompressed, %s repetitions' % (
+        len(tiles), rawSize, repeat)
+    print '%-6s %-6s %12s %8s %14s %13s' % (
+        'path', 'level', 'bytes', 'ratio', 'ms per tile', 'deterministic')
+    for level in range(1, 10):
+        for name, func in (('gzip', legacyGzip), ('zlib', gzipCompress)):
+            first = [func(t, level) for t in tiles]
+            duration = bench(func, tiles, level, repeat)
+            # The gzip header of the legacy path embeds the time in seconds
+            time.sleep(1)
+            deterministic = first == [func(t, level) for t in tiles]
+            size = sum([len(c) for c in first])
+            print '%-6s %-6s %12s %8.3f %14.3f %13s' % (
+                name, level, size, float(size) / rawSize, duration * 1000,
+                deterministic)
+
+
+if __name__ == '__main__':
+    main()
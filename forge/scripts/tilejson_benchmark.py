@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import random
+import getopt
+from textwrap import dedent
+from forge.lib.helpers import error, GzipWriter
+from forge.layers.metadata import LayerMetadata
+
+# Whole switzerland
+swissBounds = [5.86725126512748, 45.8026860136571, 10.9209100671547, 47.8661652478939]
+
+
+def usage():
+    print(dedent('''\
+        Usage: venv/bin/python forge/scripts/tilejson_benchmark.py
+               [-z <zoom>|--zoom=<zoom>] [-r <ratio>|--ratio=<ratio>]
+               [-l|--legacy]
+
+        Removes a random ratio of tiles (default 0.3) of the swiss extent
+        at a given zoom level (default 17) from the availability model
+        and generates the layer.json (streamed and gzipped, then in memory).
+        With -l, the removals are also timed using the former per row list
+        of ranges (very slow at high zooms).
+    '''))
+
+
+def legacyCreateRanges(minVal, maxVal, breakVal):
+    if breakVal == minVal and breakVal == maxVal:
+        return []
+    elif breakVal == minVal:
+        return [[breakVal + 1, maxVal]]
+    elif breakVal == maxVal:
+        return [[minVal, breakVal - 1]]
+    elif breakVal > minVal and breakVal < maxVal:
+        return [[minVal, breakVal - 1], [breakVal + 1, maxVal]]
+    return [[minVal, maxVal]]
+
+
+def legacyRemoveTiles(holes, tileMinX, tileMaxX):
+    ranges = {}
+    for (x, y) in holes:
+        if y not in ranges:
+            ranges[y] = legacyCreateRanges(tileMinX, tileMaxX, x)
+        else:
+            newRanges = []
+            for r in ranges[y]:
+                newRanges += legacyCreateRanges(r[0], r[1], x)
+            ranges[y] = newRanges
+    return ranges
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'z:r:l', ['zoom=', 'ratio=', 'legacy'])
+    except getopt.GetoptError as err:
+        error(str(err), 2, usage=usage)
+
+    zoom = 17
+    ratio = 0.3
+    legacy = False
+    for o, a in opts:
+        if o in ('-z', '--zoom'):
+            zoom = int(a)
+        elif o in ('-r', '--ratio'):
+            ratio = float(a)
+        elif o in ('-l', '--legacy'):
+            legacy = True
+
+    tMeta = LayerMetadata(
+        bounds=swissBounds, minzoom=zoom, maxzoom=zoom, baseUrls=['//localhost/']
+    )
+    tileMinX, tileMaxX = tMeta.metadata[zoom]['x']
+    tileMinY, tileMaxY = tMeta.metadata[zoom]['y']
+    nbTiles = (tileMaxX - tileMinX + 1) * (tileMaxY - tileMinY + 1)
+
+    random.seed(zoom)
+    holes = []
+    for y in xrange(tileMinY, tileMaxY + 1):
+        for x in xrange(tileMinX, tileMaxX + 1):
+            if random.random() < ratio:
+                holes.append((x, y))
+    # Removals usually don't come sorted (pool of processes)
+    random.shuffle(holes)
+    print 'Zoom %s: %s tiles, %s holes' % (zoom, nbTiles, len(holes))
+
+    t0 = time.time()
+    for (x, y) in holes:
+        tMeta.removeTile(x, y, zoom)
+    t1 = time.time()
+    streamed = GzipWriter(open(os.devnull, 'wb'))
+    tMeta.writeJSON(streamed)
+    streamed.close()
+    t2 = time.time()
+    print 'removeTile: %.3fs (%.0f removals/sec)' % (
+        t1 - t0, len(holes) / max(t1 - t0, 1e-6))
+    print 'writeJSON (gzip): %.3fs (%s bytes)' % (t2 - t1, streamed._size)
+
+    t1 = time.time()
+    content = tMeta.toJSON()
+    t2 = time.time()
+    print 'toJSON: %.3fs (%s rectangles, %s bytes)' % (
+        t2 - t1, len(tMeta.meta['available'][zoom]), len(content))
+
+    if legacy:
+        t0 = time.time()
+        legacyRemoveTiles(holes, tileMinX, tileMaxX)
+        t1 = time.time()
+        print 'legacy removeTile: %.3fs (%.0f removals/sec)' % (
+            t1 - t0, len(holes) / max(t1 - t0, 1e-6))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,11 @@ import os
 import sys
 import time
 import json
-import random
 import datetime
 import sqlalchemy
-import cStringIO
+import tempfile
 import ConfigParser
-import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 from sqlalchemy import Column
 from sqlalchemy.orm import scoped_session, sessionmaker
@@ -21,11 +20,12 @@ from forge.models import Vector, tableExtentLiteral
 from forge.lib.global_geodetic import GlobalGeodetic
 from forge.layers.metadata import LayerMetadata
 from forge.lib.helpers import timestamp, degreesToMeters
-from forge.lib.tiles import Tiles
+from forge.lib.tiles import Tiles, isInside, getOption
 from forge.lib.logs import getLogger
-from forge.lib.helpers import gzipFileObject, resourceExists
+from forge.lib.helpers import GzipWriter
 from forge.lib.boto_conn import getBucket, writeToS3
 from forge.lib.poolmanager import PoolManager
+from forge.lib.existence import ExistenceChecker, missingFromKeys
 
 
 loggingConfig = ConfigParser.RawConfigParser()
@@ -61,7 +61,7 @@ def scanLayer(tile, session, model, sridFrom, sridTo, metaBuffer, tilecount):
         logger.error(e, exc_info=True)
 
 
-def getEngine(params):
+def getEngine(params, **kwargs):
     connInfo = 'postgresql+psycopg2://%(user)s:%(password)s@%(host)s:' \
         '%(port)d/%(database)s'
     engine = sqlalchemy.create_engine(connInfo % dict(
@@ -70,7 +70,7 @@ def getEngine(params):
         host=params.dbHost,
         port=params.dbPort,
         database=params.dbName
-    ))
+    ), **kwargs)
     return engine
 
 
@@ -86,9 +86,15 @@ def getOrmModel(pkColumnName, pkColumnType, params):
 
 
 class AttributeDict(dict):
-    __getattr__ = dict.__getitem__
     __setattr__ = dict.__setitem__
 
+    # AttributeError is expected by pickle (sent to the sub processes)
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
 
 def parseModelBasedLayer(dbConfig, layerConfig):
     try:
@@ -132,6 +138,9 @@ def parseTerrainBasedLayer(layerConfig):
             maxZoom        = layerConfig.getint('Grid', 'maxZoom'),
             maxScanZoom    = layerConfig.getint('Grid', 'maxScanZoom'),
             fullonly       = layerConfig.getint('Grid', 'fullonly'),
+            existence      = getOption(layerConfig, 'Grid', 'existence', 'head'),
+            threads        = getOption(layerConfig, 'Grid', 'threads', 32, 'getint'),
+            rate           = getOption(layerConfig, 'Grid', 'rate', None, 'getfloat'),
             name           = layerConfig.get('Metadata', 'name'),
             format         = layerConfig.get('Metadata', 'format'),
             tileTemplate   = layerConfig.get('Metadata', 'tileTemplate'),
@@ -153,6 +162,70 @@ def getBaseUrls(params):
     return baseUrls
 
 
+# One engine per worker process with a single pooled connection
+_workerState = {}
+
+
+def _getWorkerModel(params, pkColumnName, pkColumnType):
+    pid = os.getpid()
+    if _workerState.get('pid') != pid:
+        engine = getEngine(params, pool_size=1, max_overflow=0)
+        _workerState.update(dict(
+            pid=pid,
+            engine=engine,
+            session=scoped_session(sessionmaker(bind=engine)),
+            model=getOrmModel(pkColumnName, pkColumnType, params)
+        ))
+    return _workerState['session'], _workerState['model']
+
+
+def scanRows(unit):
+    """
+    Scans a range of rows of a zoom level and returns
+    (zoom, {y: [x1,...,xn]}, nbTiles) with the tiles without geometry.
+    """
+    (params, pkColumnName, pkColumnType, bounds, zoom,
+        rowStart, rowEnd, metaBuffer, t0) = unit
+    geodetic = GlobalGeodetic(True)
+    tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], zoom)
+    tileMaxX, tileMaxY = geodetic.LonLatToTile(bounds[2], bounds[3], zoom)
+    holes = {}
+    nbTiles = 0
+    try:
+        session, model = _getWorkerModel(params, pkColumnName, pkColumnType)
+        for tileY in xrange(rowStart, rowEnd + 1):
+            for tileX in xrange(tileMinX, tileMaxX + 1):
+                tilebounds = geodetic.TileBounds(tileX, tileY, zoom)
+                if params.fullonly and not isInside(tilebounds, bounds):
+                    continue
+                nbTiles += 1
+                noGeom = scanLayer(
+                    (tilebounds, (tileX, tileY, zoom), t0), session, model,
+                    params.sridFrom, params.sridTo, metaBuffer, nbTiles
+                )
+                if noGeom:
+                    holes.setdefault(tileY, []).append(tileX)
+        session.remove()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise Exception(e)
+    return (zoom, holes, nbTiles)
+
+
+def rowPartitions(params, bounds, buffers, pkColumn, t0, numProcs):
+    geodetic = GlobalGeodetic(True)
+    for zoom in range(params.minZoom, params.maxScanZoom + 1):
+        tileMinX, tileMinY = geodetic.LonLatToTile(bounds[0], bounds[1], zoom)
+        tileMaxX, tileMaxY = geodetic.LonLatToTile(bounds[2], bounds[3], zoom)
+        # Several units per process to balance the load
+        nbRows = tileMaxY - tileMinY + 1
+        step = max(1, nbRows // (numProcs * 4))
+        for rowStart in xrange(tileMinY, tileMaxY + 1, step):
+            rowEnd = min(rowStart + step - 1, tileMaxY)
+            yield (params, pkColumn[0], pkColumn[1], bounds, zoom,
+                rowStart, rowEnd, buffers.get(zoom, 0.), t0)
+
+
 def createModelBasedTileJSON(params):
     tilecount = 0
     t0 = time.time()
@@ -171,7 +244,6 @@ def createModelBasedTileJSON(params):
     pkColumn = table.primary_key.columns.items()[0]
     pkColumnName = pkColumn[0].__str__()
     pkColumnType = pkColumn[1].type.__class__
-    model = getOrmModel(pkColumnName, pkColumnType, params)
     # Bounds generated from DB
     try:
         conn = engine.connect()
@@ -187,46 +259,39 @@ def createModelBasedTileJSON(params):
         raise Exception(e)
     finally:
         conn.close()
+        # Connections can't be shared with the sub processes
+        engine.dispose()
 
     # pre-calculate the maximazed buffers in degrees
+    buffers = {}
     if params.pxTolerance:
         geodetic = GlobalGeodetic(True)
-        buffers = {}
-        for z in range(params.minZoom, params.maxZoom):
+        for z in range(params.minZoom, params.maxScanZoom + 1):
             buffers[z] = degreesToMeters(
                 geodetic.Resolution(z) * float(params.pxTolerance)
             )
 
-    try:
-        session = scoped_session(sessionmaker(bind=engine))
-        # We usually don't scan the last levels
-        tiles = Tiles(
-            bounds, params.minZoom, params.maxScanZoom,
-            t0, params.fullonly
-        )
-        tMeta = LayerMetadata(
-            bounds=bounds, minzoom=params.minZoom,
-            maxzoom=params.maxZoom, baseUrls=baseUrls,
-            description=params.description, attribution=params.attribution,
-            name=params.name
-        )
-        for tile in tiles:
-            metaBuffer = 0.
-            tilecount += 1
-            if params.pxTolerance:
-                xyz = tile[1]
-                metaBuffer = buffers[xyz[2]]
-
-            noGeom = scanLayer(
-                tile, session, model, params.sridFrom,
-                params.sridTo, metaBuffer, tilecount
-            )
-            if noGeom:
-                tMeta.removeTile(noGeom[0], noGeom[1], noGeom[2])
-    finally:
-        session.close()
-        engine.dispose()
-    return (tMeta.toJSON(), tilecount)
+    tMeta = LayerMetadata(
+        bounds=bounds, minzoom=params.minZoom,
+        maxzoom=params.maxZoom, baseUrls=baseUrls,
+        description=params.description, attribution=params.attribution,
+        name=params.name
+    )
+    # We usually don't scan the last levels
+    pm = PoolManager(logger=logger, factor=1, store=True)
+    units = rowPartitions(
+        params, bounds, buffers, (pkColumnName, pkColumnType), t0,
+        pm.numOfProcesses()
+    )
+    pm.process(units, scanRows, 1)
+    for (zoom, holes, nbTiles) in pm.results:
+        tMeta.addHoles(zoom, holes)
+        tilecount += nbTiles
+
+    tend = time.time()
+    logger.info('%s tiles scanned (%.1f tiles/sec)' % (
+        tilecount, tilecount / max(tend - t0, 1e-6)))
+    return (tMeta, tilecount)
 
 
 def createTerrainBasedTileJSON(params):
@@ -268,75 +333,74 @@ def createTerrainBasedTileJSON(params):
             ))
     return json.dumps(terrainConfig)
 
-tilecount = multiprocessing.Value('i', 0)
-tileskipped = multiprocessing.Value('i', 0)
-# Return None if the tile exists and a list with x,y,z coordinates otherwise
 
+def layerTiles(params):
+    t0 = time.time()
+    tiles = Tiles(
+        params.bounds, params.minZoom, params.maxScanZoom,
+        t0, fullonly=params.fullonly
+    )
+    for (bounds, tileXYZ, t0) in tiles:
+        yield tileXYZ
 
-def tileNotExists(tile):
-    h = {'Referer': 'http://geo.admin.ch'}
-    (bounds, tileXYZ, t0, basePath, tFormat, gridOrigin, tilesURLs) = tile
-    # Only native tiles for now
-    entryPoint = 'http:%s' % (random.choice(tilesURLs))
-
-    # Account for a different origin
-    if gridOrigin == 'topLeft':
-        geodetic = GlobalGeodetic(True)
-        nbYTiles = geodetic.GetNumberOfYTilesAtZoom(tileXYZ[2])
-        tilexyz = (tileXYZ[0], nbYTiles - tileXYZ[1] - 1, tileXYZ[2])
-        tileAdress = '/'.join((str(tilexyz[2]), str(tilexyz[1]), str(tilexyz[0])))
-    else:
-        tileAdress = '/'.join((str(tileXYZ[2]), str(tileXYZ[1]), str(tileXYZ[0])))
 
-    url = '%s%s%s.%s' % (entryPoint, basePath, tileAdress, tFormat)
-    tilecount.value += 1
+def listBucketKeys(basePath, zooms, threads):
+    def listZoom(zoom):
+        bucket = getBucket()
+        return [k.name for k in bucket.list(prefix='%s%s/' % (basePath, zoom))]
 
+    pool = ThreadPool(threads)
     try:
-        exists = resourceExists(url, headers=h)
-    except Exception as e:
-        logger.error('Connection Error', exc_info=True)
-        logger.error('%s was skipped' % url, exc_info=True)
-        raise Exception(e)
-
-    if not exists:
-        tileskipped.value += 1
-    if tilecount.value % 1000 == 0:
-        tend = time.time()
-        logger.info('It took %s to (HEAD) request %s tiles. %s skipped' % (
-            str(datetime.timedelta(seconds=tend - t0)),
-            tilecount.value, tileskipped.value)
-        )
-        logger.info('Last tile checked:')
-        logger.info(url)
-    if not exists:
-        # Return everything in terrain coordinates
-        # e.g. starting at the bottom left (Transformation is performed in Cesium)
-        # https://github.com/camptocamp/cesium/blob/c2c_patches/Source/
-        #     Scene/UrlTemplateImageryProvider.js#L500
-        return tileXYZ
+        for names in pool.imap_unordered(listZoom, zooms):
+            for name in names:
+                yield name
+    finally:
+        pool.terminate()
+        pool.join()
 
 
+# Return everything in terrain coordinates
+# e.g. starting at the bottom left (Transformation is performed in Cesium)
+# https://github.com/camptocamp/cesium/blob/c2c_patches/Source/
+#     Scene/UrlTemplateImageryProvider.js#L500
 def createS3BasedTileJSON(params):
     t0 = time.time()
-    maxChunks = 50
     baseUrls = getBaseUrls(params)
-    tiles = Tiles(
-        params.bounds, params.minZoom, params.maxScanZoom,
-        t0, fullonly=params.fullonly, basePath=params.bucketBasePath,
-        tFormat=params.format, gridOrigin=params.gridOrigin,
-        tilesURLs=params.tilesURLs
-    )
-    pm = PoolManager(logger=logger, factor=1, store=True)
     tMeta = LayerMetadata(
         bounds=params.bounds, minzoom=params.minZoom,
         maxzoom=params.maxZoom, baseUrls=baseUrls,
         description=params.description, attribution=params.attribution,
         format=params.format, name=params.name
     )
-    pm.process(tiles, tileNotExists, maxChunks)
-    for xyz in pm.results:
+    if params.existence == 'listing':
+        # Our own bucket: the existence is derived from the keys names
+        zooms = range(params.minZoom, params.maxScanZoom + 1)
+        keyNames = listBucketKeys(params.bucketBasePath, zooms, params.threads)
+        missing = missingFromKeys(
+            keyNames, params.bucketBasePath, params.format, params.gridOrigin,
+            layerTiles(params))
+    else:
+        checker = ExistenceChecker(
+            params.tilesURLs, params.bucketBasePath, params.format,
+            params.gridOrigin, headers={'Referer': 'http://geo.admin.ch'},
+            threads=params.threads, rate=params.rate
+        )
+        missing = checker.missingTiles(layerTiles(params))
+
+    tilecount = 0
+    for xyz in missing:
         tMeta.removeTile(xyz[0], xyz[1], xyz[2])
-    return tMeta.toJSON()
+        tilecount += 1
+        if tilecount % 1000 == 0:
+            logger.info('%s missing tiles found in %s' % (
+                tilecount, str(datetime.timedelta(seconds=time.time() - t0))))
+    tend = time.time()
+    logger.info('%s missing tiles found in %s' % (
+        tilecount, str(datetime.timedelta(seconds=tend - t0))))
+    if params.existence != 'listing':
+        logger.info('%s tiles (HEAD) requested (%.1f requests/sec)' % (
+            checker.counter, checker.counter / max(tend - t0, 1e-6)))
+    return tMeta
 
 
 def main(template):
@@ -354,22 +418,26 @@ def main(template):
         # params = parseTerrainBasedLayer(layerConfig)
         # tileJSON = createTerrainBasedTileJSON(params)
         params = parseTerrainBasedLayer(layerConfig)
-        tileJSON = createS3BasedTileJSON(params)
+        tMeta = createS3BasedTileJSON(params)
     else:
         dbConfig = ConfigParser.RawConfigParser()
         dbConfig.read('configs/raster/database.cfg')
         params = parseModelBasedLayer(dbConfig, layerConfig)
-        (tileJSON, tilecount) = createModelBasedTileJSON(params)
+        (tMeta, tilecount) = createModelBasedTileJSON(params)
 
     # Same bucket for now
     bucket = getBucket()
-    fileObj = cStringIO.StringIO()
-    fileObj.write(tileJSON)
-    fileObj = gzipFileObject(fileObj)
+    # Streamed and compressed on the fly, the content is never held in memory
+    fileObj = tempfile.TemporaryFile()
+    gz = GzipWriter(fileObj)
+    tMeta.writeJSON(gz)
+    gz.close()
+    fileObj.seek(0)
     logger.info('Uploading %slayer.json to S3' % params.bucketBasePath)
 
     writeToS3(bucket, 'layer.json', fileObj, 'tilejson', params.bucketBasePath,
         contentType='application/json')
+    fileObj.close()
     logger.info('layer.json has been uploaded successfully')
 
     if tilecount:
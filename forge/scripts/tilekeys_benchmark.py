@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import random
+import getopt
+from textwrap import dedent
+from forge.db import DB
+from forge.lib.helpers import error
+from forge.lib.global_geodetic import GlobalGeodetic
+from forge.models.tables import modelsPyramid
+
+# Whole switzerland
+swissBounds = [5.86725126512748, 45.8026860136571, 10.9209100671547, 47.8661652478939]
+
+
+def usage():
+    print(dedent('''\
+        Usage: venv/bin/python forge/scripts/tilekeys_benchmark.py
+               [-c database.cfg|--config=database.cfg]
+               [-z <zoom>|--zoom=<zoom>] [-n <number>|--number=<number>]
+
+        Queries the features of random tiles of the swiss extent at a given
+        zoom level (default 17) by their bbox (GiST index) and by their tile
+        key (B-tree index, see db_management.py populatetilekeys) and compares
+        the timings and the results (default 200 tiles).
+    '''))
+
+
+def timeQueries(session, tiles, toFilter):
+    results = []
+    t0 = time.time()
+    for tile in tiles:
+        results.append(set([q.id for q in toFilter(tile).all()]))
+    return time.time() - t0, results
+
+
+def main():
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'c:z:n:',
+            ['config=', 'zoom=', 'number='])
+    except getopt.GetoptError as err:
+        error(str(err), 2, usage=usage)
+
+    dbConfigFile = 'configs/terrain/database.cfg'
+    zoom = 17
+    number = 200
+    for o, a in opts:
+        if o in ('-c', '--config'):
+            dbConfigFile = a
+        elif o in ('-z', '--zoom'):
+            zoom = int(a)
+        elif o in ('-n', '--number'):
+            number = int(a)
+
+    model = modelsPyramid.getModelByZoom(zoom)
+    if model is None:
+        error('no table for zoom %s' % zoom, 3, usage=usage)
+
+    geodetic = GlobalGeodetic(True)
+    tileMinX, tileMinY = geodetic.LonLatToTile(swissBounds[0], swissBounds[1], zoom)
+    tileMaxX, tileMaxY = geodetic.LonLatToTile(swissBounds[2], swissBounds[3], zoom)
+    random.seed(zoom)
+    tiles = [(random.randint(tileMinX, tileMaxX), random.randint(tileMinY, tileMaxY))
+        for i in xrange(0, number)]
+    print 'Zoom %s: %s random tiles of %s.%s' % (
+        zoom, number, model.__table__.schema, model.__tablename__)
+
+    db = DB(dbConfigFile)
+    with db.userSession() as session:
+        def byBBox(tile):
+            bounds = geodetic.TileBounds(tile[0], tile[1], zoom)
+            return session.query(model.id).filter(model.bboxIntersects(bounds))
+
+        def byKey(tile):
+            key = geodetic.TileKey(tile[0], tile[1], zoom)
+            return session.query(model.id).filter(model.tileKeyIntersects(key))
+
+        # Warm up the caches of both indexes
+        timeQueries(session, tiles[:10], byBBox)
+        timeQueries(session, tiles[:10], byKey)
+        tBBox, bboxResults = timeQueries(session, tiles, byBBox)
+        tKey, keyResults = timeQueries(session, tiles, byKey)
+
+    nbFeatures = sum([len(r) for r in bboxResults])
+    print 'GiST (bbox): %.3fs (%.1f ms per tile, %s features)' % (
+        tBBox, 1000 * tBBox / max(number, 1), nbFeatures)
+    print 'B-tree (tile key): %.3fs (%.1f ms per tile, %s features)' % (
+        tKey, 1000 * tKey / max(number, 1), sum([len(r) for r in keyResults]))
+    mismatches = len([1 for a, b in zip(bboxResults, keyResults) if a != b])
+    if mismatches:
+        print '%s tiles with different features' % mismatches
+
+
+if __name__ == '__main__':
+    main()
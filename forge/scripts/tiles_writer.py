@@ -24,10 +24,9 @@ bucketBasePath = tmsConfig.get('General', 'bucketpath')
 for f in shapefilesNames:
     filePathSource = basePath + f
     shapefile = ShpToGDALFeatures(shpFilePath=filePathSource)
-    features = shapefile.__read__()
 
-    terrainTopo = TerrainTopology(features=features)
-    terrainTopo.fromGDALFeatures()
+    terrainTopo = TerrainTopology()
+    terrainTopo.fromTriangles(shapefile.getTriangles())
     terrainFormat = TerrainTile()
     terrainFormat.fromTerrainTopology(terrainTopo)
 
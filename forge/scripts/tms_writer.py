@@ -18,6 +18,8 @@ def usage():
         Commands:
             create:            create the tiles and write them to S3
             metadata:          create the metadata file (layer.json)
+            watermask:         rasterize the lakes once per zoom level into
+                               the watermask store (watermaskstore)
             stats:             provides a report containing the stats
                                for a given TMS config
             statsnodb:         provides a short report containing the stats
@@ -51,6 +53,8 @@ def main():
         tiler.create()
     elif command == 'metadata':
         tiler.metadata()
+    elif command == 'watermask':
+        tiler.watermask()
     elif command == 'stats':
         tiler.stats()
     elif command == 'statsnodb':
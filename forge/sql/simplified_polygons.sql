@@ -23,3 +23,78 @@ BEGIN
 END
 $func$
 LANGUAGE plpgsql;
+
+-- lakes in 21781 keyed by the hash of their geometry, only the lakes
+-- which changed since the last call are transformed
+CREATE OR REPLACE FUNCTION update_lakes_21781()
+RETURNS integer AS $func$
+DECLARE
+  inserted integer;
+BEGIN
+  CREATE TABLE IF NOT EXISTS public.lakes_21781 (
+    geomhash text PRIMARY KEY,
+    id bigint,
+    the_geom geometry
+  );
+  CREATE TEMP TABLE lakes_hashes AS (
+    SELECT DISTINCT ON (geomhash) md5(ST_AsEWKB(the_geom)) AS geomhash, id, the_geom
+    FROM public.lakes
+    ORDER BY geomhash, id
+  );
+  DELETE FROM public.lakes_21781 p
+    WHERE NOT EXISTS (SELECT 1 FROM lakes_hashes h WHERE h.geomhash = p.geomhash);
+  INSERT INTO public.lakes_21781
+    SELECT h.geomhash, h.id, ST_Transform(h.the_geom, 21781)
+    FROM lakes_hashes h
+    WHERE NOT EXISTS (SELECT 1 FROM public.lakes_21781 p WHERE p.geomhash = h.geomhash);
+  GET DIAGNOSTICS inserted = ROW_COUNT;
+  DROP TABLE lakes_hashes;
+  RETURN inserted;
+END
+$func$
+LANGUAGE plpgsql;
+
+-- incremental version of create_simplified_geom_table based on lakes_21781,
+-- only the new or changed lakes are simplified (all of them if the
+-- tolerance changed), returns the number of simplified lakes
+CREATE OR REPLACE FUNCTION update_simplified_geom_table(tablename name, tolerance float)
+RETURNS integer AS $func$
+DECLARE
+  inserted integer;
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = tablename
+    AND column_name = 'geomhash'
+  ) THEN
+    EXECUTE format('DROP TABLE IF EXISTS public.%I', tablename);
+    EXECUTE format('CREATE TABLE public.%I (
+      id bigint,
+      geomhash text PRIMARY KEY,
+      tolerance float,
+      the_geom geometry
+    )', tablename);
+    EXECUTE format('CREATE INDEX %I ON public.%I USING gist (the_geom)',
+      tablename || '_geom_idx', tablename);
+  END IF;
+
+  EXECUTE format('DELETE FROM public.%I s WHERE s.tolerance <> %L OR NOT EXISTS (
+    SELECT 1 FROM public.lakes_21781 p WHERE p.geomhash = s.geomhash)',
+    tablename, tolerance);
+  EXECUTE format('INSERT INTO public.%I
+    SELECT * FROM (SELECT
+      p.id,
+      p.geomhash,
+      %L::float AS tolerance,
+      ST_Transform(ST_SimplifyPreserveTopology(p.the_geom, %L), 4326) AS the_geom
+    FROM public.lakes_21781 p
+    WHERE NOT EXISTS (SELECT 1 FROM public.%I s WHERE s.geomhash = p.geomhash)
+    ) AS simple_lakes
+    WHERE simple_lakes.the_geom IS NOT NULL AND ST_IsValid(simple_lakes.the_geom)',
+    tablename, tolerance, tolerance, tablename);
+  GET DIAGNOSTICS inserted = ROW_COUNT;
+  EXECUTE format('ANALYZE public.%I', tablename);
+  RETURN inserted;
+END
+$func$
+LANGUAGE plpgsql;
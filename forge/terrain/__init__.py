@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
 import cStringIO
+import numpy as np
 import osgeo.ogr as ogr
 import osgeo.osr as osr
 from collections import OrderedDict
@@ -9,7 +11,7 @@ from forge.terrain.topology import TerrainTopology
 from forge.lib.bounding_sphere import BoundingSphere
 import forge.lib.horizon_occlusion_point as occ
 from forge.lib.oct_encoding import octEncode, octDecode
-from forge.lib.helpers import zigZagDecode, zigZagEncode, transformCoordinate
+from forge.lib.helpers import zigZagDecode, zigZagEncode, transformCoordinates
 from forge.lib.decoders import (
     unpackEntry, unpackIndices, decodeIndices, packEntry, packIndices, encodeIndices
 )
@@ -26,6 +28,27 @@ def lerp(p, q, time):
 # http://cesiumjs.org/data-and-assets/terrain/formats/quantized-mesh-1.0.html
 
 
+def watermaskArray(watermask):
+    """
+    Returns a watermask (bytes, uint8 array or rows of pixels) as a 256 x 256
+    or 1 x 1 (all land or all water) uint8 array.
+    """
+    if isinstance(watermask, (str, buffer)):
+        watermask = np.frombuffer(watermask, dtype=np.uint8)
+    elif not isinstance(watermask, np.ndarray):
+        # Rows of pixels, missing values are land
+        watermask = np.array([[0 if p is None else p for p in row]
+            for row in watermask], dtype=np.uint8)
+    if watermask.size == TILEPXS:
+        watermask = watermask.reshape(256, 256)
+    elif watermask.size == 1:
+        watermask = watermask.reshape(1, 1)
+    if watermask.shape not in ((256, 256), (1, 1)):
+        raise Exception(
+            'Unexpected shape of the watermask: %s' % str(watermask.shape))
+    return watermask.astype(np.uint8, copy=False)
+
+
 class TerrainTile:
     quantizedMeshHeader = OrderedDict([
         ['centerX', 'd'],  # 8bytes
@@ -93,6 +116,10 @@ class TerrainTile:
         ['xy', 'B']
     ])
 
+    Metadata = OrderedDict([
+        ['jsonLength', 'I']
+    ])
+
     BYTESPLIT = 65636
 
     # Coordinates are given in lon/lat WSG84
@@ -114,6 +141,8 @@ class TerrainTile:
         self.vLight = []
         self.watermask = kwargs.get('watermask', [])
         self.hasWatermask = kwargs.get('hasWatermask', bool(len(self.watermask) > 0))
+        # e.g. {'available': [[{startX, startY, endX, endY},...],...]}
+        self.metadata = kwargs.get('metadata')
 
         self.header = OrderedDict()
         for k, v in TerrainTile.quantizedMeshHeader.iteritems():
@@ -153,14 +182,16 @@ class TerrainTile:
 
     def getContentType(self):
         baseContent = 'application/vnd.quantized-mesh'
-        if self.hasLighting and self.hasWatermask:
-            return baseContent + ';extensions=octvertexnormals-watermask'
-        elif self.hasLighting:
-            return baseContent + ';extensions=octvertexnormals'
-        elif self.hasWatermask:
-            return baseContent + ';extensions=watermask'
-        else:
-            return baseContent
+        extensions = []
+        if self.hasLighting:
+            extensions.append('octvertexnormals')
+        if self.hasWatermask:
+            extensions.append('watermask')
+        if self.metadata is not None:
+            extensions.append('metadata')
+        if extensions:
+            return baseContent + ';extensions=' + '-'.join(extensions)
+        return baseContent
 
     def getVerticesCoordinates(self, epsg=4326):
         coordinates = []
@@ -203,19 +234,17 @@ class TerrainTile:
     def _reprojectVerticesCoordinates(self, epsg):
         if self.targetEPSG != epsg:
             self._resetReprojectedVerticesCoordinates()
-        if len(self._easts) == 0:
+        if len(self._easts) == 0 and len(self._longs) > 0:
             self.targetEPSG = epsg
-            for i, lon in enumerate(self._longs):
-                lat = self._lats[i]
-                height = self._heights[i]
-                point = 'POINT (%f %f %f)' % (lon, lat, height)
-                p = transformCoordinate(point, 4326, epsg)
-                self._easts.append(p.GetX())
-                self._norths.append(p.GetY())
-                self._alts.append(p.GetZ())
+            # All the vertices at once
+            easts, norths, alts = transformCoordinates(
+                self._longs, self._lats, self._heights, 4326, epsg)
+            self._easts = easts.tolist()
+            self._norths = norths.tolist()
+            self._alts = alts.tolist()
 
     def fromFile(self, filePath, west, east, south, north,
-            hasLighting=False, hasWatermask=False):
+            hasLighting=False, hasWatermask=False, hasMetadata=False):
         self.__init__(west=west, east=east, south=south, north=north)
         self.hasLighting = hasLighting
         self.hasWatermask = hasWatermask
@@ -293,14 +322,15 @@ class TerrainTile:
                 extensionId = unpackEntry(f, meta['extensionId'])
                 if extensionId == 2:
                     extensionLength = unpackEntry(f, meta['extensionLength'])
-                    row = []
-                    for i in xrange(0, extensionLength):
-                        row.append(unpackEntry(f, TerrainTile.WaterMask['xy']))
-                        if len(row) == 256:
-                            self.watermask.append(row)
-                            row = []
-                    if len(row) > 0:
-                        self.watermask.append(row)
+                    self.watermask = watermaskArray(f.read(extensionLength))
+
+            if hasMetadata:
+                meta = TerrainTile.ExtensionHeader
+                extensionId = unpackEntry(f, meta['extensionId'])
+                if extensionId == 4:
+                    unpackEntry(f, meta['extensionLength'])
+                    jsonLength = unpackEntry(f, TerrainTile.Metadata['jsonLength'])
+                    self.metadata = json.loads(f.read(jsonLength))
 
             data = f.read(1)
             if data:
@@ -406,30 +436,25 @@ class TerrainTile:
             # Extension header ID is 2 for lightening
             meta = TerrainTile.ExtensionHeader
             f.write(packEntry(meta['extensionId'], 2))
-            # Extension header meta
-            nbRows = len(self.watermask)
-            if nbRows > 1:
+            # Rows from North to South, pixels from West to East
+            watermask = watermaskArray(self.watermask)
+            if watermask.min() == watermask.max():
+                # All land or all water, a single pixel
+                f.write(packEntry(meta['extensionLength'], 1))
+                f.write(packEntry(TerrainTile.WaterMask['xy'], int(watermask[0, 0])))
+            else:
                 # Unsigned char size len is 1
                 f.write(packEntry(meta['extensionLength'], TILEPXS))
-                if nbRows != 256:
-                    raise Exception(
-                        'Unexpected number of rows for the watermask: %s' % nbRows
-                    )
-                # From North to South
-                for i in xrange(0, nbRows):
-                    x = self.watermask[i]
-                    if len(x) != 256:
-                        raise Exception(
-                            'Unexpected number of columns for the watermask: %s' % len(x)
-                        )
-                    # From West to East
-                    for y in x:
-                        f.write(packEntry(TerrainTile.WaterMask['xy'], int(y)))
-            else:
-                f.write(packEntry(meta['extensionLength'], 1))
-                if self.watermask[0][0] is None:
-                    self.watermask[0][0] = 0
-                f.write(packEntry(TerrainTile.WaterMask['xy'], int(self.watermask[0][0])))
+                f.write(watermask.tostring())
+
+        if self.metadata is not None:
+            # Extension header ID is 4 for metadata
+            meta = TerrainTile.ExtensionHeader
+            content = json.dumps(self.metadata, separators=(',', ':'))
+            f.write(packEntry(meta['extensionId'], 4))
+            f.write(packEntry(meta['extensionLength'], 4 + len(content)))
+            f.write(packEntry(TerrainTile.Metadata['jsonLength'], len(content)))
+            f.write(content)
 
     def toShapefile(self, filePath, epsg=4326):
         if not filePath.endswith('.shp'):
@@ -24,6 +24,10 @@ class TerrainMetadata(_TileJSON):
             extensions.append('vertexnormals')
         if self.hasWatermask:
             extensions.append('watermask')
+        # Availability of the next levels written in the tiles every N levels
+        self.metadataAvailability = kwargs.get('metadataAvailability')
+        if self.metadataAvailability:
+            extensions.append('metadata')
 
         self.available = [[] for i in range(self.tileMinZoom, self.tileMaxZoom + 1)]
         self.meta = dict(
@@ -42,5 +46,63 @@ class TerrainMetadata(_TileJSON):
             version      = kwargs.get('version', '1.16389.0'),
             extensions   = extensions
         )
+        if self.metadataAvailability:
+            self.meta['metadataAvailability'] = self.metadataAvailability
 
         self._initPyramidMetadata()
+
+    def maxAvailableZoom(self):
+        """
+        With metadataAvailability, the levels after the first level whose
+        tiles hold the metadata extension are not needed in layer.json.
+        """
+        if not self.metadataAvailability:
+            return None
+        n = self.metadataAvailability
+        return ((self.tileMinZoom + n - 1) // n) * n
+
+
+class ChildAvailability:
+
+    """
+    Availability of the descendants of a tile for the metadata extension,
+    derived from the available ranges of a layer.json with all the levels.
+    The rectangles are indexed per ancestor tile at the levels holding the
+    metadata (every nbLevels levels).
+    """
+
+    def __init__(self, available, nbLevels):
+        self.available = available
+        self.nbLevels = nbLevels
+        self._index = {}
+
+    def _levelIndex(self, level):
+        if level not in self._index:
+            index = {}
+            if level < len(self.available):
+                k = level - ((level - 1) // self.nbLevels) * self.nbLevels
+                for rec in self.available[level]:
+                    for px in xrange(rec['startX'] >> k, (rec['endX'] >> k) + 1):
+                        for py in xrange(rec['startY'] >> k, (rec['endY'] >> k) + 1):
+                            index.setdefault((px, py), []).append(rec)
+            self._index[level] = index
+        return self._index[level]
+
+    def forTile(self, x, y, z):
+        """
+        Returns the list of rectangles per level from z + 1 to z + nbLevels
+        clipped to the descendants of the tile (x, y, z).
+        """
+        available = []
+        for k in range(1, self.nbLevels + 1):
+            minX, minY = x << k, y << k
+            maxX, maxY = ((x + 1) << k) - 1, ((y + 1) << k) - 1
+            rectangles = []
+            for rec in self._levelIndex(z + k).get((x, y), []):
+                startX, endX = max(rec['startX'], minX), min(rec['endX'], maxX)
+                startY, endY = max(rec['startY'], minY), min(rec['endY'], maxY)
+                if startX <= endX and startY <= endY:
+                    rectangles.append(dict(
+                        startX=startX, startY=startY, endX=endX, endY=endY))
+            available.append(rectangles)
+        return available
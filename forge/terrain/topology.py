@@ -3,7 +3,7 @@
 import math
 import numpy as np
 from osgeo import ogr
-from forge.lib.llh_ecef import LLH2ECEF
+from forge.lib.llh_ecef import LLH2ECEF, LLH2ECEFArray
 from forge.lib.geometry_processors import computeNormals
 
 
@@ -55,11 +55,7 @@ class TerrainTopology(object):
         vertices = self._assureCounterClockWise(vertices)
         face = []
         for vertex in vertices:
-            lookupKey = ','.join(
-                ["{0:.14f}".format(vertex[0]),
-                 "{0:.14f}".format(vertex[1]),
-                 "{0:.14f}".format(vertex[2])]
-            )
+            lookupKey = self._lookupKey(vertex)
             faceIndex = self._lookupVertexIndex(lookupKey)
             if faceIndex is not None:
                 # Sometimes we can have triangles with zero area
@@ -78,6 +74,45 @@ class TerrainTopology(object):
         # if len(face) == 3:
         self.faces.append(face)
 
+    """
+    The triangles are a (N, 3, 3) array of vertices [lon/lat/height].
+    Same as addVertices for each triangle, the vertices shared within
+    the array are looked up only once.
+    """
+
+    def addTriangles(self, triangles):
+        triangles = self._assureCounterClockWiseTriangles(triangles)
+        vertices, firsts, inverse = np.unique(triangles.reshape(-1, 3), axis=0,
+            return_index=True, return_inverse=True)
+        indices = np.empty(len(vertices), dtype='int')
+        newVertices = []
+        # In order of appearance as with addVertices
+        for i in np.argsort(firsts, kind='mergesort'):
+            vertex = vertices[i].tolist()
+            lookupKey = self._lookupKey(vertex)
+            faceIndex = self._lookupVertexIndex(lookupKey)
+            if faceIndex is None:
+                faceIndex = len(self.vertices)
+                self.vertices.append(vertex)
+                self.verticesLookup[lookupKey] = faceIndex
+                newVertices.append(vertex)
+            indices[i] = faceIndex
+        if newVertices:
+            newVertices = np.array(newVertices, dtype='float')
+            self.cartesianVertices.extend(LLH2ECEFArray(
+                newVertices[:, 0], newVertices[:, 1], newVertices[:, 2]).tolist())
+        self.faces.extend(indices[inverse].reshape(-1, 3).tolist())
+
+    """
+    Builds a terrain topology from chunks of triangles,
+    see ShpToGDALFeatures.getTriangles.
+    """
+
+    def fromTriangles(self, chunks):
+        for triangles in chunks:
+            self.addTriangles(triangles)
+        self.create()
+
     """
     Builds a terrain topology from a list of GDAL features.
     """
@@ -118,6 +153,13 @@ class TerrainTopology(object):
                 self.cartesianVertices, self.faces)
         self.verticesLookup = {}
 
+    def _lookupKey(self, vertex):
+        return ','.join(
+            ["{0:.14f}".format(vertex[0]),
+             "{0:.14f}".format(vertex[1]),
+             "{0:.14f}".format(vertex[2])]
+        )
+
     """
     Check if the vertex has already been discovered
     and return its index (or None if not found)
@@ -161,6 +203,21 @@ class TerrainTopology(object):
         vertices.sort(key=algo, reverse=True)
         return vertices
 
+    """
+    Same as _assureCounterClockWise for a (N, 3, 3) array of triangles
+    """
+
+    def _assureCounterClockWiseTriangles(self, triangles):
+        triangles = np.asarray(triangles, dtype='float')
+        if triangles.ndim != 3 or triangles.shape[1:] != (3, 3):
+            raise TypeError('A ring must have exactly 3 coordinates.')
+        means = triangles.mean(axis=1)
+        angles = (np.arctan2(triangles[:, :, 0] - means[:, 0:1],
+            triangles[:, :, 1] - means[:, 1:2]) + 2 * math.pi) % (2 * math.pi)
+        # Stable descending sort like a reversed sort of a list
+        order = np.argsort(-angles, axis=1, kind='mergesort')
+        return triangles[np.arange(len(triangles))[:, None], order]
+
     @property
     def uVertex(self):
         if isinstance(self.vertices, np.ndarray):
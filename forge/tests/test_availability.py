@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import unittest
+from forge.lib.availability import TileJournal, AvailabilityBitmap, \
+    readJournals, parseKey
+from forge.terrain.metadata import TerrainMetadata
+
+
+class TestAvailability(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = '.tmp/journal-test'
+        self.bounds = [-180.0, -90.0, 180.0, 90.0]
+
+        self.indexFile = '.tmp/test.index'
+
+    def tearDown(self):
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        if os.path.exists(self.indexFile):
+            os.remove(self.indexFile)
+
+    def testBitmap(self):
+        bitmap = AvailabilityBitmap(self.bounds, 1, 2)
+        self.assertEqual(bitmap.ranges[2], (0, 0, 7, 3))
+        for x in (0, 1, 2, 5, 7):
+            bitmap.add(x, 1, 2)
+        # Out of range tiles are ignored
+        bitmap.add(8, 1, 2)
+        bitmap.add(0, 0, 5)
+        self.assertTrue(bitmap.contains(5, 1, 2))
+        self.assertFalse(bitmap.contains(5, 2, 2))
+        self.assertFalse(bitmap.contains(8, 1, 2))
+        self.assertEqual(bitmap.count(2), 5)
+        self.assertEqual(bitmap.rowRanges(2, 1), [[0, 2], [5, 5], [7, 7]])
+        self.assertEqual(bitmap.zoomRanges(2), {1: [[0, 2], [5, 5], [7, 7]]})
+        self.assertEqual(bitmap.zoomRanges(1), {})
+
+    def testJournal(self):
+        journals = [TileJournal(self.directory), TileJournal(self.directory)]
+        # Same process, same file
+        self.assertEqual(journals[0].filePath, journals[1].filePath)
+        journals[0].add(1, 0, 1)
+        journals[1].add(3, 1, 1)
+        for j in journals:
+            j.close()
+        # Interrupted write
+        with open(os.path.join(self.directory, 'other.journal'), 'wb') as f:
+            f.write('\x01\x00')
+        self.assertEqual(sorted(readJournals(self.directory)), [
+            (1, 0, 1), (3, 1, 1)
+        ])
+
+    def testUpdateMetadata(self):
+        bitmap = AvailabilityBitmap(self.bounds, 1, 1)
+        tMeta = TerrainMetadata(minzoom=1, maxzoom=1)
+        other = TerrainMetadata(minzoom=1, maxzoom=1)
+        for x in range(0, 4):
+            bitmap.add(x, 0, 1)
+            if x != 2:
+                bitmap.add(x, 1, 1)
+        other.removeTile(2, 1, 1)
+        bitmap.updateMetadata(tMeta)
+        self.assertEqual(tMeta.toJSON(), other.toJSON())
+
+    def testParseKey(self):
+        self.assertEqual(parseKey('a/b/9/769/319.terrain', 'a/b/'), (769, 319, 9))
+        self.assertEqual(parseKey('a/b/9/769/319.terrain', 'c/'), None)
+        self.assertEqual(parseKey('a/b/layer.json', 'a/b/'), None)
+        self.assertEqual(
+            parseKey('a/2/0/5.png', 'a/', '{z}/{y}/{x}', 'topLeft'), (5, 3, 2))
+
+    def testSaveLoad(self):
+        bounds = [5.86, 45.80, 10.92, 47.86]
+        bitmap = AvailabilityBitmap(bounds, 8, 12)
+        tiles = []
+        for z in range(8, 13):
+            tileMinX, tileMinY, tileMaxX, tileMaxY = bitmap.ranges[z]
+            for x in range(tileMinX, tileMaxX + 1, 3):
+                tiles.append((x, tileMaxY, z))
+                bitmap.add(x, tileMaxY, z)
+        bitmap.save(self.indexFile)
+
+        for mmap in (True, False):
+            index = AvailabilityBitmap.load(self.indexFile, mmap=mmap)
+            self.assertEqual(index.ranges, bitmap.ranges)
+            self.assertEqual((index.minZoom, index.maxZoom), (8, 12))
+            for (x, y, z) in tiles:
+                self.assertTrue(index.contains(x, y, z))
+                self.assertFalse(index.contains(x + 1, y, z))
+            found = []
+            for z in range(8, 13):
+                found += list(index.tiles(z))
+                y = index.ranges[z][3]
+                self.assertEqual(index.rowRanges(z, y), bitmap.zoomRanges(z)[y])
+            self.assertEqual(sorted(found), sorted(tiles))
+
+    def testMergeDiff(self):
+        a = AvailabilityBitmap(self.bounds, 2, 2)
+        b = AvailabilityBitmap(self.bounds, 2, 3)
+        a.add(1, 1, 2)
+        a.add(2, 1, 2)
+        b.add(2, 1, 2)
+        b.add(3, 3, 2)
+        b.add(0, 0, 3)
+        self.assertEqual(list(a.difference(b)), [(1, 1, 2)])
+        self.assertEqual(list(b.difference(a)), [(3, 3, 2), (0, 0, 3)])
+        a.merge(b)
+        self.assertEqual(list(a.tiles(2)), [(1, 1, 2), (2, 1, 2), (3, 3, 2)])
+        # Zoom 3 is not part of a
+        self.assertFalse(a.contains(0, 0, 3))
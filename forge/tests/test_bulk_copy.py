@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+from forge.lib.bulk_copy import CopyLoader, toEWKB, hexEWKB, copyValue, \
+    wkbZ, wkbSRID
+
+
+class _Cursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=None):
+        self.n = params[1]
+
+    def fetchall(self):
+        start = self.connection.nextId
+        self.connection.nextId += self.n
+        return [(i,) for i in range(start, start + self.n)]
+
+    def copy_expert(self, sql, f):
+        self.connection.copies.append((sql, f.read()))
+
+    def close(self):
+        pass
+
+
+class _Connection:
+
+    def __init__(self):
+        self.nextId = 1
+        self.copies = []
+        self.commits = 0
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestBulkCopy(unittest.TestCase):
+
+    def testEWKB(self):
+        # OGR 2.5D point (1, 2, 3), little endian
+        wkb = struct.pack('<BIddd', 1, 1 | wkbZ, 1.0, 2.0, 3.0)
+        ewkb = toEWKB(wkb, 4326)
+        self.assertEqual(struct.unpack('<BII', ewkb[:9]),
+            (1, 1 | wkbZ | wkbSRID, 4326))
+        self.assertEqual(ewkb[9:], wkb[5:])
+        self.assertEqual(toEWKB(ewkb, 4326), ewkb)
+        # ISO point Z, big endian
+        wkb = struct.pack('>BIddd', 0, 1001, 1.0, 2.0, 3.0)
+        self.assertEqual(struct.unpack('>BII', toEWKB(wkb, 21781)[:9]),
+            (0, 1 | wkbZ | wkbSRID, 21781))
+        self.assertEqual(hexEWKB(wkb, 4326)[:18], '00A0000001000010E6')
+
+    def testCopyValue(self):
+        self.assertEqual(copyValue(None), '\\N')
+        self.assertEqual(copyValue(12), '12')
+        self.assertEqual(copyValue('a\tb\nc\\d'), 'a\\tb\\nc\\\\d')
+        self.assertEqual(copyValue(u'\xe9'), '\xc3\xa9')
+
+    def testLoader(self):
+        connection = _Connection()
+        loader = CopyLoader(connection, 'data.t', ['name', 'the_geom'],
+            sequenceName='data.id_t_seq', bufferSize=14)
+        loader.add(dict(name='a', the_geom='0101'))
+        self.assertEqual(len(connection.copies), 0)
+        loader.add(dict(name='b', the_geom='0102'))
+        loader.add(dict(name='c\td'))
+        self.assertEqual(len(connection.copies), 1)
+        loader.commit()
+        self.assertEqual(loader.count, 3)
+        self.assertEqual(connection.commits, 2)
+        self.assertEqual(connection.copies, [
+            ('COPY data.t (id, name, the_geom) FROM STDIN',
+             '1\ta\t0101\n2\tb\t0102\n'),
+            ('COPY data.t (id, name, the_geom) FROM STDIN',
+             '3\tc\\td\t\\N\n')
+        ])
+        # Nothing left to flush
+        loader.commit()
+        self.assertEqual(len(connection.copies), 2)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import unittest
+import SocketServer
+import BaseHTTPServer
+from forge.lib.existence import ExistenceChecker, RateLimiter, \
+    missingFromKeys, resourceExists, tileAddress
+
+
+class TilesHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    existing = set()
+    connections = []
+
+    def do_HEAD(self):
+        if self.path in self.existing:
+            self.send_response(200)
+        else:
+            self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connections.append(self.client_address)
+
+    def log_message(self, *args):
+        pass
+
+
+class TilesServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+
+class TestExistence(unittest.TestCase):
+
+    def setUp(self):
+        TilesHandler.existing = set(['/tiles/1/1/0.png', '/tiles/1/0/2.png'])
+        TilesHandler.connections = []
+        self.server = TilesServer(('127.0.0.1', 0), TilesHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.host = '//127.0.0.1:%s/' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testTileAddress(self):
+        self.assertEqual(tileAddress((2, 0, 1), 'bottomLeft'), '1/0/2')
+        self.assertEqual(tileAddress((2, 0, 1), 'topLeft'), '1/1/2')
+
+    def testResourceExists(self):
+        self.assertTrue(resourceExists('http:%stiles/1/1/0.png' % self.host))
+        self.assertFalse(resourceExists('http:%stiles/1/1/1.png' % self.host))
+
+    def testMissingTiles(self):
+        checker = ExistenceChecker(
+            [self.host], 'tiles/', 'png', 'bottomLeft', threads=2)
+        tiles = [(x, y, 1) for x in range(0, 4) for y in range(0, 2)]
+        missing = sorted(checker.missingTiles(tiles, chunks=1))
+        self.assertEqual(len(missing), 6)
+        self.assertTrue((0, 1, 1) not in missing)
+        self.assertTrue((2, 0, 1) not in missing)
+        self.assertEqual(checker.counter, 8)
+        # Connections are kept alive: at most one per thread
+        self.assertTrue(len(TilesHandler.connections) <= 2)
+
+    def testMissingFromKeys(self):
+        keys = ['tiles/1/1/0.png', 'tiles/1/0/2.png', 'other/1/0/0.png']
+        tiles = [(x, y, 1) for x in range(0, 4) for y in range(0, 2)]
+        missing = list(missingFromKeys(keys, 'tiles/', 'png', 'bottomLeft', tiles))
+        self.assertEqual(len(missing), 6)
+        self.assertTrue((0, 1, 1) not in missing)
+
+    def testRateLimiter(self):
+        limiter = RateLimiter(rate=50)
+        t0 = time.time()
+        for i in range(0, 75):
+            limiter.acquire()
+        # The first 50 are the burst
+        self.assertTrue(time.time() - t0 >= 0.4)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import ConfigParser
+import numpy as np
+from forge.lib.global_geodetic import GlobalGeodetic
+from forge.lib.tiles import isInside, TerrainTiles, tileOptions
+from forge.lib import grids
+from forge.lib.grids import ZoomGrid, tilesCount, mortonKeys, hilbertKeys
+
+
+class TestGrids(unittest.TestCase):
+
+    def setUp(self):
+        self.bounds = [5.86725126512748, 45.8026860136571,
+                       10.9209100671547, 47.8661652478939]
+        self.geodetic = GlobalGeodetic(True)
+
+    def testZoomGrid(self):
+        for zoom in (0, 5, 9, 12):
+            zoomGrid = ZoomGrid(self.bounds, zoom)
+            tileMinX, tileMinY = self.geodetic.LonLatToTile(
+                self.bounds[0], self.bounds[1], zoom)
+            tileMaxX, tileMaxY = self.geodetic.LonLatToTile(
+                self.bounds[2], self.bounds[3], zoom)
+            self.assertEqual(
+                (zoomGrid.tileMinX, zoomGrid.tileMinY,
+                 zoomGrid.tileMaxX, zoomGrid.tileMaxY),
+                (tileMinX, tileMinY, tileMaxX, tileMaxY))
+            tiles = list(zoomGrid.tiles())
+            self.assertEqual(len(tiles), zoomGrid.count())
+            self.assertEqual(tiles[0], (
+                self.geodetic.TileBounds(tileMinX, tileMinY, zoom),
+                (tileMinX, tileMinY, zoom)))
+            # Column by column
+            if len(tiles) > 1:
+                self.assertEqual(tiles[1][1], (tileMinX, tileMinY + 1, zoom)
+                    if tileMaxY > tileMinY else (tileMinX + 1, tileMinY, zoom))
+
+    def testTileKey(self):
+        keys = set()
+        for zoom in (0, 9, 17, 25):
+            tileMaxX = self.geodetic.GetNumberOfXTilesAtZoom(zoom) - 1
+            tileMaxY = self.geodetic.GetNumberOfYTilesAtZoom(zoom) - 1
+            for x, y in ((0, 0), (tileMaxX, 0), (0, tileMaxY), (tileMaxX, tileMaxY)):
+                key = self.geodetic.TileKey(x, y, zoom)
+                # Fits in a postgres bigint
+                self.assertTrue(0 <= key < 2 ** 63)
+                self.assertEqual(
+                    (key >> 56, (key >> 28) & (2 ** 28 - 1), key & (2 ** 28 - 1)),
+                    (zoom, y, x))
+                keys.add(key)
+        self.assertEqual(len(keys), 14)
+
+    def testFullOnly(self):
+        for zoom in (8, 10, 11):
+            zoomGrid = ZoomGrid(self.bounds, zoom, fullonly=1)
+            tiles = list(zoomGrid.tiles())
+            expected = 0
+            for x in range(zoomGrid.tileMinX, zoomGrid.tileMaxX + 1):
+                for y in range(zoomGrid.tileMinY, zoomGrid.tileMaxY + 1):
+                    if isInside(self.geodetic.TileBounds(x, y, zoom), self.bounds):
+                        expected += 1
+            self.assertEqual(len(tiles), expected)
+            for tileBounds, xyz in tiles:
+                self.assertTrue(isInside(tileBounds, self.bounds))
+        self.assertEqual(tilesCount(self.bounds, [8, 10, 11], 1), sum(
+            [ZoomGrid(self.bounds, z, 1).count() for z in (8, 10, 11)]))
+
+    def testOrderings(self):
+        zoomGrid = ZoomGrid(self.bounds, 10)
+        column = sorted(zoomGrid.tiles())
+        for ordering in ('morton', 'hilbert'):
+            self.assertEqual(sorted(zoomGrid.tiles(ordering)), column)
+        self.assertRaises(ValueError, list, zoomGrid.tiles('spiral'))
+
+    def testOrderingsByBlocks(self):
+        # Sorting by blocks gives the order of the whole zoom level
+        zoomGrid = ZoomGrid(self.bounds, 10, fullonly=1)
+        xs = [x for x in zoomGrid.xs.tolist() for y in zoomGrid.ys.tolist()]
+        ys = [y for x in zoomGrid.xs.tolist() for y in zoomGrid.ys.tolist()]
+        relX = np.array(xs) - zoomGrid.tileMinX
+        relY = np.array(ys) - zoomGrid.tileMinY
+        side = max(zoomGrid.tileMaxX - zoomGrid.tileMinX,
+            zoomGrid.tileMaxY - zoomGrid.tileMinY) + 1
+        expected = {
+            'morton': mortonKeys(relX, relY),
+            'hilbert': hilbertKeys(relX, relY, int(np.ceil(np.log2(side))))
+        }
+        blockBits = grids.BLOCK_BITS
+        try:
+            grids.BLOCK_BITS = 2
+            for ordering, keys in expected.iteritems():
+                order = np.argsort(keys, kind='mergesort').tolist()
+                self.assertEqual(
+                    [xyz[:2] for b, xyz in zoomGrid.tiles(ordering)],
+                    [(xs[i], ys[i]) for i in order])
+        finally:
+            grids.BLOCK_BITS = blockBits
+
+    def testCurves(self):
+        self.assertEqual(list(mortonKeys([0, 1, 0, 1, 2], [0, 0, 1, 1, 0])),
+            [0, 1, 2, 3, 4])
+        # Consecutive positions along the hilbert curve are neighbours
+        xs = [x for x in range(0, 8) for y in range(0, 8)]
+        ys = [y for x in range(0, 8) for y in range(0, 8)]
+        keys = list(hilbertKeys(xs, ys, 3))
+        self.assertEqual(sorted(keys), range(0, 64))
+        path = sorted(zip(keys, xs, ys))
+        for i in range(1, len(path)):
+            self.assertEqual(abs(path[i][1] - path[i - 1][1]) +
+                abs(path[i][2] - path[i - 1][2]), 1)
+
+    def _tmsConfig(self, ordering=None):
+        tmsConfig = ConfigParser.RawConfigParser()
+        for section in ('General', 'Extent', 'Zooms', 'Extensions'):
+            tmsConfig.add_section(section)
+        for option, value in zip(('minLon', 'minLat', 'maxLon', 'maxLat'),
+                self.bounds):
+            tmsConfig.set('Extent', option, str(value))
+        tmsConfig.set('Extent', 'fullonly', '0')
+        tmsConfig.set('General', 'bucketpath', 'terrain/')
+        tmsConfig.set('Zooms', 'tileMinZ', '10')
+        tmsConfig.set('Zooms', 'tileMaxZ', '11')
+        tmsConfig.set('Extensions', 'lighting', '0')
+        tmsConfig.set('Extensions', 'watermask', '0')
+        if ordering is not None:
+            tmsConfig.set('General', 'tilesorder', ordering)
+        return tmsConfig
+
+    def testMetadataOptions(self):
+        tmsConfig = self._tmsConfig()
+        tmsConfig.set('General', 'metadataavailability', '2')
+        self.assertEqual(tileOptions(tmsConfig).metadataAvailability, 2)
+        # The journal is only written while creating the tiles
+        tmsConfig.set('General', 'metadatamode', 'journal')
+        self.assertRaises(ValueError, tileOptions, tmsConfig)
+        tmsConfig.set('General', 'metadataavailability', '0')
+        self.assertEqual(tileOptions(tmsConfig).metadataAvailability, 0)
+
+    def testTerrainTilesOrder(self):
+        def chunksArea(tiles, size):
+            # Sum of the areas (in tiles) of the boxes around the chunks
+            # of each zoom level
+            area = 0
+            for z in set([t[1][2] for t in tiles]):
+                zoomTiles = [t[1] for t in tiles if t[1][2] == z]
+                for i in range(0, len(zoomTiles), size):
+                    xs = [t[0] for t in zoomTiles[i:i + size]]
+                    ys = [t[1] for t in zoomTiles[i:i + size]]
+                    area += (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+            return area
+
+        column = [t[:2] for t in TerrainTiles(None, self._tmsConfig(), 0)]
+        self.assertEqual(TerrainTiles(None, self._tmsConfig(), 0).ordering, 'column')
+        for ordering in ('morton', 'hilbert'):
+            tiles = [t[:2] for t in TerrainTiles(None, self._tmsConfig(ordering), 0)]
+            self.assertEqual(sorted(tiles), sorted(column))
+            # Zoom levels are still processed one after the other
+            self.assertEqual([t[1][2] for t in tiles], [t[1][2] for t in column])
+            self.assertTrue(chunksArea(tiles, 16) < chunksArea(column, 16))
+        self.assertRaises(ValueError, TerrainTiles, None,
+            self._tmsConfig('spiral'), 0)
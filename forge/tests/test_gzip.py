@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import unittest
+import cStringIO
+from forge.lib.helpers import gzipCompress, gzipFileObject
+
+
+class TestGzip(unittest.TestCase):
+
+    def setUp(self):
+        self.data = ''.join([chr(i % 251) * (i % 7) for i in xrange(20000)])
+
+    def decompress(self, compressed):
+        return gzip.GzipFile(fileobj=cStringIO.StringIO(compressed)).read()
+
+    def testDeterministic(self):
+        for level in (1, 5, 9):
+            first = gzipCompress(self.data, compresslevel=level)
+            self.assertEqual(first, gzipCompress(self.data, compresslevel=level))
+            self.assertEqual(self.decompress(first), self.data)
+
+    def testHeader(self):
+        # Fixed mtime and OS, only the extra flags depend on the level
+        headers = {}
+        for level in (1, 5, 9):
+            headers[level] = gzipCompress(self.data, compresslevel=level)[:10]
+            self.assertEqual(headers[level][4:8], '\x00\x00\x00\x00')
+            self.assertEqual(headers[level][9], '\xff')
+        self.assertEqual(headers[1][8], '\x04')
+        self.assertEqual(headers[5][8], '\x00')
+        self.assertEqual(headers[9][8], '\x02')
+
+    def testFileObject(self):
+        for level in (1, 5, 9):
+            f = cStringIO.StringIO()
+            f.write(self.data)
+            compressed = gzipFileObject(f, compresslevel=level, chunkSize=1000)
+            self.assertEqual(compressed.read(),
+                gzipCompress(self.data, compresslevel=level))
+
+    def testEmpty(self):
+        compressed = gzipFileObject(cStringIO.StringIO(''))
+        self.assertEqual(self.decompress(compressed.read()), '')
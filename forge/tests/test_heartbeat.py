@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from forge.lib.heartbeat import DurationEstimator, VisibilityHeartbeat, \
+    MIN_VISIBILITY_TIMEOUT, MAX_VISIBILITY_TIMEOUT
+
+
+class _Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def testEstimatorTimeout(self):
+        estimator = DurationEstimator(initial=10.0, safety=2.0)
+        self.assertEqual(estimator.timeout(5), 100)
+        # First sample replaces the initial guess
+        estimator.add(1.0)
+        self.assertEqual(estimator.average, 1.0)
+        self.assertEqual(estimator.timeout(20), 40)
+        # Bounded by SQS limits
+        self.assertEqual(estimator.timeout(1), MIN_VISIBILITY_TIMEOUT)
+        estimator.add(100000.0)
+        self.assertEqual(estimator.timeout(50), MAX_VISIBILITY_TIMEOUT)
+
+    def testEstimatorMovingAverage(self):
+        estimator = DurationEstimator(alpha=0.5)
+        estimator.add(2.0)
+        estimator.add(4.0)
+        self.assertEqual(estimator.average, 3.0)
+        self.assertEqual(estimator.samples, 2)
+
+    def testHeartbeatExtends(self):
+        timeouts = []
+        clock = _Clock()
+        estimator = DurationEstimator(initial=10.0, safety=1.0, minTimeout=30)
+        heartbeat = VisibilityHeartbeat(timeouts.append, estimator, 4,
+            timeout=40, clock=clock)
+        for i in range(0, 4):
+            clock.now += 12
+            self.assertFalse(heartbeat.leaseLost())
+            self.assertEqual(heartbeat.beat(), max(10 * (4 - i), 30))
+            heartbeat.progress()
+        self.assertEqual(timeouts, [40, 30, 30, 30])
+        self.assertEqual(heartbeat.beats, 4)
+        self.assertEqual(heartbeat.remaining(), 0)
+        # Lease extended from the last beat
+        clock.now += 29
+        self.assertFalse(heartbeat.leaseLost())
+
+    def testHeartbeatSlowTile(self):
+        timeouts = []
+        clock = _Clock()
+        estimator = DurationEstimator(initial=1.0, safety=2.0, minTimeout=30)
+        heartbeat = VisibilityHeartbeat(timeouts.append, estimator, 2,
+            stallTimeout=600, clock=clock)
+        # A tile much slower than the previous ones isn't a stall
+        for i in range(0, 10):
+            clock.now += 25
+            self.assertEqual(heartbeat.beat(), 30)
+        self.assertFalse(heartbeat.leaseLost())
+        self.assertEqual(len(timeouts), 10)
+
+    def testHeartbeatStalled(self):
+        timeouts = []
+        clock = _Clock()
+        estimator = DurationEstimator(initial=1.0, safety=1.0, minTimeout=30)
+        heartbeat = VisibilityHeartbeat(timeouts.append, estimator, 10,
+            stallTimeout=600, clock=clock)
+        clock.now += 601
+        # No progress at all, the heartbeat gives up and the lease expires
+        self.assertTrue(heartbeat.stalled())
+        self.assertEqual(heartbeat.beat(), None)
+        self.assertTrue(heartbeat.leaseLost())
+        self.assertEqual(len(timeouts), 0)
+
+    def testHeartbeatExtendFails(self):
+        clock = _Clock()
+
+        def extend(timeout):
+            raise IOError('Queue not reachable')
+        estimator = DurationEstimator(initial=1.0, safety=1.0, minTimeout=30)
+        heartbeat = VisibilityHeartbeat(extend, estimator, 10, clock=clock)
+        clock.now += 20
+        self.assertEqual(heartbeat.beat(), 30)
+        self.assertEqual(heartbeat.beats, 0)
+        clock.now += 10
+        self.assertTrue(heartbeat.leaseLost())
+
+    def testHeartbeatThread(self):
+        timeouts = []
+        estimator = DurationEstimator(initial=1.0, safety=1.0, minTimeout=30)
+        heartbeat = VisibilityHeartbeat(timeouts.append, estimator, 2)
+        heartbeat.start()
+        heartbeat.progress()
+        heartbeat.stop()
+        self.assertFalse(heartbeat.is_alive())
+        self.assertEqual(heartbeat.remaining(), 1)
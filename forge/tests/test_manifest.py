@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+import cStringIO
+from forge.lib.manifest import TileManifest, contentHash, isUnchanged
+
+
+class _Key:
+
+    def __init__(self, metadata, size):
+        self.metadata = metadata
+        self.size = size
+
+    def get_metadata(self, name):
+        return self.metadata.get(name)
+
+
+class _Bucket:
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.heads = 0
+
+    def get_key(self, name):
+        self.heads += 1
+        return self.keys.get(name)
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.filePath = '.tmp/manifest.db'
+        self.manifest = TileManifest(self.filePath)
+        self.hash = contentHash('terrain')
+
+    def tearDown(self):
+        self.manifest.close()
+        if os.path.exists(self.filePath):
+            os.remove(self.filePath)
+
+    def testContentHash(self):
+        self.assertEqual(self.hash, contentHash(cStringIO.StringIO('terrain')))
+        self.assertNotEqual(self.hash, contentHash('terrain2'))
+
+    def testManifestHash(self):
+        bucket = _Bucket({})
+        self.manifest.put('tiles/9/1/2.terrain', self.hash, 7)
+        self.assertTrue(isUnchanged(bucket, 'tiles/9/1/2.terrain', self.hash,
+            self.manifest))
+        self.assertFalse(isUnchanged(bucket, 'tiles/9/1/2.terrain',
+            contentHash('other'), self.manifest))
+        # Answered by the manifest only
+        self.assertEqual(bucket.heads, 0)
+
+    def testHeadFallback(self):
+        bucket = _Bucket({
+            'tiles/9/1/2.terrain': _Key({'iwi_hash': self.hash}, 7),
+            'tiles/9/1/3.terrain': _Key({}, 7)
+        })
+        # Without manifest
+        self.assertTrue(isUnchanged(bucket, 'tiles/9/1/2.terrain', self.hash))
+        self.assertFalse(isUnchanged(bucket, 'tiles/9/1/2.terrain',
+            contentHash('other')))
+        # Missing key or key written without hash
+        self.assertFalse(isUnchanged(bucket, 'tiles/9/1/4.terrain', self.hash))
+        self.assertFalse(isUnchanged(bucket, 'tiles/9/1/3.terrain', self.hash,
+            self.manifest))
+        self.assertEqual(self.manifest.get('tiles/9/1/3.terrain'), None)
+        # Not in the manifest yet: HEAD request, then recorded
+        heads = bucket.heads
+        self.assertTrue(isUnchanged(bucket, 'tiles/9/1/2.terrain', self.hash,
+            self.manifest))
+        self.assertEqual(bucket.heads, heads + 1)
+        self.assertTrue(isUnchanged(bucket, 'tiles/9/1/2.terrain', self.hash,
+            self.manifest))
+        self.assertEqual(bucket.heads, heads + 1)
+
+    def testPersistence(self):
+        manifest = TileManifest(self.filePath, autoCommit=100)
+        manifest.put('tiles/9/1/2.terrain', self.hash, 7)
+        manifest.put('tiles/9/1/2.terrain', contentHash('other'), 5)
+        manifest.close()
+
+        manifest = TileManifest(self.filePath)
+        self.assertEqual(len(manifest), 1)
+        self.assertEqual(manifest.get('tiles/9/1/2.terrain'), contentHash('other'))
+        self.assertEqual(manifest.get('tiles/9/1/3.terrain'), None)
+        manifest.close()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import unittest
+from forge.lib.poolmanager import PoolManager
+
+
+logger = logging.getLogger(__name__)
+
+
+def countUnit(unit):
+    if unit < 0:
+        raise Exception('Failing unit %s' % unit)
+    return unit
+
+
+class TestPoolManager(unittest.TestCase):
+
+    def testStore(self):
+        pm = PoolManager(logger=logger, numProcs=2, store=True)
+        pm.process([1, 2, 0, 3], countUnit, 1)
+        self.assertEqual(sorted(pm.results), [1, 2, 3])
+
+    def testFailingUnit(self):
+        pm = PoolManager(logger=logger, numProcs=2, store=True)
+        self.assertRaises(Exception, pm.process, [1, -1, 2], countUnit, 1)
+        self.assertEqual(
+            len([p for p in pm._pool._pool if p.is_alive()]), 0)
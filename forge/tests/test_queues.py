@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import threading
+import unittest
+from forge.lib.queues import SQLQueue, getQueue
+
+
+class TestSQLQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dbFile = '.tmp/queue.db'
+        self.url = 'sqlite:///%s' % self.dbFile
+        self.q = SQLQueue('tiles', self.url, pollInterval=0.1)
+        self.q.create(3600)
+
+    def tearDown(self):
+        self.q.close()
+        if os.path.exists(self.dbFile):
+            os.remove(self.dbFile)
+
+    def testCreate(self):
+        self.assertTrue(self.q.exists())
+        self.assertEqual(self.q.count(), 0)
+        other = getQueue(('other', 'sql', self.url))
+        self.assertFalse(other.exists())
+        other.close()
+
+    def testLeaseAndAck(self):
+        self.q.writeBatch(['1,2,3', '4,5,6'])
+        self.assertEqual(self.q.count(), 2)
+
+        m1 = self.q.read(60, waitTime=0)
+        self.assertEqual(m1.get_body(), '1,2,3')
+        self.assertEqual(m1.attempts, 0)
+
+        # A second consumer does not get the leased message
+        consumer = SQLQueue('tiles', self.url)
+        m2 = consumer.read(60, waitTime=0)
+        self.assertEqual(m2.get_body(), '4,5,6')
+        self.assertTrue(consumer.read(60, waitTime=0) is None)
+
+        attrs = self.q.attributes()
+        self.assertEqual(attrs['ApproximateNumberOfMessages'], 0)
+        self.assertEqual(attrs['ApproximateNumberOfMessagesNotVisible'], 2)
+
+        self.q.delete(m1)
+        consumer.delete(m2)
+        self.assertEqual(self.q.count(), 0)
+        self.assertEqual(self.q.stats()['read'], 1)
+        self.assertEqual(self.q.stats()['deleted'], 1)
+        consumer.close()
+
+    def testVisibilityExpires(self):
+        self.q.write('1,2,3', attempts=2)
+        m = self.q.read(1, waitTime=0)
+        self.assertEqual(m.attempts, 2)
+        self.assertTrue(self.q.read(1, waitTime=0) is None)
+
+        # Lease expired: another consumer gets it
+        time.sleep(1.2)
+        m2 = self.q.read(60, waitTime=2)
+        self.assertEqual(m2.get_body(), '1,2,3')
+
+        # The stale receipt can't remove the message anymore
+        self.q.delete(m)
+        self.assertEqual(self.q.count(), 1)
+        self.q.delete(m2)
+        self.assertEqual(self.q.count(), 0)
+
+    def testChangeVisibility(self):
+        self.q.write('1,2,3')
+        m = self.q.read(60, waitTime=0)
+        self.q.changeVisibility(m, 0)
+        m2 = self.q.read(60, waitTime=0)
+        self.assertEqual(m2.get_body(), '1,2,3')
+        self.assertEqual(self.q.stats()['extended'], 1)
+
+    def testChangeVisibilityFromThread(self):
+        # As done by the heartbeat of the consumer
+        self.q.write('1,2,3')
+        m = self.q.read(1, waitTime=0)
+        errors = []
+
+        def extend():
+            try:
+                for i in range(0, 20):
+                    self.q.changeVisibility(m, 60)
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=extend)
+        thread.start()
+        for i in range(0, 20):
+            self.assertEqual(self.q.count(), 1)
+        thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.q.stats()['extended'], 20)
+        # Lease extended beyond the initial second
+        time.sleep(1.2)
+        self.assertTrue(self.q.read(60, waitTime=0) is None)
+
+    def testDestroy(self):
+        self.q.write('1,2,3')
+        self.q.destroy()
+        self.assertFalse(self.q.exists())
+        self.assertEqual(self.q.count(), 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from pyproj import Proj, transform
+from forge.terrain import TerrainTile
+from forge.lib.helpers import getTransformer, transformCoordinates, degreesToMeters
+from forge.lib.reprojection import Reprojector, reprojectTriangles, \
+    parseHeightGrids
+
+
+class TestReprojection(unittest.TestCase):
+
+    def setUp(self):
+        self.triangle = [(2600000.0, 1200000.0, 500.0), (2600100.0, 1200000.0, 510.0),
+            (2600000.0, 1200100.0, 520.0), (2600000.0, 1200000.0, 500.0)]
+        self.reprojector = Reprojector('lv95', 'wgs84-ed', 'ln02', 'ln02')
+
+    def testReprojectTriangles(self):
+        triangles = [self.triangle[:3], self.triangle[1:]]
+        results = reprojectTriangles(triangles, self.reprojector)
+        self.assertEqual(results.shape, (2, 3, 3))
+        lv95 = Proj('+init=epsg:2056')
+        wgs84 = Proj('+proj=longlat +datum=WGS84 +no_defs')
+        for triangle, result in zip(triangles, results):
+            for point, reprojected in zip(triangle, result):
+                lon, lat = transform(lv95, wgs84, point[0], point[1])
+                self.assertAlmostEqual(reprojected[0], lon, places=9)
+                self.assertAlmostEqual(reprojected[1], lat, places=9)
+                self.assertEqual(reprojected[2], point[2])
+
+    def testFrames(self):
+        self.assertRaises(ValueError, Reprojector, 'lv95', 'utm', 'ln02', 'ln02')
+        self.assertRaises(ValueError, Reprojector, 'lv95', 'wgs84', 'ln02', 'lhn95')
+        self.assertEqual(parseHeightGrids('ln02=/grids/ln02.gtx, lhn95=/grids/a.gtx'),
+            {'ln02': '/grids/ln02.gtx', 'lhn95': '/grids/a.gtx'})
+        self.assertEqual(parseHeightGrids(''), {})
+
+    def testTransformers(self):
+        self.assertTrue(getTransformer(4326, 21781) is getTransformer(4326, 21781))
+        wgs84 = Proj(proj='latlong', datum='WGS84')
+        lv03 = Proj(init='epsg:21781')
+        lons, lats = [7.5, 8.3, 9.1], [46.2, 46.85, 47.3]
+        easts, norths, alts = transformCoordinates(lons, lats, None, 4326, 21781)
+        self.assertEqual(alts, None)
+        for i in range(0, len(lons)):
+            east, north = transform(wgs84, lv03, lons[i], lats[i])
+            self.assertAlmostEqual(easts[i], east, places=6)
+            self.assertAlmostEqual(norths[i], north, places=6)
+        p1 = transform(wgs84, lv03, 8.3, 46.85)
+        p2 = transform(wgs84, lv03, 8.3 + 0.01, 46.85)
+        self.assertAlmostEqual(degreesToMeters(0.01), p2[0] - p1[0], places=6)
+
+    def testTileVertices(self):
+        ter = TerrainTile()
+        ter.fromFile('forge/data/quantized-mesh/raron.flat.1.terrain',
+            7.80938, 7.81773, 46.30261, 46.30799)
+        coords = ter.getVerticesCoordinates()
+        projected = ter.getVerticesCoordinates(epsg=21781)
+        self.assertEqual(len(projected), len(coords))
+        wgs84 = Proj(proj='latlong', datum='WGS84')
+        lv03 = Proj(init='epsg:21781')
+        for coord, point in zip(coords, projected)[:50]:
+            self.assertEqual(list(transform(wgs84, lv03, *coord)), point)
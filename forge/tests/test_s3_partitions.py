@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import multiprocessing
+from forge.lib import s3_partitions
+from forge.lib.s3_partitions import gridPrefixes, discoverPartitions, \
+    partitionsOutsideGrid, processKeys
+
+
+class _Entry:
+
+    def __init__(self, name):
+        self.name = name
+
+
+class _Bucket:
+
+    # Same listing semantics as S3 (common prefixes with a delimiter)
+    def __init__(self, names):
+        self.names = sorted(names)
+
+    def list(self, prefix='', delimiter=''):
+        seen = set()
+        for name in self.names:
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                name = prefix + rest[:rest.index(delimiter) + 1]
+                if name in seen:
+                    continue
+                seen.add(name)
+            yield _Entry(name)
+
+
+class _Logger:
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+
+class TestS3Partitions(unittest.TestCase):
+
+    def setUp(self):
+        # Tiles of zoom 0 and 1 within the extent (x 0 to 1 at zoom 1)
+        self.bounds = (-180.0, -90.0, -0.1, 89.9)
+        self.zooms = [0, 1]
+        self.bucket = _Bucket([
+            'tiles/layer.json',
+            'tiles/0/0/0.terrain',
+            'tiles/1/0/0.terrain', 'tiles/1/1/0.terrain', 'tiles/1/1/1.terrain',
+            # Left from an older extent
+            'tiles/1/3/1.terrain',
+            'tiles/2/5/3.terrain',
+            'tiles/tmp/a.terrain'
+        ])
+
+    def keys(self, partitions):
+        names = []
+        for prefix, shallow in partitions:
+            names += [k.name for k in self.bucket.list(prefix=prefix,
+                delimiter='/' if shallow else '') if not k.name.endswith('/')]
+        return sorted(names)
+
+    def testDiscoverPartitions(self):
+        partitions = discoverPartitions(self.bucket, '', 'tiles/')
+        self.assertEqual(partitions, [
+            ('tiles/', True), ('tiles/tmp/', False),
+            ('tiles/0/0/', False),
+            ('tiles/1/0/', False), ('tiles/1/1/', False), ('tiles/1/3/', False),
+            ('tiles/2/5/', False)
+        ])
+        # Every key is in exactly one partition
+        self.assertEqual(self.keys(partitions), self.bucket.names)
+
+        grid = gridPrefixes('', 'tiles/', self.bounds, self.zooms)
+        self.assertEqual(grid, ['tiles/0/0/', 'tiles/1/0/', 'tiles/1/1/'])
+        self.assertEqual(partitionsOutsideGrid(partitions, grid),
+            ['tiles/tmp/', 'tiles/1/3/', 'tiles/2/5/'])
+
+    def testDiscoverZoomPartitions(self):
+        partitions = discoverPartitions(self.bucket, '1/', 'tiles/')
+        self.assertEqual([p for p, shallow in partitions],
+            ['tiles/1/0/', 'tiles/1/1/', 'tiles/1/3/'])
+        self.assertEqual(self.keys(partitions), [
+            'tiles/1/0/0.terrain', 'tiles/1/1/0.terrain', 'tiles/1/1/1.terrain',
+            'tiles/1/3/1.terrain'])
+        # Deeper prefixes are listed as a whole
+        self.assertEqual(discoverPartitions(self.bucket, '1/3/', 'tiles/'),
+            [('tiles/1/3/', False)])
+        self.assertEqual(discoverPartitions(self.bucket, '1', 'tiles/'),
+            [('tiles/1', False)])
+
+    def testProcessKeys(self):
+        # Partitions ending anywhere, the progress is reported each time
+        # a multiple of the step is crossed by the shared counter
+        sizes = (1500, 2700, 3300)
+        names = []
+        for x, size in enumerate(sizes):
+            names += ['tiles/1/%s/%s.terrain' % (x, y) for y in range(0, size)]
+        bucket = _Bucket(names)
+        counter = multiprocessing.Value('l', 0)
+        logger = _Logger()
+        deleted = []
+
+        def deleteBatch(b, batch):
+            deleted.append(len(batch))
+
+        step = s3_partitions.PROGRESS_STEP
+        try:
+            s3_partitions.PROGRESS_STEP = 2000
+            for x, size in enumerate(sizes):
+                count, rows = processKeys(bucket, 'tiles/1/%s/' % x, False,
+                    'delete', time.time(), counter, deleteBatch, logger)
+                self.assertEqual(count, size)
+                self.assertEqual(rows, [])
+        finally:
+            s3_partitions.PROGRESS_STEP = step
+        self.assertEqual(counter.value, sum(sizes))
+        self.assertEqual(deleted, [1000, 500, 1000, 1000, 700, 1000, 1000, 1000, 300])
+        self.assertEqual([m.split(' ')[1] for m in logger.messages],
+            ['2500', '4200', '6200'])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from forge.lib.scheduling import fidRanges, UnitTiming, WorkersReport
+
+
+class TestScheduling(unittest.TestCase):
+
+    def testFidRanges(self):
+        self.assertEqual(fidRanges(10, 0), [(0, 10)])
+        self.assertEqual(fidRanges(10, 10), [(0, 10)])
+        self.assertEqual(fidRanges(0, 4), [(0, 0)])
+        self.assertEqual(fidRanges(10, 4), [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(fidRanges(9, 4), [(0, 3), (3, 6), (6, 9)])
+        ranges = fidRanges(1000001, 250000)
+        self.assertEqual(len(ranges), 5)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], 1000001)
+        for i in range(1, len(ranges)):
+            self.assertEqual(ranges[i][0], ranges[i - 1][1])
+        sizes = [end - start for start, end in ranges]
+        self.assertTrue(max(sizes) - min(sizes) <= 1)
+
+    def testWorkersReport(self):
+        timings = [
+            UnitTiming(1, 'a.shp[0:10]', 10, 0.0, 6.0),
+            UnitTiming(2, 'b.shp', 4, 0.0, 3.0),
+            UnitTiming(2, 'c.shp', 3, 3.0, 7.0),
+            UnitTiming(1, 'a.shp[10:15]', 5, 6.0, 8.0)
+        ]
+        report = WorkersReport(timings, 0.0, 10.0)
+        self.assertEqual(report.busyTime(1), 8.0)
+        self.assertEqual(report.utilization(2), 0.7)
+        self.assertEqual([t.name for t in report.criticalPath],
+            ['a.shp[0:10]', 'a.shp[10:15]'])
+        self.assertEqual(report.longestUnit.name, 'a.shp[0:10]')
+        lines = report.lines()
+        self.assertEqual(lines[0], '[1] 2 units, busy 8.0s (80%)')
+        self.assertEqual(lines[2], 'Average utilization 75% over 10.0s')
+        self.assertEqual(WorkersReport([], 0.0, 1.0).lines(), [])
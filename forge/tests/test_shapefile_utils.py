@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+import numpy as np
+from forge.lib.shapefile_utils import trianglesFromWKBs, trianglesToWKBs, \
+    TRIANGLE_WKB_SIZE
+
+
+class TestShapefileUtils(unittest.TestCase):
+
+    def testTriangles(self):
+        triangles = np.array([
+            [[7.1, 46.2, 500.0], [7.2, 46.2, 510.0], [7.1, 46.3, 520.0]],
+            [[7.2, 46.2, 510.0], [7.2, 46.3, 530.0], [7.1, 46.3, 520.0]]
+        ])
+        wkbs = trianglesToWKBs(triangles)
+        self.assertEqual([len(wkb) for wkb in wkbs], [TRIANGLE_WKB_SIZE] * 2)
+        self.assertEqual(struct.unpack_from('<ddd', wkbs[1], 13 + 72),
+            tuple(triangles[1][0]))
+        self.assertTrue((trianglesFromWKBs(wkbs) == triangles).all())
+
+        # Big endian ISO polygon Z
+        ring = list(triangles[0].ravel()) + list(triangles[0][0])
+        wkb = struct.pack('>BIII12d', 0, 1003, 1, 4, *ring)
+        self.assertTrue((trianglesFromWKBs(wkbs + [wkb])[2] == triangles[0]).all())
+        self.assertEqual(trianglesFromWKBs([]).shape, (0, 3, 3))
+
+        # Not a triangle
+        square = struct.pack('<BIII', 1, 3 | 0x80000000, 1, 5) + '\0' * 120
+        self.assertRaises(TypeError, trianglesFromWKBs, [square])
+        wkb = struct.pack('<BIII12d', 1, 3, 1, 4, *ring)
+        self.assertRaises(TypeError, trianglesFromWKBs, [wkb])
@@ -114,6 +114,30 @@ class TestTerrainTile(unittest.TestCase):
             for j in range(0, len(ter.watermask[i])):
                 self.assertEqual(ter.watermask[i][j], ter2.watermask[i][j])
 
+    def testUniformWatermask(self):
+        z = 9
+        x = 769
+        y = 319
+        geodetic = GlobalGeodetic(True)
+
+        ter = TerrainTile()
+        [minx, miny, maxx, maxy] = geodetic.TileBounds(x, y, z)
+        ter.fromFile('forge/data/quantized-mesh/%s_%s_%s_watermask.terrain' % (z, x, y),
+            minx, miny, maxx, maxy, hasWatermask=True)
+        size = len(ter.toStringIO().getvalue())
+        # All water, written as a single pixel
+        ter.watermask = [[255] * 256 for i in range(0, 256)]
+        self.assertEqual(len(ter.toStringIO().getvalue()), size - 256 * 256 + 1)
+        ter.toFile(self.tmpfile)
+
+        ter2 = TerrainTile()
+        ter2.fromFile(self.tmpfile, minx, miny, maxx, maxy, hasWatermask=True)
+        self.assertEqual(ter2.watermask.shape, (1, 1))
+        self.assertEqual(ter2.watermask[0][0], 255)
+
+        ter.watermask = [[0] * 255]
+        self.assertRaises(Exception, ter.toStringIO)
+
     def testExtensionsReader(self):
         z = 10
         x = 1563
@@ -157,3 +181,28 @@ class TestTerrainTile(unittest.TestCase):
                 # oct encoding and decoding
                 # Thus we only check the sign
                 self.assertEqual(sign(ter.vLight[i][j]), sign(ter2.vLight[i][j]))
+
+    def testMetadataExtension(self):
+        z = 10
+        x = 1563
+        y = 590
+        geodetic = GlobalGeodetic(True)
+
+        ter = TerrainTile()
+        [minx, miny, maxx, maxy] = geodetic.TileBounds(x, y, z)
+        ter.fromFile(
+            'forge/data/quantized-mesh/%s_%s_%s_light_watermask.terrain' % (z, x, y),
+            minx, miny, maxx, maxy, hasLighting=True, hasWatermask=True
+        )
+        ter.metadata = {'available': [
+            [{'startX': 3126, 'startY': 1180, 'endX': 3127, 'endY': 1181}], []
+        ]}
+        self.assertEqual(ter.getContentType(), 'application/vnd.quantized-mesh;'
+            'extensions=octvertexnormals-watermask-metadata')
+        ter.toFile(self.tmpfile)
+
+        ter2 = TerrainTile()
+        ter2.fromFile(self.tmpfile, minx, miny, maxx, maxy,
+            hasLighting=True, hasWatermask=True, hasMetadata=True)
+        self.assertEqual(ter2.metadata, ter.metadata)
+        self.assertEqual(ter2.watermask, ter.watermask)
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
+import json
+import random
 import unittest
-from forge.terrain.metadata import TerrainMetadata
+import cStringIO
+from forge.terrain.metadata import TerrainMetadata, ChildAvailability
 
 # 0 means that there is no tile
 # 1 means that there is a tile
@@ -135,3 +138,100 @@ class TestTerrainMetadata(unittest.TestCase):
         self.assertTrue(tMeta.meta['available'][2][3]['endX'] == 7)
         self.assertTrue(tMeta.meta['available'][2][3]['startY'] == 3)
         self.assertTrue(tMeta.meta['available'][2][3]['endY'] == 3)
+
+    def testTerrainMetadataEmptyRow(self):
+        minZoom = 1
+        maxZoom = 1
+        tMeta = TerrainMetadata(minzoom=minZoom, maxzoom=maxZoom)
+
+        # Remove the whole first row, twice the same tile and a tile
+        # outside of the extent
+        for x in range(0, 4):
+            tMeta.removeTile(x, 0, 1)
+        tMeta.removeTile(0, 0, 1)
+        tMeta.removeTile(10, 1, 1)
+        self.assertEqual(tMeta.holes[1][0], [0, 1, 2, 3])
+        self.assertTrue(1 not in tMeta.holes[1])
+
+        tMeta.toJSON()
+        self.assertEqual(len(tMeta.meta['available'][1]), 1)
+        self.assertEqual(tMeta.meta['available'][1][0], {
+            'startX': 0, 'endX': 3, 'startY': 1, 'endY': 1
+        })
+
+    def testTerrainMetadataRowRanges(self):
+        tMeta = TerrainMetadata(minzoom=2, maxzoom=2)
+        self.assertEqual(tMeta.rowRanges(2, 0), [[0, 7]])
+        tMeta.removeTile(5, 0, 2)
+        tMeta.removeTile(0, 0, 2)
+        tMeta.removeTile(4, 0, 2)
+        self.assertEqual(tMeta.rowRanges(2, 0), [[1, 3], [6, 7]])
+
+    def testTerrainMetadataSetAvailableRanges(self):
+        tMeta = TerrainMetadata(minzoom=2, maxzoom=2)
+        tMeta.setAvailableRanges(2, {0: [[6, 9], [1, 3]], 2: [[0, 7]]})
+        self.assertEqual(tMeta.rowRanges(2, 0), [[1, 3], [6, 7]])
+        self.assertEqual(tMeta.rowRanges(2, 1), [])
+        self.assertEqual(tMeta.rowRanges(2, 2), [[0, 7]])
+        self.assertEqual(tMeta.rowRanges(2, 3), [])
+
+        # Same result as removing the tiles one by one
+        other = TerrainMetadata(minzoom=2, maxzoom=2)
+        for x in (0, 4, 5):
+            other.removeTile(x, 0, 2)
+        for y in (1, 3):
+            for x in xrange(0, 8):
+                other.removeTile(x, y, 2)
+        self.assertEqual(tMeta.toJSON(), other.toJSON())
+
+    def testTerrainMetadataAddHoles(self):
+        tMeta = TerrainMetadata(minzoom=2, maxzoom=2)
+        tMeta.removeTile(1, 0, 2)
+        tMeta.addHoles(2, {0: [5, 0], 1: [7, 3, 9]})
+        self.assertEqual(tMeta.rowRanges(2, 0), [[2, 4], [6, 7]])
+        self.assertEqual(tMeta.rowRanges(2, 1), [[0, 2], [4, 6]])
+        self.assertEqual(tMeta.rowRanges(2, 2), [[0, 7]])
+
+    def testTerrainMetadataWriteJSON(self):
+        random.seed(1)
+        for (minZoom, maxZoom, useGlobalTiles) in (
+                (1, 3, False), (3, 5, True), (9, 10, True)):
+            tMeta = TerrainMetadata(
+                minzoom=minZoom, maxzoom=maxZoom, useGlobalTiles=useGlobalTiles,
+                bounds=[5.86, 45.80, 10.92, 47.86])
+            for z in range(minZoom, maxZoom + 1):
+                tileMinX, tileMaxX = tMeta.metadata[z]['x']
+                tileMinY, tileMaxY = tMeta.metadata[z]['y']
+                for i in range(0, 20):
+                    tMeta.removeTile(random.randint(tileMinX, tileMaxX),
+                        random.randint(tileMinY, tileMaxY), z)
+            f = cStringIO.StringIO()
+            tMeta.writeJSON(f)
+            self.assertEqual(f.getvalue(), tMeta.toJSON())
+
+    def testTerrainMetadataAvailability(self):
+        tMeta = TerrainMetadata(minzoom=1, maxzoom=4, metadataAvailability=2)
+        self.assertEqual(tMeta.meta['metadataAvailability'], 2)
+        self.assertTrue('metadata' in tMeta.meta['extensions'])
+        self.assertEqual(tMeta.maxAvailableZoom(), 2)
+        tMeta.removeTile(0, 0, 3)
+        f = cStringIO.StringIO()
+        tMeta.writeJSON(f, maxZoom=tMeta.maxAvailableZoom())
+        available = json.loads(f.getvalue())['available']
+        self.assertEqual(len(available), 5)
+        self.assertEqual(len(available[2]), 1)
+        self.assertEqual(available[3], [])
+        self.assertEqual(available[4], [])
+
+        # Full availability -> per tile availability of the next 2 levels
+        f = cStringIO.StringIO()
+        tMeta.writeJSON(f)
+        children = ChildAvailability(json.loads(f.getvalue())['available'], 2)
+        self.assertEqual(children.forTile(0, 0, 2), [
+            [{'startX': 1, 'startY': 0, 'endX': 1, 'endY': 0},
+             {'startX': 0, 'startY': 1, 'endX': 1, 'endY': 1}],
+            [{'startX': 0, 'startY': 0, 'endX': 3, 'endY': 3}]
+        ])
+        self.assertEqual(children.forTile(7, 3, 2)[1], [
+            {'startX': 28, 'startY': 12, 'endX': 31, 'endY': 15}
+        ])
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import numpy as np
 from forge.terrain.topology import TerrainTopology
 
 # Must be defined counter clock wise order
@@ -64,3 +65,20 @@ class TestTopology(unittest.TestCase):
         self.assertTrue(topology.maxLon == 3.2)
         self.assertTrue(topology.maxLat == 3.1)
         self.assertTrue(topology.maxHeight == 4.5)
+
+    def testTopologyTriangles(self):
+        topology = TerrainTopology()
+        topology.addVertices(list(vertices_1))
+        topology.addVertices(list(vertices_2))
+        topology.create()
+
+        # Same topology from a chunk of triangles (in any order)
+        chunks = [np.array([vertices_1[::-1]]),
+            np.array([vertices_2[1:] + vertices_2[:1]])]
+        topology2 = TerrainTopology()
+        topology2.fromTriangles(chunks)
+
+        self.assertTrue((topology2.vertices == topology.vertices).all())
+        self.assertTrue((topology2.faces == topology.faces).all())
+        self.assertTrue(np.allclose(
+            topology2.cartesianVertices, topology.cartesianVertices))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from forge.lib.watermask import WatermaskZoom, WatermaskStore, rasterBand, \
+    LAND, WATER, MIXED, MASK_SIZE
+
+
+class TestWatermask(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = WatermaskStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testStore(self):
+        zoomMasks = WatermaskZoom.create(self.store.filePath(9), 9,
+            (10, 20, 14, 22), [(11, 20), (12, 20)], [(14, 22), (10, 21)])
+        self.assertEqual(list(zoomMasks.mixedTiles()), [(10, 21), (14, 22)])
+        mask = np.arange(MASK_SIZE, dtype=np.uint32).astype(np.uint8)
+        zoomMasks.setMask(14, 22, mask)
+        zoomMasks.setMask(10, 21, '\xff' * MASK_SIZE)
+        zoomMasks.flush()
+        del zoomMasks
+        self.assertTrue(os.path.exists(os.path.join(self.directory, '9.watermask')))
+
+        zoomMasks = self.store.zoom(9)
+        self.assertEqual(zoomMasks.tileClass(11, 20), WATER)
+        self.assertEqual(zoomMasks.tileClass(10, 21), MIXED)
+        self.assertEqual(zoomMasks.tileClass(13, 21), LAND)
+        # Outside of the extent
+        self.assertEqual(zoomMasks.tileClass(100, 21), LAND)
+        self.assertEqual(list(self.store.mask(11, 20, 9)), [255])
+        self.assertEqual(list(self.store.mask(13, 22, 9)), [0])
+        self.assertTrue((self.store.mask(14, 22, 9) == mask).all())
+        self.assertTrue((self.store.mask(10, 21, 9) == 255).all())
+        self.assertRaises(KeyError, zoomMasks.setMask, 13, 22, mask)
+
+    def testRasterBand(self):
+        def raster(byteOrder, width, height, pixels):
+            wkb = struct.pack(byteOrder + 'BHHddddddiHH',
+                1 if byteOrder == '<' else 0, 0, 1, 1.0, -1.0, 0.0, 0.0, 0.0, 0.0,
+                4326, width, height)
+            # 8BUI band with a nodata value
+            return wkb + struct.pack('BB', 0x44, 0) + pixels
+
+        self.assertEqual(list(rasterBand(raster('<', 1, 1, '\xff'))), [255])
+        pixels = np.arange(MASK_SIZE, dtype=np.uint32).astype(np.uint8)
+        mask = rasterBand(raster('>', 256, 256, pixels.tostring()))
+        self.assertEqual(len(mask), MASK_SIZE)
+        self.assertTrue((mask == pixels).all())
+        wkb = raster('<', 1, 1, '\x00')
+        # 16BUI band
+        wkb = wkb[:61] + '\x06' + wkb[62:]
+        self.assertRaises(ValueError, rasterBand, wkb)